@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Buffer submitted items and hand them to an async process function in batches.
+
+    A batch is flushed when it reaches max_size items or max_wait seconds
+    after its first item arrived, whichever comes first. submit() only
+    returns once the batch containing the item has been processed, and
+    raises if processing failed, so callers can ack exactly what was
+    committed.
+    """
+
+    def __init__(self, process, max_size, max_wait):
+        self.process = process
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._running = set()
+        self._batches = 0
+        self._items = 0
+        self._size_flushes = 0
+        self._timeout_flushes = 0
+        self._failed_batches = 0
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._size_flushes += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush_on_timeout)
+        return await future
+
+    def _flush_on_timeout(self):
+        self._timeout_flushes += 1
+        self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        self._batches += 1
+        self._items += len(batch)
+        try:
+            result = await self.process([item for item, _ in batch])
+        except Exception as e:
+            self._failed_batches += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Flush whatever is buffered and wait for in-flight batches to finish."""
+        self._flush()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "max_size": self.max_size,
+            "max_wait_seconds": self.max_wait,
+            "pending": len(self._pending),
+            "in_flight_batches": len(self._running),
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / max(self._batches, 1), 2),
+            "size_flushes": self._size_flushes,
+            "timeout_flushes": self._timeout_flushes,
+            "failed_batches": self._failed_batches,
+        }
@@ -0,0 +1,72 @@
+"""Micro-benchmark the per-message cost of decoding and encoding pgvector values.
+
+Every rating reads a user and a recipe vector and writes both back, so one
+"message" below is two decodes and two encodes:
+
+    python benchmarks/bench_vector_codec.py --dimensions 100 --messages 20000
+"""
+import argparse
+import ast
+import time
+
+import numpy as np
+from pgvector.utils import Vector
+
+
+def literal_eval_codec(text_vectors, binary_vectors, arrays):
+    # The original handler: vector text through the Python AST, written back as lists
+    for text in text_vectors:
+        np.array(ast.literal_eval(text))
+    for array in arrays:
+        str(array.tolist())
+
+
+def pgvector_text_codec(text_vectors, binary_vectors, arrays):
+    for text in text_vectors:
+        Vector._from_db(text)
+    for array in arrays:
+        Vector._to_db(array)
+
+
+def pgvector_binary_codec(text_vectors, binary_vectors, arrays):
+    for data in binary_vectors:
+        Vector._from_db_binary(data)
+    for array in arrays:
+        Vector._to_db_binary(array)
+
+
+CODECS = {
+    "literal_eval": literal_eval_codec,
+    "pgvector_text": pgvector_text_codec,
+    "pgvector_binary": pgvector_binary_codec,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    messages = []
+    for _ in range(args.messages):
+        arrays = [rng.normal(0, 0.1, args.dimensions).astype(np.float32) for _ in range(2)]
+        messages.append((
+            [Vector._to_db(array) for array in arrays],
+            [Vector._to_db_binary(array) for array in arrays],
+            arrays,
+        ))
+
+    print(f"{'codec':<18}{'us/message':>12}{'messages/s':>14}")
+    for name, codec in CODECS.items():
+        start = time.perf_counter()
+        for text_vectors, binary_vectors, arrays in messages:
+            codec(text_vectors, binary_vectors, arrays)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18}{elapsed / args.messages * 1e6:>12.1f}{args.messages / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
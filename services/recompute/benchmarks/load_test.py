@@ -0,0 +1,158 @@
+"""Load-test the /pubsub/push endpoint with concurrent synthetic rating messages.
+
+Apply the web migrations to a local Postgres first, seed it, start the service
+against it and drive it with many in-flight pushes:
+
+    DATABASE_URL=postgresql://localhost/recipes_load python benchmarks/load_test.py --seed-only
+    DATABASE_URL=postgresql://localhost/recipes_load uvicorn main:app --port 8080
+    python benchmarks/load_test.py --messages 5000 --concurrency 64 --label async --output load.json
+
+Runs are appended to --output under their label, so running the harness
+before and after a change prints them side by side.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+
+import httpx
+import numpy as np
+
+
+def seed_database(database_url, n_users, n_recipes, n_factors):
+    """Replace the vectors in a scratch database with random factors and one active model version."""
+    import psycopg
+
+    with psycopg.connect(database_url) as conn:
+        conn.execute("TRUNCATE user_vectors, recipe_vectors, user_recommendations, svd_metadata")
+        conn.execute(
+            """
+            INSERT INTO users (id, name, email, password)
+            SELECT g, 'Load test ' || g, 'load-test-' || g || '@example.com', 'x'
+            FROM generate_series(1, %s) g
+            ON CONFLICT DO NOTHING
+            """,
+            (n_users,),
+        )
+        conn.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+        for table, key, count in (("user_vectors", "user_id", n_users), ("recipe_vectors", "recipe_id", n_recipes)):
+            conn.execute(
+                f"""
+                INSERT INTO {table} ({key}, vector, bias)
+                SELECT g, (
+                    SELECT array_agg(random() * 0.2 - 0.1)::vector FROM generate_series(1, %s) WHERE g > 0
+                ), random() * 0.2 - 0.1
+                FROM generate_series(1, %s) g
+                """,
+                (n_factors, count),
+            )
+        conn.execute(
+            """
+            INSERT INTO svd_metadata (completion_time, global_mean, status, is_active, activated_at)
+            VALUES (NOW(), 4.2, 'active', true, NOW())
+            """
+        )
+    print(f"Seeded {n_users} users and {n_recipes} recipes with {n_factors} factors")
+
+
+def push_body(user_id, recipe_id, rating):
+    event = json.dumps({"user_id": user_id, "recipe_id": recipe_id, "rating": rating})
+    return {
+        "message": {"data": base64.b64encode(event.encode("utf-8")).decode("ascii"), "attributes": {}},
+        "subscription": "projects/load-test/subscriptions/ratings",
+    }
+
+
+async def run_load(url, n_messages, concurrency, n_users, n_recipes, seed):
+    rng = random.Random(seed)
+    bodies = [
+        push_body(rng.randint(1, n_users), rng.randint(1, n_recipes), float(rng.randint(1, 5)))
+        for _ in range(n_messages)
+    ]
+    latencies = np.zeros(n_messages)
+    failures = 0
+    next_message = 0
+
+    async def worker(client):
+        nonlocal failures, next_message
+        while next_message < n_messages:
+            index = next_message
+            next_message += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/pubsub/push", json=bodies[index])
+                failures += response.status_code >= 300
+            except httpx.HTTPError:
+                failures += 1
+            latencies[index] = time.perf_counter() - start
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = latencies * 1000
+    return {
+        "messages": n_messages,
+        "concurrency": concurrency,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(n_messages / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(latencies_ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+    }
+
+
+def print_runs(runs):
+    print(f"{'label':<16}{'msgs':>8}{'conc':>6}{'fail':>6}{'msgs/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for run in runs:
+        print(f"{run['label']:<16}{run['messages']:>8}{run['concurrency']:>6}{run['failures']:>6}"
+              f"{run['messages_per_second']:>10.1f}{run['p50_ms']:>10.2f}{run['p99_ms']:>10.2f}{run['max_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--factors", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--seed-database", action="store_true", help="Seed --database-url before the run")
+    parser.add_argument("--seed-only", action="store_true", help="Seed --database-url and exit")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="JSON file that runs are appended to")
+    args = parser.parse_args()
+
+    if args.seed_database or args.seed_only:
+        if not args.database_url:
+            parser.error("--database-url or DATABASE_URL is required to seed the database")
+        seed_database(args.database_url, args.users, args.recipes, args.factors)
+        if args.seed_only:
+            return
+
+    result = asyncio.run(run_load(args.url, args.messages, args.concurrency, args.users, args.recipes, args.seed))
+    result["label"] = args.label
+
+    runs = []
+    if args.output and os.path.exists(args.output):
+        with open(args.output) as f:
+            runs = json.load(f)["runs"]
+    runs.append(result)
+    print_runs(runs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
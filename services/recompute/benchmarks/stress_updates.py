@@ -0,0 +1,130 @@
+"""Stress concurrent online updates of one hot recipe and check that none is lost.
+
+Several processes (standing in for Cloud Run instances), each with its own
+pool and factor cache, apply ratings of the same recipe from distinct users
+concurrently through process_ratings. Every committed rating bumps the
+recipe's revision by exactly one, from the revision it read, so a lost
+update shows up as a revision delta smaller than the number of ratings:
+
+    DATABASE_URL=postgresql://localhost/recipes_load python benchmarks/stress_updates.py --processes 4 --tasks 16
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import seed_database  # noqa: E402
+
+HOT_RECIPE_ID = 1
+
+
+def run_worker(worker, args, queue):
+    import main  # noqa: E402  (reads DATABASE_URL at import)
+
+    async def run():
+        await main.db_pool.open()
+        try:
+            user_ids = range(worker * args.tasks * args.ratings_per_task + 1, (worker + 1) * args.tasks * args.ratings_per_task + 1)
+            users = iter(user_ids)
+            failures = 0
+
+            async def task():
+                nonlocal failures
+                for _ in range(args.ratings_per_task):
+                    event = main.RatingEvent(user_id=next(users), recipe_id=HOT_RECIPE_ID, rating=5.0)
+                    try:
+                        await main.process_ratings([event])
+                    except Exception:
+                        failures += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(task() for _ in range(args.tasks)))
+            return {
+                "worker": worker,
+                "seconds": time.perf_counter() - start,
+                "failures": failures,
+                "updates": dict(main.update_stats),
+            }
+        finally:
+            await main.db_pool.close()
+
+    queue.put(asyncio.run(run()))
+
+
+def fetch_revisions(database_url):
+    import psycopg
+
+    with psycopg.connect(database_url) as conn:
+        recipe_revision = conn.execute(
+            "SELECT revision FROM recipe_vectors WHERE recipe_id = %s", (HOT_RECIPE_ID,)
+        ).fetchone()[0]
+        user_revisions = conn.execute("SELECT COALESCE(SUM(revision), 0) FROM user_vectors").fetchone()[0]
+    return recipe_revision, user_revisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--tasks", type=int, default=16, help="Concurrent tasks per process")
+    parser.add_argument("--ratings-per-task", type=int, default=10)
+    parser.add_argument("--factors", type=int, default=100)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    n_ratings = args.processes * args.tasks * args.ratings_per_task
+    seed_database(args.database_url, n_ratings, 1, args.factors)
+    recipe_before, users_before = fetch_revisions(args.database_url)
+
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=run_worker, args=(worker, args, queue)) for worker in range(args.processes)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    recipe_after, users_after = fetch_revisions(args.database_url)
+    failures = sum(result["failures"] for result in results)
+    committed = n_ratings - failures
+    totals = {key: sum(result["updates"][key] for result in results) for key in results[0]["updates"]}
+    summary = {
+        "ratings": n_ratings,
+        "committed": committed,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "ratings_per_second": round(n_ratings / elapsed, 1),
+        "recipe_revision_delta": recipe_after - recipe_before,
+        "user_revision_delta": users_after - users_before,
+        "conflict_rate": round(totals["write_conflicts"] / max(totals["batches"], 1), 3),
+        **totals,
+    }
+    lost = committed - summary["recipe_revision_delta"]
+    ok = lost == 0 and summary["user_revision_delta"] == committed
+
+    print(json.dumps(summary, indent=2))
+    if not ok:
+        print(f"FAIL: {lost} recipe updates lost, {committed - summary['user_revision_delta']} user updates lost")
+    else:
+        print(f"OK: all {committed} committed ratings reached the hot recipe")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "summary": summary, "workers": results}, f, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FactorCache:
+    """Bounded LRU cache of hot user and recipe factors for one model version.
+
+    Entries are (float32 vector, bias, revision) keyed by ID, one LRU per kind
+    ("user", "recipe"); the revision is what compare-and-swap writes check.
+    The active model (version, global_mean, completion_time) is cached too
+    and only re-read from Postgres every model_check_interval seconds; when
+    it changes every entry is dropped.
+    Entries also expire after ttl seconds, which bounds how long updates made
+    by other processes can be missed. Callers must only put values that have
+    been committed.
+    """
+
+    KINDS = ("user", "recipe")
+
+    def __init__(self, max_entries, ttl, model_check_interval):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_check_interval = model_check_interval
+        self._entries = {kind: OrderedDict() for kind in self.KINDS}
+        self._model = None
+        self._model_checked_at = 0.0
+        self._counters = {
+            kind: {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0} for kind in self.KINDS
+        }
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def active_model(self):
+        """The cached (version, global_mean) if it was checked recently enough, else None."""
+        if self._model is None or time.monotonic() - self._model_checked_at > self.model_check_interval:
+            return None
+        return self._model[:2]
+
+    def set_active_model(self, version, global_mean, completion_time):
+        model = (version, global_mean, completion_time)
+        if self._model is not None and self._model != model:
+            self.invalidate()
+        self._model = model
+        self._model_checked_at = time.monotonic()
+
+    def invalidate(self):
+        for entries in self._entries.values():
+            entries.clear()
+        self._model = None
+        self._invalidations += 1
+
+    def get_many(self, kind, ids):
+        """Return ([(id, vector, bias, revision)] for cached IDs, [IDs to fetch])."""
+        entries = self._entries[kind]
+        counters = self._counters[kind]
+        now = time.monotonic()
+        hits, misses = [], []
+        for entity_id in ids:
+            entry = entries.get(entity_id)
+            if entry is not None and now - entry[3] > self.ttl:
+                del entries[entity_id]
+                counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                misses.append(entity_id)
+                continue
+            entries.move_to_end(entity_id)
+            hits.append((entity_id, entry[0], entry[1], entry[2]))
+        counters["hits"] += len(hits)
+        counters["misses"] += len(misses)
+        return hits, misses
+
+    def put_many(self, kind, ids, vectors, biases, revisions):
+        if not self.enabled:
+            return
+        entries = self._entries[kind]
+        now = time.monotonic()
+        for entity_id, vector, bias, revision in zip(ids, vectors, biases, revisions):
+            entries[entity_id] = (np.asarray(vector, dtype=np.float32), float(bias), int(revision), now)
+            entries.move_to_end(entity_id)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self._counters[kind]["evictions"] += 1
+
+    def discard(self, kind, ids):
+        entries = self._entries[kind]
+        for entity_id in ids:
+            entries.pop(entity_id, None)
+
+    def stats(self):
+        stats = {
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "model_version": self._model[0] if self._model else None,
+            "invalidations": self._invalidations,
+        }
+        for kind in self.KINDS:
+            counters = self._counters[kind]
+            lookups = counters["hits"] + counters["misses"]
+            stats[kind] = {
+                "entries": len(self._entries[kind]),
+                **counters,
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+            }
+        return stats
@@ -0,0 +1,65 @@
+import numpy as np
+from pymongo import AsyncMongoClient
+
+
+def fold_in(counterpart_vectors, counterpart_biases, ratings, global_mean, reg):
+    """Solve a vector and bias for a new entity against fixed counterpart factors.
+
+    Minimizes sum((r - mu - b_other - b - x . q)^2) + reg * n * (|x|^2 + b^2)
+    over the n known ratings, the same per-rating weighting the ALS trainer
+    uses, by solving the (n_factors + 1)-dimensional normal equations.
+    Returns (float32 vector, bias).
+    """
+    n_ratings, n_factors = counterpart_vectors.shape
+    design = np.empty((n_ratings, n_factors + 1), dtype=np.float64)
+    design[:, :n_factors] = counterpart_vectors
+    design[:, n_factors] = 1.0
+    target = np.asarray(ratings, dtype=np.float64) - global_mean - counterpart_biases
+
+    gram = design.T @ design
+    gram[np.diag_indices_from(gram)] += reg * n_ratings
+    solution = np.linalg.solve(gram, design.T @ target)
+    return solution[:n_factors].astype(np.float32), float(solution[n_factors])
+
+
+def parse_internal_id(raw_id):
+    """Integer ID of an internal user or recipe; external (ext_) and malformed IDs give None."""
+    text = str(raw_id).strip()
+    return int(text) if text.isdigit() and int(text) > 0 else None
+
+
+class RatingHistory:
+    """Reads stored ratings of new users and recipes from the MongoDB reviews collection."""
+
+    def __init__(self, uri, database_name, collection_name, limit):
+        self.client = AsyncMongoClient(uri)
+        self.collection = self.client[database_name][collection_name]
+        self.limit = limit
+
+    async def _ratings_by(self, key_field, other_field, ids):
+        ratings = {entity_id: {} for entity_id in ids}
+        if not ids:
+            return ratings
+        cursor = self.collection.find(
+            {key_field: {"$in": [str(entity_id) for entity_id in ids]}, other_field: {"$exists": True}},
+            {key_field: 1, other_field: 1, "rating": 1, "_id": 0},
+        ).limit(self.limit * len(ids))
+        async for document in cursor:
+            entity_id = parse_internal_id(document.get(key_field))
+            other_id = parse_internal_id(document.get(other_field))
+            rating = document.get("rating")
+            if entity_id in ratings and other_id is not None and isinstance(rating, (int, float)):
+                if len(ratings[entity_id]) < self.limit:
+                    ratings[entity_id][other_id] = float(rating)
+        return ratings
+
+    async def for_users(self, user_ids):
+        """{user_id: {recipe_id: rating}} for the given users."""
+        return await self._ratings_by("user_id", "recipe_id", user_ids)
+
+    async def for_recipes(self, recipe_ids):
+        """{recipe_id: {user_id: rating}} for the given recipes (internal users only)."""
+        return await self._ratings_by("recipe_id", "user_id", recipe_ids)
+
+    async def close(self):
+        await self.client.close()
@@ -1,15 +1,24 @@
 import base64
 import json
 import traceback
-from fastapi import FastAPI, HTTPException, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Response
 from dotenv import load_dotenv
 import logging
 from pydantic import BaseModel, ValidationError
 from typing import Optional
-import psycopg2
 import os
+import asyncio
+import random
 import numpy as np
-import ast
+import psycopg
+from pgvector.psycopg import register_vector_async
+from psycopg_pool import AsyncConnectionPool
+from batching import MicroBatcher
+from factor_cache import FactorCache
+from fold_in import RatingHistory, fold_in
+from model_artifact import ArtifactFormatError, ModelArtifact, artifact_path
+from recommend_index import RecommendationIndex
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,7 +33,188 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
 
-app = FastAPI()
+# Writes are compare-and-swap on each row's revision. A batch that loses a race
+# (or races with the activation of a new model version) is retried up to
+# UPDATE_RETRIES times with jittered backoff, then once more with its rows
+# locked by SELECT ... FOR UPDATE
+UPDATE_RETRIES = int(os.getenv("UPDATE_RETRIES", "3"))
+UPDATE_RETRY_BACKOFF_MS = float(os.getenv("UPDATE_RETRY_BACKOFF_MS", "5"))
+STALE_MODEL_VERSION = -1
+WRITE_CONFLICT = -2
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Ratings are buffered for up to RATING_BATCH_MAX_WAIT_MS or RATING_BATCH_MAX_SIZE
+# messages and applied together; a max size of 1 applies every rating on its own
+RATING_BATCH_MAX_SIZE = int(os.getenv("RATING_BATCH_MAX_SIZE", "1"))
+RATING_BATCH_MAX_WAIT_MS = float(os.getenv("RATING_BATCH_MAX_WAIT_MS", "50"))
+
+# Hot factors are cached per process (FACTOR_CACHE_SIZE entries per table, 0
+# disables it); the active model version is re-checked every
+# FACTOR_CACHE_MODEL_CHECK_SECONDS and entries expire after FACTOR_CACHE_TTL_SECONDS
+FACTOR_CACHE_SIZE = int(os.getenv("FACTOR_CACHE_SIZE", "10000"))
+FACTOR_CACHE_TTL_SECONDS = float(os.getenv("FACTOR_CACHE_TTL_SECONDS", "60"))
+FACTOR_CACHE_MODEL_CHECK_SECONDS = float(os.getenv("FACTOR_CACHE_MODEL_CHECK_SECONDS", "5"))
+
+# Users and recipes without vectors are folded in against the fixed factors of
+# their counterparts, using their stored ratings when MongoDB is configured
+FOLD_IN_ENABLED = os.getenv("FOLD_IN_ENABLED", "true").lower() == "true"
+FOLD_IN_REG = float(os.getenv("FOLD_IN_REG", "0.1"))
+FOLD_IN_MAX_RATINGS = int(os.getenv("FOLD_IN_MAX_RATINGS", "200"))
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE")
+MONGODB_REVIEWS_COLLECTION = os.getenv("MONGODB_REVIEWS_COLLECTION")
+
+# /recommend answers from an in-memory index of the active version's recipe
+# factors. It is rebuilt when /reload is called after training and whenever the
+# active version is seen to change (checked every RECOMMEND_RELOAD_CHECK_SECONDS);
+# online updates of recipe factors are picked up by the next rebuild
+RECOMMEND_ENABLED = os.getenv("RECOMMEND_ENABLED", "true").lower() == "true"
+RECOMMEND_RELOAD_CHECK_SECONDS = float(os.getenv("RECOMMEND_RELOAD_CHECK_SECONDS", "60"))
+RECOMMEND_MAX_K = int(os.getenv("RECOMMEND_MAX_K", "200"))
+RECOMMEND_EXACT_BELOW = int(os.getenv("RECOMMEND_EXACT_BELOW", "20000"))
+RECOMMEND_HNSW_M = int(os.getenv("RECOMMEND_HNSW_M", "32"))
+RECOMMEND_EF_CONSTRUCTION = int(os.getenv("RECOMMEND_EF_CONSTRUCTION", "128"))
+RECOMMEND_EF_SEARCH = int(os.getenv("RECOMMEND_EF_SEARCH", "256"))
+# Directory holding the model artifacts written by training (e.g. the bucket
+# mounted as a volume); the recipe factors of a version are memory-mapped from
+# its artifact when there is one, which skips reading them from Postgres but
+# also the online updates made since training
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR")
+
+# SGD parameters
+LEARNING_RATE = 0.01
+REGULARIZATION = 0.02
+
+# Statements used per batch of ratings; execute(..., prepare=True) prepares
+# each one once per pooled connection
+ACTIVE_MODEL_QUERY = "SELECT id, global_mean, completion_time FROM svd_metadata WHERE is_active"
+FETCH_USER_VECTORS_QUERY = "SELECT user_id, vector, bias, revision FROM user_vectors WHERE user_id = ANY(%s)"
+# Recipe vectors may be stored as halfvec (svd_metadata.vector_format); casting
+# to vector reads every format as float32, and vector writes into a halfvec
+# column go through pgvector's assignment cast
+FETCH_RECIPE_VECTORS_QUERY = (
+    "SELECT recipe_id, vector::vector, bias, revision FROM recipe_vectors WHERE recipe_id = ANY(%s)"
+)
+LOAD_RECIPE_VECTORS_QUERY = "SELECT recipe_id, vector::vector, bias FROM recipe_vectors ORDER BY recipe_id"
+# Users are always locked before recipes, each in ID order, so locking batches cannot deadlock
+LOCK_USER_VECTORS_QUERY = FETCH_USER_VECTORS_QUERY + " ORDER BY user_id FOR UPDATE"
+LOCK_RECIPE_VECTORS_QUERY = FETCH_RECIPE_VECTORS_QUERY + " ORDER BY recipe_id FOR UPDATE"
+# Writes every touched user and recipe in one statement, only while the
+# version the updates were computed from is still active, and only for rows
+# whose revision is still the one that was read
+WRITE_VECTORS_QUERY = """
+    WITH active AS (
+        SELECT 1 FROM svd_metadata WHERE id = %(model_version)s AND is_active
+    ),
+    user_updates AS (
+        UPDATE user_vectors uv
+        SET vector = v.vector, bias = v.bias, revision = v.revision + 1, updated_at = NOW()
+        FROM unnest(
+            %(user_ids)s::integer[], %(user_vectors)b::vector[], %(user_biases)s::real[], %(user_revisions)s::bigint[]
+        ) AS v(user_id, vector, bias, revision)
+        WHERE uv.user_id = v.user_id AND uv.revision = v.revision AND EXISTS (SELECT 1 FROM active)
+        RETURNING 1
+    ),
+    recipe_updates AS (
+        UPDATE recipe_vectors rv
+        SET vector = v.vector, bias = v.bias, revision = v.revision + 1, updated_at = NOW()
+        FROM unnest(
+            %(recipe_ids)s::integer[], %(recipe_vectors)b::vector[], %(recipe_biases)s::real[], %(recipe_revisions)s::bigint[]
+        ) AS v(recipe_id, vector, bias, revision)
+        WHERE rv.recipe_id = v.recipe_id AND rv.revision = v.revision AND EXISTS (SELECT 1 FROM active)
+        RETURNING 1
+    ),
+    user_inserts AS (
+        INSERT INTO user_vectors (user_id, vector, bias)
+        SELECT v.user_id, v.vector, v.bias
+        FROM unnest(%(new_user_ids)s::integer[], %(new_user_vectors)b::vector[], %(new_user_biases)s::real[]) AS v(user_id, vector, bias)
+        WHERE EXISTS (SELECT 1 FROM active) AND EXISTS (SELECT 1 FROM users WHERE users.id = v.user_id)
+        ON CONFLICT (user_id) DO NOTHING
+        RETURNING 1
+    ),
+    recipe_inserts AS (
+        INSERT INTO recipe_vectors (recipe_id, vector, bias)
+        SELECT v.recipe_id, v.vector, v.bias
+        FROM unnest(%(new_recipe_ids)s::integer[], %(new_recipe_vectors)b::vector[], %(new_recipe_biases)s::real[]) AS v(recipe_id, vector, bias)
+        WHERE EXISTS (SELECT 1 FROM active)
+        ON CONFLICT (recipe_id) DO NOTHING
+        RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM active),
+        (SELECT COUNT(*) FROM user_updates), (SELECT COUNT(*) FROM recipe_updates),
+        (SELECT COUNT(*) FROM user_inserts), (SELECT COUNT(*) FROM recipe_inserts)
+"""
+
+async def configure_connection(conn):
+    # Vectors are loaded and dumped as float32 NumPy arrays in pgvector's binary format
+    await register_vector_async(conn)
+
+
+db_pool = AsyncConnectionPool(
+    DATABASE_URL,
+    configure=configure_connection,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    open=False,
+)
+rating_batcher: Optional[MicroBatcher] = None
+rating_history: Optional[RatingHistory] = None
+recommendation_index: Optional[RecommendationIndex] = None
+recommendation_reload_lock = asyncio.Lock()
+background_tasks = set()
+recommendation_reloads = {"reloads": 0, "failed": 0, "last_error": None, "last_source": None}
+factor_cache = FactorCache(FACTOR_CACHE_SIZE, FACTOR_CACHE_TTL_SECONDS, FACTOR_CACHE_MODEL_CHECK_SECONDS)
+# Contention counters for /metrics
+update_stats = {
+    "batches": 0,
+    "committed": 0,
+    "write_conflicts": 0,
+    "stale_model_versions": 0,
+    "deadlocks": 0,
+    "retries": 0,
+    "locked_attempts": 0,
+    "failed": 0,
+}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global rating_batcher, rating_history
+    reload_watcher = None
+    logger.info(f"Opening database pool (min {DB_POOL_MIN_SIZE}, max {DB_POOL_MAX_SIZE})")
+    await db_pool.open()
+    if FOLD_IN_ENABLED and MONGODB_URI and MONGODB_DATABASE and MONGODB_REVIEWS_COLLECTION:
+        logger.info("Folding in new users and recipes from their stored ratings")
+        rating_history = RatingHistory(MONGODB_URI, MONGODB_DATABASE, MONGODB_REVIEWS_COLLECTION, FOLD_IN_MAX_RATINGS)
+    if RATING_BATCH_MAX_SIZE > 1:
+        logger.info(f"Batching ratings (max {RATING_BATCH_MAX_SIZE} ratings, {RATING_BATCH_MAX_WAIT_MS}ms)")
+        rating_batcher = MicroBatcher(process_ratings, RATING_BATCH_MAX_SIZE, RATING_BATCH_MAX_WAIT_MS / 1000)
+    if RECOMMEND_ENABLED:
+        try:
+            await reload_recommendation_index()
+        except Exception as e:
+            # Keep serving ratings; the watcher retries the load
+            logger.error(f"Could not load the recommendation index: {e}")
+        reload_watcher = asyncio.create_task(watch_active_model())
+    try:
+        yield
+    finally:
+        if reload_watcher:
+            reload_watcher.cancel()
+        if rating_batcher:
+            await rating_batcher.close()
+        if rating_history:
+            await rating_history.close()
+        logger.info("Closing database pool")
+        await db_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 class RatingEvent(BaseModel):
     user_id: int
@@ -51,90 +241,11 @@ async def pubsub_push(body: PubSubPushRequest):
         return Response(status_code=204) 
 
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                # Check if vectors exist
-                cur.execute("""
-                    SELECT EXISTS(SELECT 1 FROM user_vectors WHERE user_id = %s)
-                    AND EXISTS(SELECT 1 FROM recipe_vectors WHERE recipe_id = %s)
-                """, (rating_event.user_id, rating_event.recipe_id))
-                
-                vectors_exist = cur.fetchone()[0]
-                if not vectors_exist:
-                    logger.warning(f"Missing vectors for user {rating_event.user_id} or recipe {rating_event.recipe_id}")
-                    return Response(status_code=204)
-                
-                # Get current vectors and metadata
-                cur.execute("""
-                    SELECT 
-                        uv.vector, uv.bias,
-                        rv.vector, rv.bias,
-                        sm.global_mean
-                    FROM user_vectors uv
-                    CROSS JOIN recipe_vectors rv
-                    CROSS JOIN (
-                        SELECT global_mean 
-                        FROM svd_metadata 
-                        ORDER BY completion_time DESC 
-                        LIMIT 1
-                    ) sm
-                    WHERE uv.user_id = %s AND rv.recipe_id = %s
-                """, (rating_event.user_id, rating_event.recipe_id))
-                
-                result = cur.fetchone()
-                if not result:
-                    logger.warning(f"Could not fetch vectors for user {rating_event.user_id} or recipe {rating_event.recipe_id}")
-                    return Response(status_code=204)
-                
-                user_vector, user_bias, recipe_vector, recipe_bias, global_mean = result
-                
-                # Parse vector strings to lists, then convert to NumPy arrays for fast computation
-                user_vec = np.array(ast.literal_eval(user_vector))
-                recipe_vec = np.array(ast.literal_eval(recipe_vector))
-                
-                # Calculate dot product (much faster in NumPy)
-                dot_product = np.dot(user_vec, recipe_vec)
-                
-                # Calculate prediction and error
-                prediction = global_mean + user_bias + recipe_bias + dot_product
-                error = rating_event.rating - prediction
-                
-                # SGD parameters
-                learning_rate = 0.01
-                regularization = 0.02
-                
-                # Calculate new vectors using efficient NumPy operations
-                # uu,new = uu + λ * (e * vi - β * uu)
-                new_user_vector = user_vec + learning_rate * (error * recipe_vec - regularization * user_vec)
-                
-                # vi,new = vi + λ * (e * uu - β * vi)
-                new_recipe_vector = recipe_vec + learning_rate * (error * user_vec - regularization * recipe_vec)
-                
-                # Convert back to list for PostgreSQL
-                new_user_vector = new_user_vector.tolist()
-                new_recipe_vector = new_recipe_vector.tolist()
-                
-                # Calculate new biases
-                new_user_bias = user_bias + learning_rate * (error - regularization * user_bias)
-                new_recipe_bias = recipe_bias + learning_rate * (error - regularization * recipe_bias)
-                
-                # Update user vector
-                cur.execute("""
-                    UPDATE user_vectors 
-                    SET vector = %s, bias = %s, updated_at = NOW()
-                    WHERE user_id = %s
-                """, (new_user_vector, new_user_bias, rating_event.user_id))
-                
-                # Update recipe vector
-                cur.execute("""
-                    UPDATE recipe_vectors 
-                    SET vector = %s, bias = %s, updated_at = NOW()
-                    WHERE recipe_id = %s
-                """, (new_recipe_vector, new_recipe_bias, rating_event.recipe_id))
-                
-                conn.commit()
-
-        logger.info(f"Successfully processed rating for user {rating_event.user_id}")
+        if rating_batcher:
+            # Only ack once the batch holding this rating has been committed
+            await rating_batcher.submit(rating_event)
+        else:
+            await process_ratings([rating_event])
         return Response(status_code=204)
 
     except Exception as e:
@@ -145,6 +256,440 @@ async def pubsub_push(body: PubSubPushRequest):
         raise HTTPException(status_code=500, detail=f"Error processing message: {error_detail}")
 
 
+async def process_ratings(rating_events):
+    """Apply a batch of ratings in one transaction and commit it.
+
+    Optimistic attempts are retried when a row's revision or the active
+    model version changed underneath them; the last attempt locks its rows.
+    """
+    update_stats["batches"] += 1
+    async with db_pool.connection() as conn:
+        for attempt in range(UPDATE_RETRIES + 1):
+            lock = attempt == UPDATE_RETRIES
+            update_stats["locked_attempts"] += lock
+            try:
+                async with conn.cursor(binary=True) as cur:
+                    outcome, written = await apply_ratings(cur, rating_events, lock=lock)
+            except psycopg.errors.DeadlockDetected:
+                outcome, written = WRITE_CONFLICT, None
+                update_stats["deadlocks"] += 1
+            if outcome not in (STALE_MODEL_VERSION, WRITE_CONFLICT):
+                break
+
+            await conn.rollback()
+            if outcome == STALE_MODEL_VERSION:
+                # A new model version was activated mid-update; redo it against the new one
+                update_stats["stale_model_versions"] += 1
+                factor_cache.invalidate()
+            else:
+                update_stats["write_conflicts"] += 1
+                factor_cache.discard("user", {event.user_id for event in rating_events})
+                factor_cache.discard("recipe", {event.recipe_id for event in rating_events})
+            if attempt < UPDATE_RETRIES:
+                update_stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, UPDATE_RETRY_BACKOFF_MS * 2 ** attempt) / 1000)
+        else:
+            update_stats["failed"] += 1
+            raise RuntimeError(f"Could not apply {len(rating_events)} ratings after {UPDATE_RETRIES + 1} attempts")
+
+        if outcome is None:
+            return None
+        await conn.commit()
+        update_stats["committed"] += 1
+
+    # Only committed factors go into the cache
+    for kind, (ids, vectors, biases, revisions) in written.items():
+        factor_cache.put_many(kind, ids, vectors, biases, revisions + 1)
+
+    logger.info(f"Successfully processed {len(rating_events)} ratings with model version {outcome}")
+    return outcome
+
+
+async def fetch_active_model(cur):
+    """Return (version, global_mean) of the active model, from the cache when it was checked recently."""
+    model = factor_cache.active_model() if factor_cache.enabled else None
+    if model is not None:
+        return model
+    await cur.execute(ACTIVE_MODEL_QUERY, prepare=True)
+    active = await cur.fetchone()
+    if not active:
+        return None
+    factor_cache.set_active_model(*active)
+    return active[:2]
+
+
+async def fetch_vectors(cur, kind, query, ids, use_cache=True):
+    """Return (id, vector, bias, revision) rows for ids, from the cache where possible and one = ANY(...) query otherwise."""
+    rows, missing = factor_cache.get_many(kind, ids) if factor_cache.enabled and use_cache else ([], list(ids))
+    if missing:
+        await cur.execute(query, (missing,), prepare=True)
+        rows.extend(await cur.fetchall())
+    return rows
+
+
+def fold_in_rows(ratings_by_id, counterparts, global_mean):
+    """Fold in every entity with at least one rating of a counterpart that has factors."""
+    rows = []
+    for entity_id, ratings in ratings_by_id.items():
+        known = [(counterparts[other_id], rating) for other_id, rating in ratings.items() if other_id in counterparts]
+        if not known:
+            continue
+        vector, bias = fold_in(
+            np.stack([row[1] for row, _ in known]),
+            np.array([row[2] for row, _ in known], dtype=np.float64),
+            [rating for _, rating in known],
+            global_mean,
+            FOLD_IN_REG,
+        )
+        rows.append((entity_id, vector, bias, 0))
+    return rows
+
+
+async def fold_in_missing(cur, rating_events, user_rows, recipe_rows, global_mean):
+    """Fold in the users and recipes of a batch that have no vectors yet.
+
+    New users are solved against the fixed recipe factors first, so a new
+    recipe rated by a new user can then be solved against that user. The
+    folded-in rows (and any counterpart rows fetched for them) are appended
+    to user_rows / recipe_rows. Returns the folded-in user and recipe IDs,
+    which are inserted rather than updated.
+    """
+    known_users = {row[0]: row for row in user_rows}
+    known_recipes = {row[0]: row for row in recipe_rows}
+    new_user_ids = sorted({event.user_id for event in rating_events} - known_users.keys())
+    new_recipe_ids = sorted({event.recipe_id for event in rating_events} - known_recipes.keys())
+    if not new_user_ids and not new_recipe_ids:
+        return set(), set()
+
+    if rating_history:
+        user_ratings = await rating_history.for_users(new_user_ids)
+        recipe_ratings = await rating_history.for_recipes(new_recipe_ids)
+    else:
+        user_ratings = {user_id: {} for user_id in new_user_ids}
+        recipe_ratings = {recipe_id: {} for recipe_id in new_recipe_ids}
+    # Ratings in this batch are the most recent ones
+    for event in rating_events:
+        if event.user_id in user_ratings:
+            user_ratings[event.user_id][event.recipe_id] = event.rating
+        if event.recipe_id in recipe_ratings:
+            recipe_ratings[event.recipe_id][event.user_id] = event.rating
+
+    # Counterparts only referenced by stored ratings
+    extra_recipe_ids = {r for ratings in user_ratings.values() for r in ratings} - known_recipes.keys() - set(new_recipe_ids)
+    extra_user_ids = {u for ratings in recipe_ratings.values() for u in ratings} - known_users.keys() - set(new_user_ids)
+    if extra_recipe_ids:
+        rows = await fetch_vectors(cur, "recipe", FETCH_RECIPE_VECTORS_QUERY, sorted(extra_recipe_ids))
+        recipe_rows.extend(rows)
+        known_recipes.update((row[0], row) for row in rows)
+    if extra_user_ids:
+        rows = await fetch_vectors(cur, "user", FETCH_USER_VECTORS_QUERY, sorted(extra_user_ids))
+        user_rows.extend(rows)
+        known_users.update((row[0], row) for row in rows)
+
+    folded_users = fold_in_rows(user_ratings, known_recipes, global_mean)
+    user_rows.extend(folded_users)
+    known_users.update((row[0], row) for row in folded_users)
+    folded_recipes = fold_in_rows(recipe_ratings, known_users, global_mean)
+    recipe_rows.extend(folded_recipes)
+
+    if folded_users or folded_recipes:
+        logger.info(f"Folded in {len(folded_users)} new users and {len(folded_recipes)} new recipes")
+    return {row[0] for row in folded_users}, {row[0] for row in folded_recipes}
+
+
+def parse_vectors(rows):
+    """Stack (id, vector, bias, revision) rows into ids, an id -> row map, a vector matrix, biases and revisions."""
+    ids = [row[0] for row in rows]
+    rows_by_id = {row_id: index for index, row_id in enumerate(ids)}
+    vectors = np.stack([row[1] for row in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+    biases = np.array([row[2] for row in rows], dtype=np.float32)
+    revisions = np.array([row[3] for row in rows], dtype=np.int64)
+    return ids, rows_by_id, vectors, biases, revisions
+
+
+async def apply_ratings(cur, rating_events, lock=False):
+    """Apply one SGD step per rating, in arrival order, against the active model version.
+
+    Every involved user and recipe vector not in the factor cache is fetched
+    with one query per table and updated in stacked matrices, so several
+    ratings of the same popular recipe compound in memory and each row is
+    written back once. Users and recipes without vectors are folded in first;
+    since their solve already includes the batch's ratings, those ratings then
+    only step the counterpart.
+    With lock=True the rows are read from Postgres with SELECT ... FOR UPDATE
+    instead of the cache, so the write cannot conflict.
+
+    Returns (model version, written factors by kind). The version is None if
+    no rating had both vectors, STALE_MODEL_VERSION if another version was
+    activated between the reads and the write (a cached version included), or
+    WRITE_CONFLICT if another writer changed one of the rows first.
+    """
+    active = await fetch_active_model(cur)
+    if not active:
+        logger.warning("No active model version, discarding ratings")
+        return None, None
+    model_version, global_mean = active
+
+    user_ids = sorted({event.user_id for event in rating_events})
+    recipe_ids = sorted({event.recipe_id for event in rating_events})
+    if lock:
+        user_rows = await fetch_vectors(cur, "user", LOCK_USER_VECTORS_QUERY, user_ids, use_cache=False)
+        recipe_rows = await fetch_vectors(cur, "recipe", LOCK_RECIPE_VECTORS_QUERY, recipe_ids, use_cache=False)
+    else:
+        user_rows = await fetch_vectors(cur, "user", FETCH_USER_VECTORS_QUERY, user_ids)
+        recipe_rows = await fetch_vectors(cur, "recipe", FETCH_RECIPE_VECTORS_QUERY, recipe_ids)
+    new_user_ids, new_recipe_ids = set(), set()
+    if FOLD_IN_ENABLED:
+        new_user_ids, new_recipe_ids = await fold_in_missing(cur, rating_events, user_rows, recipe_rows, global_mean)
+
+    fetched_user_ids, user_index_by_id, user_vectors, user_biases, user_revisions = parse_vectors(user_rows)
+    fetched_recipe_ids, recipe_index_by_id, recipe_vectors, recipe_biases, recipe_revisions = parse_vectors(recipe_rows)
+
+    touched_users = set()
+    touched_recipes = set()
+    for event in rating_events:
+        u = user_index_by_id.get(event.user_id)
+        i = recipe_index_by_id.get(event.recipe_id)
+        if u is None or i is None:
+            logger.warning(f"Missing vectors for user {event.user_id} or recipe {event.recipe_id}")
+            continue
+
+        user_vec = user_vectors[u].copy()
+        recipe_vec = recipe_vectors[i].copy()
+
+        # Calculate prediction and error
+        prediction = global_mean + user_biases[u] + recipe_biases[i] + np.dot(user_vec, recipe_vec)
+        error = event.rating - prediction
+
+        # A folded-in side was just solved with this rating included; stepping it
+        # again would count the rating twice, so only its counterpart learns from it
+        if event.user_id not in new_user_ids:
+            # uu,new = uu + λ * (e * vi - β * uu)
+            user_vectors[u] = user_vec + LEARNING_RATE * (error * recipe_vec - REGULARIZATION * user_vec)
+            user_biases[u] += LEARNING_RATE * (error - REGULARIZATION * user_biases[u])
+        if event.recipe_id not in new_recipe_ids:
+            # vi,new = vi + λ * (e * uu - β * vi)
+            recipe_vectors[i] = recipe_vec + LEARNING_RATE * (error * user_vec - REGULARIZATION * recipe_vec)
+            recipe_biases[i] += LEARNING_RATE * (error - REGULARIZATION * recipe_biases[i])
+        touched_users.add(u)
+        touched_recipes.add(i)
+
+    if not touched_users:
+        return None, None
+
+    # Existing rows are updated (and cached once committed); folded-in rows are inserted
+    written, inserted = {}, {}
+    for kind, touched, ids, vectors, biases, revisions, new_ids in (
+        ("user", touched_users, fetched_user_ids, user_vectors, user_biases, user_revisions, new_user_ids),
+        ("recipe", touched_recipes, fetched_recipe_ids, recipe_vectors, recipe_biases, recipe_revisions, new_recipe_ids),
+    ):
+        for target, index in (
+            (written, [k for k in sorted(touched) if ids[k] not in new_ids]),
+            (inserted, [k for k in sorted(touched) if ids[k] in new_ids]),
+        ):
+            target[kind] = ([ids[k] for k in index], vectors[index], biases[index], revisions[index])
+
+    params = {"model_version": model_version}
+    for kind in ("user", "recipe"):
+        ids, vectors, biases, revisions = written[kind]
+        params.update({
+            f"{kind}_ids": ids,
+            f"{kind}_vectors": list(vectors),
+            f"{kind}_biases": biases.tolist(),
+            f"{kind}_revisions": revisions.tolist(),
+        })
+        ids, vectors, biases, _ = inserted[kind]
+        params.update({
+            f"new_{kind}_ids": ids,
+            f"new_{kind}_vectors": list(vectors),
+            f"new_{kind}_biases": biases.tolist(),
+        })
+    await cur.execute(WRITE_VECTORS_QUERY, params, prepare=True)
+
+    active_count, users_written, recipes_written, users_inserted, recipes_inserted = await cur.fetchone()
+    if not active_count:
+        return STALE_MODEL_VERSION, None
+    if users_written != len(written["user"][0]) or recipes_written != len(written["recipe"][0]):
+        return WRITE_CONFLICT, None
+    if users_inserted or recipes_inserted:
+        logger.info(f"Inserted {users_inserted} folded-in users and {recipes_inserted} folded-in recipes")
+
+    return model_version, written
+
+
+def open_model_artifact(version):
+    """The memory-mapped artifact of a model version, or None if there is none to use."""
+    if not MODEL_ARTIFACT_DIR:
+        return None
+    path = artifact_path(MODEL_ARTIFACT_DIR, version)
+    if not os.path.exists(path):
+        return None
+    try:
+        artifact = ModelArtifact(path)
+    except ArtifactFormatError as e:
+        # Training and this service disagree on the format; fall back, but make it visible
+        logger.error(f"Incompatible model artifact, loading from Postgres instead: {e}")
+        return None
+    except Exception as e:
+        logger.warning(f"Could not open model artifact {path}: {e}")
+        return None
+    return artifact if artifact.version == version else None
+
+
+async def load_recipe_factors():
+    """Return (version, global_mean, recipe IDs, vectors, biases, source) of the active model.
+
+    The factors come from the version's model artifact when there is one and
+    from Postgres otherwise, retrying if a new version is activated mid-read.
+    """
+    async with db_pool.connection() as conn:
+        async with conn.cursor(binary=True) as cur:
+            for _ in range(UPDATE_RETRIES + 1):
+                await cur.execute(ACTIVE_MODEL_QUERY)
+                active = await cur.fetchone()
+                if not active:
+                    return None
+                artifact = open_model_artifact(active[0])
+                if artifact is not None:
+                    return (
+                        active[0], active[1], artifact.recipe_ids, artifact.recipe_factors, artifact.recipe_bias,
+                        "artifact",
+                    )
+                await cur.execute(LOAD_RECIPE_VECTORS_QUERY)
+                rows = await cur.fetchall()
+                await cur.execute(ACTIVE_MODEL_QUERY)
+                if await cur.fetchone() == active:
+                    ids, _, vectors, biases, _ = parse_vectors([(*row, 0) for row in rows])
+                    return active[0], active[1], ids, vectors, biases, "postgres"
+    raise RuntimeError("The active model version kept changing while recipe factors were read")
+
+
+async def reload_recommendation_index(only_if_stale=False):
+    """Build a recommendation index for the active model version and swap it in.
+
+    Queries keep using the previous index while the new one is built. With
+    only_if_stale the rebuild is skipped when the index already serves the
+    active version.
+    """
+    global recommendation_index
+    async with recommendation_reload_lock:
+        if only_if_stale and recommendation_index is not None:
+            async with db_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(ACTIVE_MODEL_QUERY)
+                    active = await cur.fetchone()
+            if active is None or active[0] == recommendation_index.version:
+                return recommendation_index
+
+        try:
+            loaded = await load_recipe_factors()
+            if loaded is None:
+                logger.warning("No active model version, recommendation index not loaded")
+                return recommendation_index
+            version, global_mean, recipe_ids, vectors, biases, source = loaded
+            if not len(recipe_ids):
+                logger.warning(f"Model version {version} has no recipe vectors, recommendation index not loaded")
+                return recommendation_index
+            index = await asyncio.to_thread(
+                RecommendationIndex,
+                version,
+                global_mean,
+                recipe_ids,
+                vectors,
+                biases,
+                RECOMMEND_HNSW_M,
+                RECOMMEND_EF_CONSTRUCTION,
+                RECOMMEND_EF_SEARCH,
+                RECOMMEND_EXACT_BELOW,
+            )
+        except Exception as e:
+            recommendation_reloads["failed"] += 1
+            recommendation_reloads["last_error"] = str(e)
+            raise
+
+        recommendation_index = index
+        recommendation_reloads["reloads"] += 1
+        recommendation_reloads["last_source"] = source
+        logger.info(
+            f"Loaded {index.kind} recommendation index of model version {version} from {source} "
+            f"({len(index)} recipes, built in {index.build_seconds:.2f}s)"
+        )
+        return index
+
+
+async def watch_active_model():
+    while True:
+        await asyncio.sleep(RECOMMEND_RELOAD_CHECK_SECONDS)
+        try:
+            await reload_recommendation_index(only_if_stale=True)
+        except Exception as e:
+            logger.error(f"Recommendation index reload failed: {e}")
+
+
+@app.post("/reload")
+async def reload():
+    """Rebuild the recommendation index; called by the training pipeline after it activates a version."""
+    if not RECOMMEND_ENABLED:
+        raise HTTPException(status_code=404, detail="Recommendations are disabled")
+    try:
+        index = await reload_recommendation_index()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reloading recommendation index: {e}")
+    if index is None:
+        raise HTTPException(status_code=503, detail="No active model version")
+    return index.stats()
+
+
+@app.get("/recommend")
+async def recommend(user_id: int, k: int = Query(20, ge=1)):
+    """Top-k recipes for a user, ranked by global_mean + b_u + b_i + p_u . q_i."""
+    index = recommendation_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Recommendation index is not loaded")
+
+    async with db_pool.connection() as conn:
+        async with conn.cursor(binary=True) as cur:
+            active = await fetch_active_model(cur)
+            if active is None or active[0] != index.version:
+                # User factors already belong to another version than the index
+                if not recommendation_reload_lock.locked():
+                    task = asyncio.create_task(reload_recommendation_index(only_if_stale=True))
+                    background_tasks.add(task)
+                    task.add_done_callback(background_tasks.discard)
+                raise HTTPException(status_code=503, detail="Recommendation index is reloading")
+            rows = await fetch_vectors(cur, "user", FETCH_USER_VECTORS_QUERY, [user_id])
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"No vector for user {user_id}")
+
+    _, user_vector, user_bias, _ = rows[0]
+    results = index.search(user_vector, user_bias, min(k, RECOMMEND_MAX_K))
+    return {
+        "model_version": index.version,
+        "recommendations": [
+            {"recipe_id": recipe_id, "predicted_rating": round(score, 4)}
+            for recipe_id, score in results
+        ],
+    }
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    # psycopg_pool counters: pool_min/max/size, pool_available, requests_waiting,
+    # requests_wait_ms, requests_errors, connections_errors, returns_bad, ...
+    stats = {"db_pool": {"healthy": not db_pool.closed, **db_pool.get_stats()}}
+    if rating_batcher:
+        stats["rating_batches"] = rating_batcher.stats()
+    if factor_cache.enabled:
+        stats["factor_cache"] = factor_cache.stats()
+    stats["updates"] = update_stats
+    if RECOMMEND_ENABLED:
+        stats["recommendation_index"] = {
+            **(recommendation_index.stats() if recommendation_index else {"loaded": False}),
+            **recommendation_reloads,
+        }
+    return stats
\ No newline at end of file
@@ -0,0 +1,52 @@
+import json
+import struct
+
+import numpy as np
+
+# Read-only view of the model artifacts written by svd-training/model_artifact.py,
+# which owns the format: magic, little-endian uint32 header length, JSON header,
+# then aligned arrays at the offsets recorded in the header, rows sorted by ID.
+# Only FORMAT_VERSION is understood; any other version is refused outright
+# rather than misread.
+MAGIC = b"RSMODEL1"
+FORMAT_VERSION = 1
+
+
+class ArtifactFormatError(ValueError):
+    pass
+
+
+def artifact_path(root, version):
+    """Where the artifact of a model version lives under a local directory or bucket prefix."""
+    return f"{root.rstrip('/')}/v{int(version)}/model.bin"
+
+
+class ModelArtifact:
+    """A model artifact opened with every array memory-mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ArtifactFormatError(f"{path} is not a model artifact")
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length))
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ArtifactFormatError(
+                f"{path} has artifact format version {header.get('format_version')}, "
+                f"this service reads version {FORMAT_VERSION}"
+            )
+
+        self.path = path
+        self.version = header["version"]
+        self.global_mean = header["global_mean"]
+        self.n_factors = header["n_factors"]
+        self.metadata = header["metadata"]
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if 0 in shape:
+                # mmap cannot map zero bytes
+                array = np.empty(shape, dtype=spec["dtype"])
+            else:
+                array = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+            setattr(self, name, array)
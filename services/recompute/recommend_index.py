@@ -0,0 +1,63 @@
+import time
+
+import faiss
+import numpy as np
+
+
+class RecommendationIndex:
+    """In-memory inner-product index over the recipe factors of one model version.
+
+    Each recipe is stored as [q, b_i] and each query is [p_u, 1], so the inner
+    product the index ranks by is p_u . q + b_i; adding global_mean + b_u,
+    which are the same for every recipe, gives the model's predicted rating.
+    Small catalogues use an exact flat index, larger ones HNSW.
+    """
+
+    def __init__(self, version, global_mean, recipe_ids, vectors, biases, hnsw_m, ef_construction, ef_search, exact_below):
+        self.version = version
+        self.global_mean = float(global_mean)
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+
+        start = time.perf_counter()
+        items = np.empty((len(self.recipe_ids), vectors.shape[1] + 1), dtype=np.float32)
+        items[:, :-1] = vectors
+        items[:, -1] = biases
+        if len(items) < exact_below:
+            self.kind = "flat"
+            self.index = faiss.IndexFlatIP(items.shape[1])
+        else:
+            self.kind = "hnsw"
+            self.index = faiss.IndexHNSWFlat(items.shape[1], hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efConstruction = ef_construction
+            self.index.hnsw.efSearch = ef_search
+        self.index.add(items)
+        self.build_seconds = time.perf_counter() - start
+        self.built_at = time.time()
+        self.queries = 0
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def search(self, user_vector, user_bias, k):
+        """Return [(recipe_id, predicted rating)] for the top k recipes, best first."""
+        query = np.empty((1, len(user_vector) + 1), dtype=np.float32)
+        query[0, :-1] = user_vector
+        query[0, -1] = 1.0
+        scores, positions = self.index.search(query, min(k, len(self)))
+        self.queries += 1
+        offset = self.global_mean + float(user_bias)
+        return [
+            (int(self.recipe_ids[position]), offset + float(score))
+            for score, position in zip(scores[0], positions[0])
+            if position >= 0
+        ]
+
+    def stats(self):
+        return {
+            "model_version": self.version,
+            "kind": self.kind,
+            "recipes": len(self),
+            "build_seconds": round(self.build_seconds, 3),
+            "built_at": self.built_at,
+            "queries": self.queries,
+        }
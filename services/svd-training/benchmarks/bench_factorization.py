@@ -0,0 +1,90 @@
+"""Benchmark the training backends against each other on synthetic ratings.
+
+Each backend runs in a fresh process so peak RSS is measured per backend:
+
+    python benchmarks/bench_factorization.py --ratings 1000000 --backends surprise sgd als
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoding import encode_ratings  # noqa: E402
+from factorization import make_factorizer, rmse  # noqa: E402
+from synthetic import generate_ratings  # noqa: E402
+
+
+def run_backend(backend, args, queue):
+    ratings_df = generate_ratings(args.ratings, seed=args.seed)
+    encoded = encode_ratings(ratings_df)
+    del ratings_df
+
+    test = np.random.default_rng(args.seed).random(len(encoded)) < args.test_fraction
+    train, holdout = encoded.take(~test), encoded.take(test)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    params = dict(n_factors=args.factors, n_epochs=args.epochs, random_state=args.seed, n_jobs=args.jobs, verbose=False)
+    if backend == "als":
+        params["solver"] = args.als_solver
+    model = make_factorizer(backend, **params)
+    start = time.perf_counter()
+    model.fit(train)
+    elapsed = time.perf_counter() - start
+
+    queue.put({
+        "backend": backend,
+        "ratings": len(train),
+        "users": encoded.n_users,
+        "recipes": encoded.n_recipes,
+        "fit_seconds": round(elapsed, 3),
+        "ratings_per_second": round(len(train) * args.epochs / elapsed),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "fit_rss_increase_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+        "train_rmse": round(rmse(model, train), 4),
+        "holdout_rmse": round(rmse(model, holdout), 4),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ratings", type=int, default=1_000_000)
+    parser.add_argument("--factors", type=int, default=100)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--test-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--als-solver", choices=["cholesky", "cg"], default="cg")
+    parser.add_argument("--backends", nargs="+", default=["surprise", "sgd", "als"])
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for backend in args.backends:
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_backend, args=(backend, args, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    header = f"{'backend':<10}{'fit (s)':>10}{'ratings/s':>14}{'peak RSS MB':>14}{'train RMSE':>12}{'holdout RMSE':>14}"
+    print(header)
+    for result in results:
+        print(f"{result['backend']:<10}{result['fit_seconds']:>10.2f}{result['ratings_per_second']:>14,}"
+              f"{result['peak_rss_mb']:>14.1f}{result['train_rmse']:>12.4f}{result['holdout_rmse']:>14.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
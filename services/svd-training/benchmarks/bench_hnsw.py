@@ -0,0 +1,83 @@
+"""Sweep HNSW build settings on a copy of the live recipe vectors.
+
+Every (m, ef_construction) pair is built once on a scratch copy of
+recipe_vectors and then reported at each ef_search, with recall@k measured
+against exact search for a sample of real user vectors:
+
+    DATABASE_URL=postgresql://localhost/recipes python benchmarks/bench_hnsw.py \\
+        --m 16 32 --ef-construction 64 128 --ef-search 40 100 --maintenance-work-mem 2GB
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import psycopg2 as pg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hnsw_index import HnswSettings, build_hnsw_index, hnsw_report  # noqa: E402
+
+SCRATCH_TABLE = "recipe_vectors_hnsw_bench"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40])
+    parser.add_argument("--maintenance-work-mem")
+    parser.add_argument("--parallel-workers", type=int)
+    parser.add_argument("--sample", type=int, default=100, help="User vectors to measure recall with")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    conn = pg.connect(args.database_url)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+    cursor.execute(f"CREATE TABLE {SCRATCH_TABLE} AS SELECT recipe_id, vector FROM recipe_vectors")
+    conn.commit()
+    cursor.close()
+
+    results = []
+    try:
+        for m, ef_construction in itertools.product(args.m, args.ef_construction):
+            settings = HnswSettings(
+                m=m,
+                ef_construction=ef_construction,
+                maintenance_work_mem=args.maintenance_work_mem,
+                max_parallel_maintenance_workers=args.parallel_workers,
+            )
+            index = f"{SCRATCH_TABLE}_idx"
+            build_seconds = build_hnsw_index(conn, SCRATCH_TABLE, index, settings)
+            for ef_search in args.ef_search:
+                results.append(hnsw_report(
+                    conn, SCRATCH_TABLE, index, "user_vectors", settings, build_seconds,
+                    sample_size=args.sample, k=args.k, ef_search=ef_search,
+                ))
+    finally:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+        conn.commit()
+        conn.close()
+
+    print(f"{'m':>4}{'ef_constr':>11}{'ef_search':>11}{'build (s)':>11}{'index MB':>10}"
+          f"{'recall@' + str(args.k):>11}{'index ms':>10}{'exact ms':>10}")
+    for result in results:
+        print(f"{result['m']:>4}{result['ef_construction']:>11}{result['ef_search']:>11}"
+              f"{result['build_seconds']:>11.2f}{result['index_bytes'] / 2**20:>10.1f}"
+              f"{result.get('recall_at_k', float('nan')):>11.4f}{result.get('index_query_ms', float('nan')):>10.2f}"
+              f"{result.get('exact_query_ms', float('nan')):>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""Benchmark the recommender pipeline end to end on synthetic ratings.
+
+For every --ratings scale a power-law rating dataset is generated and loaded
+into MongoDB, then the pipeline runs stage by stage in a fresh process, so
+peak RSS is measured per scale:
+
+- extraction from MongoDB (per collection),
+- training (encoding, fit) and embedding export,
+- publication of user and recipe vectors and biases, and the HNSW build,
+- /pubsub/push throughput and /recommend latency of the recompute service,
+  started with uvicorn against the freshly published model.
+
+MongoDB is a local server, or mongomock in-process with --mongodb-uri
+mongomock (small scales only; online fold-in is then disabled). Postgres must
+be a scratch database with the web migrations applied; its vectors and model
+versions are replaced on every run. The recompute service's requirements and
+benchmarks/requirements.txt must be installed:
+
+    DATABASE_URL=postgresql://localhost/recipes_bench python benchmarks/bench_pipeline.py \\
+        --ratings 100000 1000000 10000000 --mongodb-uri mongodb://localhost:27017 \\
+        --label $(git rev-parse --short HEAD) --output pipeline_bench.json
+
+Runs are stored in --output under their label with sorted keys, so the file
+diffs cleanly across commits; --compare LABEL prints each stage's change
+against an earlier label in the same file.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCHMARKS_DIR)
+RECOMPUTE_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "recompute")
+sys.path.insert(0, SERVICE_DIR)
+
+from profiling import diff_reports, print_diff  # noqa: E402
+from synthetic import generate_ratings  # noqa: E402
+
+MONGODB_DATABASE = "recipes_bench"
+INTERNAL_COLLECTION = "bench_reviews"
+EXTERNAL_COLLECTION = "bench_external_reviews"
+MONGODB_INSERT_CHUNK = 100_000
+
+
+def mongo_client(uri):
+    if uri == "mongomock":
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    return MongoClient(uri)
+
+
+def load_mongodb(client, ratings_df):
+    """Replace the benchmark collections with the ratings, split by user namespace like production."""
+    user_id = ratings_df["user_id"].astype(str)
+    external = user_id.str.startswith("ext_").to_numpy()
+    db = client[MONGODB_DATABASE]
+    for name, mask in ((INTERNAL_COLLECTION, ~external), (EXTERNAL_COLLECTION, external)):
+        db.drop_collection(name)
+        rows = ratings_df[mask]
+        # IDs are stored as strings, as the web app's RatingRepository writes them
+        user_ids = user_id[mask].tolist()
+        recipe_ids = rows["recipe_id"].astype(str).tolist()
+        ratings = rows["rating"].tolist()
+        for start in range(0, len(rows), MONGODB_INSERT_CHUNK):
+            chunk = slice(start, start + MONGODB_INSERT_CHUNK)
+            db[name].insert_many(
+                [
+                    {"user_id": u, "recipe_id": r, "rating": float(x)}
+                    for u, r, x in zip(user_ids[chunk], recipe_ids[chunk], ratings[chunk])
+                ],
+                ordered=False,
+            )
+
+
+def reset_postgres(database_url, n_users):
+    """Drop previous model versions and make sure every synthetic user exists (user_vectors references users)."""
+    import psycopg2 as pg
+
+    conn = pg.connect(database_url)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM svd_metadata")
+        for (version,) in cursor.fetchall():
+            cursor.execute(f"DROP TABLE IF EXISTS recipe_vectors_v{version}, user_vectors_v{version}")
+        cursor.execute("TRUNCATE user_vectors, recipe_vectors, svd_metadata CASCADE")
+        cursor.execute(
+            """
+            INSERT INTO users (id, name, email, password)
+            SELECT g, 'Benchmark ' || g, 'bench-' || g || '@example.com', 'x'
+            FROM generate_series(1, %s) g
+            ON CONFLICT DO NOTHING
+            """,
+            (n_users,),
+        )
+        cursor.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def start_recompute(args, artifact_dir):
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url,
+        MODEL_ARTIFACT_DIR=artifact_dir,
+        MONGODB_URI=args.mongodb_uri,
+        MONGODB_DATABASE=MONGODB_DATABASE,
+        MONGODB_REVIEWS_COLLECTION=INTERNAL_COLLECTION,
+    )
+    if args.mongodb_uri == "mongomock":
+        env["FOLD_IN_ENABLED"] = "false"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=RECOMPUTE_DIR,
+        env=env,
+    )
+    import httpx
+
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"recompute exited with code {server.returncode} during startup")
+        try:
+            if httpx.get(f"http://localhost:{args.port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"recompute did not become healthy within {args.startup_timeout}s")
+
+
+def push_stage(args, n_users, n_recipes):
+    sys.path.insert(0, os.path.join(RECOMPUTE_DIR, "benchmarks"))
+    from load_test import run_load
+
+    result = asyncio.run(run_load(
+        f"http://localhost:{args.port}", args.push_messages, args.push_concurrency, n_users, n_recipes, args.seed,
+    ))
+    return {
+        "name": "pubsub_push",
+        "parent": None,
+        "wall_seconds": result["seconds"],
+        "rows": result["messages"],
+        "rows_per_second": result["messages_per_second"],
+        **{key: result[key] for key in ("concurrency", "failures", "p50_ms", "p90_ms", "p99_ms", "max_ms")},
+    }
+
+
+def recommend_stage(args, user_ids):
+    import httpx
+
+    rng = np.random.default_rng(args.seed)
+    queries = rng.choice(user_ids, args.recommend_queries).tolist()
+    latencies = np.zeros(len(queries))
+    failures = 0
+    with httpx.Client(base_url=f"http://localhost:{args.port}", timeout=30) as client:
+        # The first query may wait for the index build; keep it out of the latencies
+        client.get("/recommend", params={"user_id": queries[0], "k": args.k})
+        start = time.perf_counter()
+        for index, user_id in enumerate(queries):
+            query_start = time.perf_counter()
+            failures += client.get("/recommend", params={"user_id": user_id, "k": args.k}).status_code != 200
+            latencies[index] = time.perf_counter() - query_start
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = latencies * 1000
+    return {
+        "name": "recommend",
+        "parent": None,
+        "wall_seconds": round(elapsed, 4),
+        "rows": len(queries),
+        "rows_per_second": round(len(queries) / elapsed, 1),
+        "k": args.k,
+        "failures": failures,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(latencies_ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+    }
+
+
+def run_scale(n_ratings, args, queue):
+    try:
+        queue.put(benchmark_scale(n_ratings, args))
+    except BaseException as e:
+        # The parent blocks on the queue, so a failure has to be reported there too
+        queue.put({"error": repr(e)})
+        raise
+
+
+def benchmark_scale(n_ratings, args):
+    artifact_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    # train.py reads its configuration on import; keep the run local
+    os.environ.update(
+        DATABASE_URL=args.database_url,
+        MODEL_ARTIFACT_DIR=artifact_dir,
+        MODEL_ARTIFACT_GCS_PREFIX="",
+        TRAINING_BACKEND=args.backend,
+    )
+    os.environ.pop("RELOAD_URL", None)
+    os.environ.pop("RUN_REPORT_PATH", None)
+    from extract import Extract
+    from profiling import RunProfiler
+    from train import Train
+
+    start = time.perf_counter()
+    ratings_df = generate_ratings(n_ratings, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+    n_users = len(ratings_df["user_id"].cat.categories)
+    n_recipes = len(ratings_df["recipe_id"].cat.categories)
+    generated_ratings = len(ratings_df)
+
+    client = mongo_client(args.mongodb_uri)
+    start = time.perf_counter()
+    load_mongodb(client, ratings_df)
+    mongodb_load_seconds = time.perf_counter() - start
+    del ratings_df
+    reset_postgres(args.database_url, n_users)
+
+    profiler = RunProfiler()
+    with profiler.stage("extract") as stage:
+        ratings_df = Extract(profiler, client).get_combined_ratings_data(
+            MONGODB_DATABASE, INTERNAL_COLLECTION, EXTERNAL_COLLECTION,
+        )
+        stage["rows"] = len(ratings_df)
+    trainer = Train(n_factors=args.factors, n_epochs=args.epochs, backend=args.backend, profiler=profiler)
+    version = trainer.run_pipeline(ratings_df, warm_start=False)
+
+    stages = list(profiler.stages)
+    if not args.skip_online:
+        user_ids = ratings_df["user_id"].astype(str)
+        internal_ids = np.unique(user_ids[~user_ids.str.startswith("ext_")].astype(np.int64).to_numpy())
+        server = start_recompute(args, artifact_dir)
+        try:
+            stages.append(push_stage(args, n_users, n_recipes))
+            stages.append(recommend_stage(args, internal_ids))
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        "ratings": len(ratings_df),
+        "requested_ratings": n_ratings,
+        "generated_ratings": generated_ratings,
+        "users": n_users,
+        "recipes": n_recipes,
+        "version": version,
+        "generate_seconds": round(generate_seconds, 3),
+        "mongodb_load_seconds": round(mongodb_load_seconds, 3),
+        "wall_seconds": round(sum(stage["wall_seconds"] for stage in stages if stage["parent"] is None), 3),
+        "stats": trainer.stats,
+        "stages": stages,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ratings", type=int, nargs="+", default=[100_000],
+                        help="Dataset scales, e.g. 100000 1000000 10000000 50000000")
+    parser.add_argument("--factors", type=int, default=100)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--backend", choices=["surprise", "sgd", "als"], default="sgd")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongodb-uri", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--skip-online", action="store_true", help="Skip the recompute service stages")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--push-messages", type=int, default=2000)
+    parser.add_argument("--push-concurrency", type=int, default=32)
+    parser.add_argument("--recommend-queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", default="pipeline_bench.json", help="JSON file that runs are stored in")
+    parser.add_argument("--compare", help="Label in --output to compare this run against")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for n_ratings in args.ratings:
+        print(f"--- {n_ratings} ratings ---")
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_scale, args=(n_ratings, args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if "error" in result:
+            raise SystemExit(f"The {n_ratings} ratings run failed: {result['error']}")
+        results[str(n_ratings)] = result
+
+    runs = {}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            runs = json.load(f)["runs"]
+    runs[args.label] = {"environment": environment(), "args": vars(args), "scales": results}
+    with open(args.output, "w") as f:
+        json.dump({"runs": runs}, f, indent=2, sort_keys=True, default=str)
+        f.write("\n")
+
+    print(f"{'ratings':>10}{'stage':>26}{'wall s':>10}{'cpu s':>10}{'peak RSS MB':>13}{'rows/sec':>14}{'p99 ms':>9}")
+    for scale, result in results.items():
+        for stage in result["stages"]:
+            print(f"{scale:>10}{('  ' if stage['parent'] else '') + stage['name']:>26}{stage['wall_seconds']:>10.2f}"
+                  f"{stage.get('cpu_seconds', float('nan')):>10.2f}{stage.get('peak_rss_mb', float('nan')):>13.0f}"
+                  f"{stage.get('rows_per_second', float('nan')):>14,.0f}{stage.get('p99_ms', float('nan')):>9.2f}")
+
+    if args.compare:
+        if args.compare not in runs:
+            raise SystemExit(f"No run labelled {args.compare!r} in {args.output}")
+        for scale, result in results.items():
+            previous = runs[args.compare]["scales"].get(scale)
+            if previous:
+                print(f"--- {scale} ratings: {args.compare} -> {args.label} ---")
+                print_diff(diff_reports(previous, result), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
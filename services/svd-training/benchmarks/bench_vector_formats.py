@@ -0,0 +1,87 @@
+"""Compare recipe vector storage formats on a copy of the live recipe vectors.
+
+Each format gets a scratch copy of recipe_vectors and its HNSW index; the
+report gives table and index size, build time, query latency through the
+index, and the overlap of its top-k with exact float32 search for a sample
+of real user vectors:
+
+    DATABASE_URL=postgresql://localhost/recipes python benchmarks/bench_vector_formats.py \\
+        --formats vector halfvec halfvec_index bit_index --k 20
+"""
+import argparse
+import json
+import os
+import sys
+
+import psycopg2 as pg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hnsw_index import HnswSettings, build_hnsw_index, hnsw_report  # noqa: E402
+from vector_formats import VECTOR_FORMATS, column_type  # noqa: E402
+
+SCRATCH_PREFIX = "recipe_vectors_format_bench"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", choices=VECTOR_FORMATS, default=list(VECTOR_FORMATS))
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--maintenance-work-mem")
+    parser.add_argument("--sample", type=int, default=100, help="User vectors to measure overlap with")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    conn = pg.connect(args.database_url)
+    cursor = conn.cursor()
+    cursor.execute("SELECT vector_dims(vector::vector) FROM recipe_vectors LIMIT 1")
+    dimensions = cursor.fetchone()[0]
+    baseline = f"{SCRATCH_PREFIX}_float32"
+    tables = {vector_format: f"{SCRATCH_PREFIX}_{vector_format}" for vector_format in args.formats}
+    for table in [baseline, *tables.values()]:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    # Ground truth is exact search over the float32 vectors
+    cursor.execute(f"CREATE TABLE {baseline} AS SELECT recipe_id, vector::vector({dimensions}) AS vector FROM recipe_vectors")
+    for vector_format, table in tables.items():
+        vector_type = f"{column_type(vector_format)}({dimensions})"
+        cursor.execute(f"CREATE TABLE {table} AS SELECT recipe_id, vector::{vector_type} AS vector FROM {baseline}")
+    conn.commit()
+    cursor.close()
+
+    settings = HnswSettings(m=args.m, ef_construction=args.ef_construction, maintenance_work_mem=args.maintenance_work_mem)
+    results = []
+    try:
+        for vector_format, table in tables.items():
+            index = f"{table}_idx"
+            build_seconds = build_hnsw_index(conn, table, index, settings, vector_format=vector_format, dimensions=dimensions)
+            results.append(hnsw_report(
+                conn, table, index, "user_vectors", settings, build_seconds,
+                sample_size=args.sample, k=args.k, ef_search=args.ef_search,
+                vector_format=vector_format, dimensions=dimensions, exact_table=baseline,
+            ))
+    finally:
+        cursor = conn.cursor()
+        for table in [baseline, *tables.values()]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+        conn.close()
+
+    print(f"{'format':<15}{'table MB':>10}{'index MB':>10}{'build (s)':>11}{'query ms':>10}{'overlap@' + str(args.k):>12}")
+    for result in results:
+        print(f"{result['vector_format']:<15}{result['table_bytes'] / 2**20:>10.1f}{result['index_bytes'] / 2**20:>10.1f}"
+              f"{result['build_seconds']:>11.2f}{result.get('index_query_ms', float('nan')):>10.2f}"
+              f"{result.get('recall_at_k', float('nan')):>12.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "dimensions": dimensions, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
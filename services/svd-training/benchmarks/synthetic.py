@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_ratings(n_ratings, n_users=None, n_recipes=None, n_factors=10, external_fraction=0.5,
+                     zipf_exponent=1.2, seed=0):
+    """Generate a power-law rating dataset shaped like the Food.com reviews.
+
+    User and recipe activity follow a Zipf-like distribution, and ratings come
+    from a hidden low-rank model plus noise, clipped to the 1-5 scale. User IDs
+    are strings, with a share of them in the ext_ (Kaggle) namespace, as in MongoDB.
+    Exactly n_ratings distinct (user, recipe) pairs are returned.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(n_ratings // 20, 10)
+    n_recipes = n_recipes or max(n_ratings // 50, 10)
+    if n_ratings > n_users * n_recipes // 2:
+        raise ValueError(f"{n_ratings} ratings are too dense for {n_users} users x {n_recipes} recipes")
+
+    def power_law_choice(n_items, size):
+        weights = 1.0 / np.arange(1, n_items + 1) ** zipf_exponent
+        weights /= weights.sum()
+        return rng.choice(n_items, size=size, p=weights).astype(np.int32)
+
+    # Popular pairs repeat, so draw until there are n_ratings distinct ones,
+    # keeping them in first-drawn order; each draw is sized by the share of
+    # new pairs the previous one yielded
+    pairs = np.empty(0, dtype=np.int64)
+    new_share = 0.5
+    while len(pairs) < n_ratings:
+        size = int((n_ratings - len(pairs)) / new_share * 1.2) + 1024
+        drawn = power_law_choice(n_users, size).astype(np.int64) * n_recipes + power_law_choice(n_recipes, size)
+        before = len(pairs)
+        pairs = pd.unique(np.concatenate([pairs, drawn]))
+        new_share = max((len(pairs) - before) / size, 0.01)
+    pairs = pairs[:n_ratings]
+    users = (pairs // n_recipes).astype(np.int32)
+    recipes = (pairs % n_recipes).astype(np.int32)
+    del pairs
+
+    user_factors = rng.normal(0, 0.4, (n_users, n_factors)).astype(np.float32)
+    recipe_factors = rng.normal(0, 0.4, (n_recipes, n_factors)).astype(np.float32)
+    user_bias = rng.normal(0, 0.3, n_users).astype(np.float32)
+    recipe_bias = rng.normal(0, 0.3, n_recipes).astype(np.float32)
+
+    ratings = np.empty(n_ratings, dtype=np.float32)
+    chunk = 1_000_000
+    for start in range(0, n_ratings, chunk):
+        u = users[start:start + chunk]
+        i = recipes[start:start + chunk]
+        ratings[start:start + chunk] = (
+            4.2 + user_bias[u] + recipe_bias[i]
+            + np.einsum("ij,ij->i", user_factors[u], recipe_factors[i])
+            + rng.normal(0, 0.5, len(u))
+        )
+    ratings = np.clip(np.rint(ratings), 1, 5).astype(np.float32)
+
+    external = rng.random(n_users) < external_fraction
+    user_labels = np.where(
+        external,
+        np.char.add("ext_", np.arange(1, n_users + 1).astype(str)),
+        np.arange(1, n_users + 1).astype(str),
+    )
+    recipe_labels = np.arange(1, n_recipes + 1).astype(str)
+
+    return pd.DataFrame({
+        "user_id": pd.Categorical.from_codes(users, categories=user_labels),
+        "recipe_id": pd.Categorical.from_codes(recipes, categories=recipe_labels),
+        "rating": ratings,
+    })
+
+
+def train_test_split(ratings_df, test_fraction=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(ratings_df)) < test_fraction
+    return ratings_df[~test].reset_index(drop=True), ratings_df[test].reset_index(drop=True)
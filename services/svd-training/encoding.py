@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+EXTERNAL_USER_PREFIX = "ext_"
+
+
+class EncodedRatings:
+    """Ratings as contiguous int32 user/recipe indices plus reverse-mapping arrays.
+
+    user_ids[i] / recipe_ids[j] hold the original integer ID of user index i and
+    recipe index j. External (Kaggle) users live in their own namespace, flagged
+    by user_is_external, so an external and an internal user may share an ID.
+    """
+
+    def __init__(self, user_idx, recipe_idx, rating, user_ids, user_is_external, recipe_ids):
+        self.user_idx = user_idx
+        self.recipe_idx = recipe_idx
+        self.rating = rating
+        self.user_ids = user_ids
+        self.user_is_external = user_is_external
+        self.recipe_ids = recipe_ids
+
+    def __len__(self):
+        return len(self.rating)
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_recipes(self):
+        return len(self.recipe_ids)
+
+    @property
+    def internal_users(self):
+        return ~self.user_is_external
+
+    def take(self, mask):
+        """Subset of the ratings that keeps the full user/recipe index space."""
+        return EncodedRatings(
+            self.user_idx[mask], self.recipe_idx[mask], self.rating[mask],
+            self.user_ids, self.user_is_external, self.recipe_ids,
+        )
+
+    @property
+    def global_mean(self):
+        return float(self.rating.mean(dtype=np.float64))
+
+
+def factorize_column(values):
+    """Return (codes, labels) for a column, reusing categorical codes when present."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes), values.cat.categories
+    codes, labels = pd.factorize(values)
+    return codes, pd.Index(labels)
+
+
+def parse_id_labels(labels, allow_external=False):
+    """Parse distinct raw ID labels into positive int64 IDs.
+
+    Returns (ids, is_external); labels that are not positive integers
+    (e.g. "", "0", "None", "abc", 1.5) get ID 0.
+    """
+    is_external = np.zeros(len(labels), dtype=bool)
+    if pd.api.types.is_numeric_dtype(labels.dtype):
+        parsed = pd.Series(labels, dtype="float64")
+    else:
+        text = pd.Series(labels, dtype=object).astype(str).str.strip()
+        if allow_external:
+            external = text.str.startswith(EXTERNAL_USER_PREFIX)
+            text = text.where(~external, text.str.slice(len(EXTERNAL_USER_PREFIX)))
+            is_external = external.to_numpy()
+        parsed = pd.to_numeric(text, errors="coerce")
+
+    values = parsed.to_numpy(dtype=np.float64)
+    valid = np.isfinite(values) & (values > 0) & (values == np.floor(values))
+    ids = np.where(valid, values, 0).astype(np.int64)
+    return ids, is_external
+
+
+def encode_ids(codes, label_ids, label_keys, valid_rows):
+    """Dense-encode the labels referenced by valid rows into contiguous int32 indices.
+
+    Different labels with the same key (e.g. 12 and "12") collapse to one index.
+    Returns (row indices for valid rows, key of each index).
+    """
+    used = np.bincount(codes[valid_rows], minlength=len(label_ids)) > 0
+    used &= label_ids > 0
+
+    label_index = np.full(len(label_ids), -1, dtype=np.int64)
+    dense, keys = pd.factorize(label_keys[used])
+    label_index[used] = dense
+    return label_index[codes[valid_rows]].astype(np.int32), np.asarray(keys, dtype=np.int64)
+
+
+def encode_ratings(ratings_df):
+    """Validate and dense-encode a user_id/recipe_id/rating frame.
+
+    ID parsing happens once per distinct label rather than once per row.
+    """
+    user_codes, user_labels = factorize_column(ratings_df["user_id"])
+    recipe_codes, recipe_labels = factorize_column(ratings_df["recipe_id"])
+    user_label_ids, user_label_external = parse_id_labels(user_labels, allow_external=True)
+    recipe_label_ids, _ = parse_id_labels(recipe_labels)
+
+    rating = pd.to_numeric(ratings_df["rating"], errors="coerce").to_numpy(dtype=np.float32)
+
+    valid = (user_codes >= 0) & (recipe_codes >= 0) & np.isfinite(rating)
+    valid[valid] = (user_label_ids[user_codes[valid]] > 0) & (recipe_label_ids[recipe_codes[valid]] > 0)
+
+    # External users are keyed as ~id (negative) so the two namespaces never collide
+    user_label_keys = np.where(user_label_external, ~user_label_ids, user_label_ids)
+    user_idx, user_keys = encode_ids(user_codes, user_label_ids, user_label_keys, valid)
+    recipe_idx, recipe_ids = encode_ids(recipe_codes, recipe_label_ids, recipe_label_ids, valid)
+
+    user_is_external = user_keys < 0
+    user_ids = np.where(user_is_external, ~user_keys, user_keys)
+
+    return EncodedRatings(
+        user_idx=user_idx,
+        recipe_idx=recipe_idx,
+        rating=np.ascontiguousarray(rating[valid]),
+        user_ids=user_ids,
+        user_is_external=user_is_external,
+        recipe_ids=recipe_ids,
+    )
@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+
+from factorization import build_csr, predict
+from recommendations import rated_csr, top_n_recommendations
+
+
+def _mix(x):
+    # splitmix64 finalizer; uint64 arithmetic wraps
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def rating_hash(encoded, seed=0):
+    """A 64-bit hash of every rating's (user, recipe) pair.
+
+    It depends only on the IDs and the seed, not on row order or on which
+    other ratings were extracted, so splits stay stable across extractions.
+    """
+    with np.errstate(over="ignore"):
+        user_keys = (encoded.user_ids.astype(np.uint64) << np.uint64(1)) | encoded.user_is_external.astype(np.uint64)
+        user_hash = _mix(user_keys[encoded.user_idx] + np.uint64(seed))
+        return _mix(user_hash ^ encoded.recipe_ids[encoded.recipe_idx].astype(np.uint64))
+
+
+def fold_assignments(encoded, n_folds, seed=0):
+    """Deterministic fold (0..n_folds-1) of every rating for cross-validation."""
+    return (rating_hash(encoded, seed) % np.uint64(n_folds)).astype(np.uint8)
+
+
+def holdout_mask(encoded, validation_fraction, seed=0):
+    """Deterministic mask of about validation_fraction of the ratings to hold out."""
+    return rating_hash(encoded, seed).astype(np.float64) / 2.0 ** 64 < validation_fraction
+
+
+def holdout_split(encoded, validation_fraction, seed=0):
+    """Deterministic (train, validation) split holding out about validation_fraction of the ratings."""
+    validation = holdout_mask(encoded, validation_fraction, seed)
+    return encoded.take(~validation), encoded.take(validation)
+
+
+def error_metrics(model, validation):
+    """RMSE and MAE of the model's predictions for the validation ratings."""
+    errors = validation.rating - predict(model, validation.user_idx, validation.recipe_idx)
+    return {
+        "rmse": float(np.sqrt(np.mean(np.square(errors, dtype=np.float64)))),
+        "mae": float(np.mean(np.abs(errors, dtype=np.float64))),
+    }
+
+
+def ranking_metrics(model, train, validation, k=10, relevance_threshold=4.0, max_users=10000, seed=0, n_jobs=None):
+    """Precision@k, recall@k and NDCG@k of top-k recommendations against held-out ratings.
+
+    Each evaluated user's recipes are ranked by predicted rating with the
+    recipes they rated in train excluded, as in production; validation
+    ratings of at least relevance_threshold count as relevant. At most
+    max_users users with a relevant validation rating are evaluated, chosen
+    deterministically.
+    """
+    relevant = validation.rating >= relevance_threshold
+    relevant_indptr, relevant_recipes, _ = build_csr(
+        validation.user_idx[relevant], validation.recipe_idx[relevant], validation.rating[relevant], validation.n_users,
+    )
+    users = np.flatnonzero(np.diff(relevant_indptr) > 0)
+    if len(users) > max_users:
+        users = np.sort(np.random.default_rng(seed).choice(users, max_users, replace=False))
+    if not len(users):
+        return {f"precision@{k}": None, f"recall@{k}": None, f"ndcg@{k}": None, "ranked_users": 0}
+
+    train_indptr, train_recipes = rated_csr(train)
+    top, _, _ = top_n_recommendations(
+        model.pu, model.bu, model.qi, model.bi, model.global_mean,
+        train_indptr, train_recipes, users, k, n_jobs=n_jobs,
+    )
+    discounts = 1.0 / np.log2(np.arange(2, top.shape[1] + 2))
+
+    precision = np.empty(len(users))
+    recall = np.empty(len(users))
+    ndcg = np.empty(len(users))
+    for row, user in enumerate(users):
+        targets = relevant_recipes[relevant_indptr[user]:relevant_indptr[user + 1]]
+        hits = np.isin(top[row], targets)
+        precision[row] = hits.sum() / k
+        recall[row] = hits.sum() / len(targets)
+        ndcg[row] = (hits * discounts).sum() / discounts[:min(len(targets), len(discounts))].sum()
+
+    return {
+        f"precision@{k}": float(precision.mean()),
+        f"recall@{k}": float(recall.mean()),
+        f"ndcg@{k}": float(ndcg.mean()),
+        "ranked_users": len(users),
+    }
+
+
+def evaluate(model, train, validation, k=10, relevance_threshold=4.0, max_users=10000, seed=0, n_jobs=None):
+    """Error and ranking metrics of a fitted model on a validation split, with the seconds it took."""
+    start = time.perf_counter()
+    metrics = error_metrics(model, validation)
+    metrics.update(ranking_metrics(model, train, validation, k, relevance_threshold, max_users, seed, n_jobs))
+    metrics["eval_seconds"] = time.perf_counter() - start
+    return metrics
@@ -1,13 +1,26 @@
 from dotenv import load_dotenv
 import os
+import time
+from datetime import datetime, timezone
+from itertools import islice
 from pymongo import MongoClient
+from bson import ObjectId
+import numpy as np
 import pandas as pd
+from profiling import RunProfiler
+from snapshot import HIGH_WATER_MARK_OVERLAP, RatingsColumns, RatingsSnapshot, build_manifest
 
 load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("MONGODB_DATABASE")
 INTERNAL_RATINGS_COLLECTION = os.getenv("MONGODB_REVIEWS_COLLECTION")
 EXTERNAL_RATINGS_COLLECTION = os.getenv("MONGODB_EXTERNAL_REVIEWS_COLLECTION")
+EXTRACT_BATCH_SIZE = int(os.getenv("EXTRACT_BATCH_SIZE", "50000"))
+RATINGS_UPDATED_AT_FIELD = os.getenv("MONGODB_RATINGS_UPDATED_AT_FIELD", "updated_at")
+
+# Only these fields are needed downstream, so everything else stays in MongoDB
+RATING_FIELDS = ['user_id', 'recipe_id', 'rating']
+RATING_PROJECTION = {'_id': 0, 'user_id': 1, 'recipe_id': 1, 'rating': 1}
 
 def connect_to_mongodb():
     try:
@@ -19,9 +32,110 @@ def connect_to_mongodb():
         print(f"Error connecting to MongoDB: {error}")
         return None
 
+class GrowableArray:
+    """Typed append-only buffer that doubles its capacity when full."""
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty(max(int(capacity), 1), dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.empty(max(end, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def to_array(self):
+        if self.size == len(self.data):
+            return self.data
+        # Copy so the unused tail of the buffer can be released
+        return self.data[:self.size].copy()
+
+
+class CategoricalColumnBuilder:
+    """Dictionary-encodes raw ID values into int32 codes as batches arrive."""
+
+    def __init__(self, capacity=1024):
+        self.vocabulary = {}
+        self.codes = GrowableArray(np.int32, capacity)
+
+    def extend(self, values):
+        vocabulary = self.vocabulary
+        # Missing IDs get code -1, which pandas reads back as NaN
+        self.codes.extend([
+            -1 if value is None else vocabulary.setdefault(value, len(vocabulary))
+            for value in values
+        ])
+
+    def to_categorical(self):
+        categories = pd.Index(list(self.vocabulary), dtype=object)
+        return pd.Categorical.from_codes(self.codes.to_array(), categories=categories)
+
+
+class RatingsColumnsBuilder:
+    """Builds compact user_id/recipe_id/rating columns from projected documents.
+
+    With track_ids the 12-byte ObjectIds are kept as well (for snapshots), and
+    the largest value of updated_field seen is recorded as a high-water mark.
+    """
+
+    def __init__(self, capacity=1024, track_ids=False, updated_field=None):
+        self.user_ids = CategoricalColumnBuilder(capacity)
+        self.recipe_ids = CategoricalColumnBuilder(capacity)
+        self.ratings = GrowableArray(np.float32, capacity)
+        self.ids = GrowableArray('S12', capacity) if track_ids else None
+        self.updated_field = updated_field
+        self.max_updated_at = None
+
+        self.projection = dict(RATING_PROJECTION)
+        if track_ids:
+            del self.projection['_id']
+        if updated_field:
+            self.projection[updated_field] = 1
+
+    def __len__(self):
+        return self.ratings.size
+
+    def add_batch(self, documents):
+        self.user_ids.extend([doc.get('user_id') for doc in documents])
+        self.recipe_ids.extend([doc.get('recipe_id') for doc in documents])
+        self.ratings.extend([
+            np.nan if doc.get('rating') is None else doc['rating']
+            for doc in documents
+        ])
+        if self.ids is not None:
+            self.ids.extend([doc['_id'].binary for doc in documents])
+        if self.updated_field:
+            updated = [doc[self.updated_field] for doc in documents if doc.get(self.updated_field)]
+            if updated:
+                batch_max = max(updated)
+                if self.max_updated_at is None or batch_max > self.max_updated_at:
+                    self.max_updated_at = batch_max
+
+    def to_columns(self):
+        return RatingsColumns(
+            self.ids.to_array(),
+            self.user_ids.to_categorical(),
+            self.recipe_ids.to_categorical(),
+            self.ratings.to_array(),
+        )
+
+    def to_dataframe(self):
+        return pd.DataFrame({
+            'user_id': self.user_ids.to_categorical(),
+            'recipe_id': self.recipe_ids.to_categorical(),
+            'rating': self.ratings.to_array(),
+        })
+
+
 class Extract:
-    def __init__(self):
-        self.client = connect_to_mongodb()
+    def __init__(self, profiler=None, client=None):
+        self.client = client or connect_to_mongodb()
+        self.profiler = profiler or RunProfiler()
 
     def get_all_records_from_collection(self, database_name, collection_name):
         try:
@@ -36,7 +150,138 @@ class Extract:
             print(f"Error getting records from collection: {error}")
             return None
 
-    def get_combined_ratings_data(self, database_name, internal_collection_name, external_collection_name):
+    def stream_ratings_from_collection(self, database_name, collection_name, builder,
+                                       batch_size=EXTRACT_BATCH_SIZE, query=None):
+        try:
+            collection = self.client[database_name][collection_name]
+            cursor = collection.find(query or {}, builder.projection, batch_size=batch_size)
+
+            start = time.perf_counter()
+            count = 0
+            with self.profiler.stage(f"stream:{collection_name}") as stage:
+                while True:
+                    batch = list(islice(cursor, batch_size))
+                    if not batch:
+                        break
+                    builder.add_batch(batch)
+                    count += len(batch)
+                stage["rows"] = count
+
+            elapsed = time.perf_counter() - start
+            rate = count / elapsed if elapsed > 0 else 0.0
+            print(f"Streamed {count} records from {collection_name} in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+            return count
+        except Exception as error:
+            print(f"Error streaming records from collection: {error}")
+            return None
+
+    def get_ratings_columns(self, database_name, collection_names, batch_size=EXTRACT_BATCH_SIZE):
+        print("--- Starting Streaming Data Extraction ---")
+
+        # Size the buffers up front from collection metadata to avoid regrowing them
+        db = self.client[database_name]
+        try:
+            capacity = sum(db[name].estimated_document_count() for name in collection_names)
+        except Exception as error:
+            print(f"Could not estimate collection sizes, growing buffers on demand: {error}")
+            capacity = batch_size
+        builder = RatingsColumnsBuilder(capacity)
+
+        start = time.perf_counter()
+        for collection_name in collection_names:
+            if self.stream_ratings_from_collection(database_name, collection_name, builder, batch_size) is None:
+                print(f"Failed to stream ratings from {collection_name}. Aborting.")
+                return None
+
+        ratings_df = builder.to_dataframe()
+        elapsed = time.perf_counter() - start
+        rate = len(ratings_df) / elapsed if elapsed > 0 else 0.0
+        memory_mb = ratings_df.memory_usage(deep=True).sum() / 1024 ** 2
+        print(f"--- Streaming Extraction Complete. Total records: {len(ratings_df)} "
+              f"({rate:,.0f} rows/sec, {memory_mb:.1f} MB) ---")
+        return ratings_df
+
+    def get_document_ids(self, database_name, collection_name, batch_size=EXTRACT_BATCH_SIZE):
+        collection = self.client[database_name][collection_name]
+        ids = GrowableArray('S12', batch_size)
+        cursor = collection.find({}, {'_id': 1}, batch_size=batch_size)
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+            ids.extend([doc['_id'].binary for doc in batch])
+        return ids.to_array()
+
+    def sync_collection_snapshot(self, database_name, collection_name, snapshot,
+                                 full_refresh=False, detect_deletions=False, batch_size=EXTRACT_BATCH_SIZE):
+        existing = None
+        query = None
+        previous_manifest = None
+        # Naive UTC, as pymongo returns stored datetimes
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        if snapshot.exists() and not full_refresh:
+            existing = snapshot.load()
+            previous_manifest = snapshot.read_manifest()
+            max_id, max_updated_at = snapshot.high_water_marks()
+
+            # New documents by ObjectId, changed ones by the updated-at field when writers set it
+            clauses = []
+            if max_id is not None:
+                since = ObjectId(max_id).generation_time - HIGH_WATER_MARK_OVERLAP
+                clauses.append({'_id': {'$gt': ObjectId.from_datetime(since)}})
+            if max_updated_at is not None:
+                clauses.append({RATINGS_UPDATED_AT_FIELD: {'$gte': max_updated_at - HIGH_WATER_MARK_OVERLAP}})
+            if clauses:
+                query = clauses[0] if len(clauses) == 1 else {'$or': clauses}
+            print(f"Syncing snapshot of {collection_name} ({len(existing)} rows) with delta query {query}")
+        else:
+            print(f"Building full snapshot of {collection_name}")
+
+        builder = RatingsColumnsBuilder(batch_size, track_ids=True, updated_field=RATINGS_UPDATED_AT_FIELD)
+        if self.stream_ratings_from_collection(database_name, collection_name, builder, batch_size, query) is None:
+            return None
+        delta = builder.to_columns()
+
+        deleted_ids = None
+        if existing is not None and detect_deletions:
+            live_ids = self.get_document_ids(database_name, collection_name, batch_size)
+            deleted_ids = existing.ids[~np.isin(existing.ids, live_ids)]
+            print(f"Detected {len(deleted_ids)} deleted documents in {collection_name}")
+
+        with self.profiler.stage(f"snapshot_write:{collection_name}") as stage:
+            merged = existing.merge(delta, deleted_ids) if existing is not None else delta
+            manifest = build_manifest(merged, builder.max_updated_at, previous_manifest,
+                                      full_refresh=existing is None, started_at=started_at)
+            manifest = snapshot.write(merged, manifest)
+            stage["rows"] = manifest["rows"]
+        print(f"Snapshot of {collection_name} now has {manifest['rows']} rows "
+              f"({len(delta)} fetched, high-water mark {manifest['max_id']})")
+        return manifest
+
+    def get_snapshot_ratings_data(self, database_name, collection_names, snapshot_dir,
+                                  full_refresh=False, detect_deletions=False, batch_size=EXTRACT_BATCH_SIZE):
+        print("--- Starting Snapshot Data Extraction ---")
+        snapshot = RatingsSnapshot(snapshot_dir)
+        for collection_name in collection_names:
+            manifest = self.sync_collection_snapshot(
+                database_name, collection_name, snapshot.collection(collection_name),
+                full_refresh=full_refresh, detect_deletions=detect_deletions, batch_size=batch_size
+            )
+            if manifest is None:
+                print(f"Failed to sync snapshot for {collection_name}. Aborting.")
+                return None
+
+        ratings_df = snapshot.load_dataframe(collection_names)
+        print(f"--- Snapshot Extraction Complete. Total records: {len(ratings_df)} ---")
+        return ratings_df
+
+    def get_combined_ratings_data(self, database_name, internal_collection_name, external_collection_name,
+                                  streaming=True, batch_size=EXTRACT_BATCH_SIZE):
+        if streaming:
+            return self.get_ratings_columns(
+                database_name, [internal_collection_name, external_collection_name], batch_size
+            )
+
         print("--- Starting Data Extraction ---")
 
         # 1. Get internal ratings from MongoDB
@@ -59,13 +304,12 @@ class Extract:
         combined_df = pd.concat([internal_df, external_df], ignore_index=True)
 
         # 4. Final validation and cleanup
-        required_columns = ['user_id', 'recipe_id', 'rating']
-        if not all(col in combined_df.columns for col in required_columns):
-            print(f"ERROR: Combined DataFrame is missing one of the required columns: {required_columns}")
+        if not all(col in combined_df.columns for col in RATING_FIELDS):
+            print(f"ERROR: Combined DataFrame is missing one of the required columns: {RATING_FIELDS}")
             return None
         
         print(f"--- Data Extraction Complete. Total records: {len(combined_df)} ---")
-        return combined_df[required_columns]
+        return combined_df[RATING_FIELDS]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,367 @@
+import logging
+import time
+from collections import defaultdict
+
+import numba
+import numpy as np
+from surprise import SVD, Trainset
+
+logger = logging.getLogger(__name__)
+
+RATING_SCALE = (1, 5)
+BACKENDS = ("surprise", "sgd", "als")
+
+
+def build_trainset(encoded):
+    """Build a Surprise Trainset whose inner IDs are the encoded user/recipe indices.
+
+    No raw-ID dicts are built: IDs are mapped back through the encoding's
+    reverse-mapping arrays instead of to_raw_uid/to_raw_iid.
+    """
+    ur = defaultdict(list)
+    ir = defaultdict(list)
+    for uid, iid, rating in zip(encoded.user_idx.tolist(), encoded.recipe_idx.tolist(), encoded.rating.tolist()):
+        ur[uid].append((iid, rating))
+        ir[iid].append((uid, rating))
+
+    return Trainset(ur, ir, encoded.n_users, encoded.n_recipes, len(encoded), RATING_SCALE, {}, {})
+
+
+def predict(model, user_idx, recipe_idx, chunk_size=1_000_000):
+    """Vectorized global_mean + bu + bi + p.q for index arrays, in bounded chunks."""
+    predictions = np.empty(len(user_idx), dtype=np.float32)
+    for start in range(0, len(user_idx), chunk_size):
+        u = user_idx[start:start + chunk_size]
+        i = recipe_idx[start:start + chunk_size]
+        predictions[start:start + chunk_size] = (
+            model.global_mean + model.bu[u] + model.bi[i]
+            + np.einsum("ij,ij->i", model.pu[u], model.qi[i])
+        )
+    return predictions
+
+
+def rmse(model, encoded):
+    errors = encoded.rating - predict(model, encoded.user_idx, encoded.recipe_idx)
+    return float(np.sqrt(np.mean(np.square(errors, dtype=np.float64))))
+
+
+class WarmStart:
+    """Previously trained factors for a subset of the encoded users and recipes.
+
+    user_idx/recipe_idx are encoded indices; the matching rows of pu/bu and
+    qi/bi seed those entities, and everything else is initialized randomly.
+    """
+
+    def __init__(self, user_idx, pu, bu, recipe_idx, qi, bi):
+        self.user_idx = user_idx
+        self.pu = pu
+        self.bu = bu
+        self.recipe_idx = recipe_idx
+        self.qi = qi
+        self.bi = bi
+
+
+class FactorModel:
+    """Factor storage and (warm-start aware) initialization shared by the native backends."""
+
+    supports_warm_start = True
+
+    def init_factors(self, n_users, n_recipes, rng):
+        self.pu = rng.normal(0, self.init_std_dev, (n_users, self.n_factors)).astype(np.float32)
+        self.qi = rng.normal(0, self.init_std_dev, (n_recipes, self.n_factors)).astype(np.float32)
+        self.bu = np.zeros(n_users, dtype=np.float32)
+        self.bi = np.zeros(n_recipes, dtype=np.float32)
+
+    def initialize(self, encoded, rng, warm_start=None):
+        self.global_mean = encoded.global_mean
+        self.init_factors(encoded.n_users, encoded.n_recipes, rng)
+        if warm_start is not None:
+            self.pu[warm_start.user_idx] = warm_start.pu
+            self.bu[warm_start.user_idx] = warm_start.bu
+            self.qi[warm_start.recipe_idx] = warm_start.qi
+            self.bi[warm_start.recipe_idx] = warm_start.bi
+            logger.info(f"Warm-started {len(warm_start.user_idx)}/{encoded.n_users} users and "
+                        f"{len(warm_start.recipe_idx)}/{encoded.n_recipes} recipes from previous factors")
+
+
+class SurpriseFactorizer:
+    """surprise.SVD fitted on a Trainset built from the encoded arrays (single-threaded, n_jobs is ignored)."""
+
+    supports_warm_start = False
+
+    def __init__(self, n_factors=100, n_epochs=30, random_state=42, lr_all=0.005, reg_all=0.02,
+                 n_jobs=None, verbose=True):
+        self.n_factors = n_factors
+        self.algo = SVD(
+            n_factors=n_factors,
+            n_epochs=n_epochs,
+            random_state=random_state,
+            lr_all=lr_all,
+            reg_all=reg_all,
+            verbose=verbose,
+        )
+        self.global_mean = None
+
+    def fit(self, encoded, warm_start=None):
+        if warm_start is not None:
+            raise ValueError("The surprise backend cannot be initialized from previous factors")
+        self.algo.fit(build_trainset(encoded))
+        self.global_mean = encoded.global_mean
+        return self
+
+    @property
+    def pu(self):
+        return self.algo.pu
+
+    @property
+    def qi(self):
+        return self.algo.qi
+
+    @property
+    def bu(self):
+        return self.algo.bu
+
+    @property
+    def bi(self):
+        return self.algo.bi
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _sgd_epoch(user_idx, recipe_idx, rating, order, pu, qi, bu, bi, global_mean, lr, reg, n_threads):
+    """One Hogwild epoch: each thread runs plain SGD over its slice of the shuffled order.
+
+    Threads update the shared factor arrays without locks; collisions are rare
+    because each rating touches one user row and one recipe row.
+    """
+    n = len(order)
+    n_factors = pu.shape[1]
+    chunk = (n + n_threads - 1) // n_threads
+    sq_err = np.zeros(n_threads, dtype=np.float64)
+    for t in numba.prange(n_threads):
+        local = 0.0
+        for k in range(t * chunk, min(n, (t + 1) * chunk)):
+            r = order[k]
+            u = user_idx[r]
+            i = recipe_idx[r]
+
+            dot = 0.0
+            for f in range(n_factors):
+                dot += pu[u, f] * qi[i, f]
+            err = rating[r] - (global_mean + bu[u] + bi[i] + dot)
+            local += err * err
+
+            bu[u] += lr * (err - reg * bu[u])
+            bi[i] += lr * (err - reg * bi[i])
+            for f in range(n_factors):
+                puf = pu[u, f]
+                qif = qi[i, f]
+                pu[u, f] += lr * (err * qif - reg * puf)
+                qi[i, f] += lr * (err * puf - reg * qif)
+        sq_err[t] = local
+    return np.sqrt(sq_err.sum() / max(n, 1))
+
+
+class SGDFactorizer(FactorModel):
+    """Multi-threaded (Hogwild) SGD for the same biased MF model as surprise.SVD.
+
+    Works directly on the encoded COO arrays with float32 factors and produces
+    the same pu/qi/bu/bi/global_mean artifacts. With tol > 0 training stops
+    once an epoch improves the train RMSE by less than tol (relative).
+    """
+
+    def __init__(self, n_factors=100, n_epochs=30, random_state=42, lr_all=0.005, reg_all=0.02,
+                 init_std_dev=0.1, tol=0.0, n_jobs=None, verbose=True):
+        self.n_factors = n_factors
+        self.n_epochs = n_epochs
+        self.random_state = random_state
+        self.lr_all = lr_all
+        self.reg_all = reg_all
+        self.init_std_dev = init_std_dev
+        self.tol = tol
+        self.n_jobs = n_jobs or numba.config.NUMBA_NUM_THREADS
+        self.verbose = verbose
+        self.pu = self.qi = self.bu = self.bi = None
+        self.global_mean = None
+
+    def fit(self, encoded, warm_start=None):
+        rng = np.random.default_rng(self.random_state)
+        self.initialize(encoded, rng, warm_start)
+
+        n_threads = min(self.n_jobs, numba.config.NUMBA_NUM_THREADS)
+        numba.set_num_threads(n_threads)
+        previous_rmse = None
+        for epoch in range(self.n_epochs):
+            start = time.perf_counter()
+            order = rng.permutation(len(encoded)).astype(np.int64)
+            train_rmse = _sgd_epoch(
+                encoded.user_idx, encoded.recipe_idx, encoded.rating, order,
+                self.pu, self.qi, self.bu, self.bi,
+                np.float32(self.global_mean), np.float32(self.lr_all), np.float32(self.reg_all), n_threads,
+            )
+            if self.verbose:
+                logger.info(f"SGD epoch {epoch + 1}/{self.n_epochs}: train RMSE {train_rmse:.4f} "
+                            f"({time.perf_counter() - start:.2f}s, {n_threads} threads)")
+
+            if self.tol and previous_rmse is not None and previous_rmse - train_rmse < self.tol * previous_rmse:
+                logger.info(f"SGD stopped early after {epoch + 1} epochs")
+                break
+            previous_rmse = train_rmse
+        return self
+
+
+def build_csr(row_idx, col_idx, values, n_rows):
+    """CSR arrays (indptr, indices, data) grouping ratings by row; duplicates are kept, not summed."""
+    order = np.argsort(row_idx, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_idx, minlength=n_rows), out=indptr[1:])
+    return indptr, np.ascontiguousarray(col_idx[order]), np.ascontiguousarray(values[order])
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _als_half_step(indptr, indices, ratings, fixed_factors, fixed_bias, global_mean,
+                   factors, bias, reg, use_cg, cg_steps):
+    """Re-solve every row's [factors, bias] with the other side held fixed.
+
+    Each row solves (X^T X + reg * n * I) w = X^T y, where X holds the fixed
+    factors of its rated columns with a trailing 1 for the bias term and
+    y = r - global_mean - fixed_bias. The reg * n weighting matches the
+    per-rating regularization of surprise.SVD's objective. Rows are solved
+    in parallel across threads.
+    """
+    n_rows = len(indptr) - 1
+    k = fixed_factors.shape[1]
+    for row in numba.prange(n_rows):
+        start = indptr[row]
+        end = indptr[row + 1]
+        n = end - start
+        if n == 0:
+            continue
+
+        cols = indices[start:end]
+        X = np.ones((n, k + 1))
+        X[:, :k] = fixed_factors[cols]
+        y = np.empty(n)
+        for p in range(n):
+            y[p] = ratings[start + p] - global_mean - fixed_bias[cols[p]]
+        lam = reg * n
+
+        if use_cg:
+            # A few conjugate-gradient steps warm-started from the current solution,
+            # using A v = X^T (X v) + lam * v without ever forming A
+            w = np.empty(k + 1)
+            w[:k] = factors[row]
+            w[k] = bias[row]
+            r = np.dot(X.T, y) - np.dot(X.T, np.dot(X, w)) - lam * w
+            d = r.copy()
+            rs_old = np.dot(r, r)
+            for _ in range(cg_steps):
+                if rs_old < 1e-12:
+                    break
+                Ad = np.dot(X.T, np.dot(X, d)) + lam * d
+                alpha = rs_old / np.dot(d, Ad)
+                w += alpha * d
+                r -= alpha * Ad
+                rs_new = np.dot(r, r)
+                d = r + (rs_new / rs_old) * d
+                rs_old = rs_new
+        else:
+            A = np.dot(X.T, X)
+            for a in range(k + 1):
+                A[a, a] += lam
+            w = np.linalg.solve(A, np.dot(X.T, y))
+
+        for f in range(k):
+            factors[row, f] = w[f]
+        bias[row] = w[k]
+
+
+class ALSFactorizer(FactorModel):
+    """Alternating least squares for the same biased MF model as surprise.SVD.
+
+    Alternates exact (Cholesky-style) or conjugate-gradient solves of the
+    per-user and per-recipe systems over CSR/CSC views of the encoded ratings.
+    Each half-step is parallel across threads, and far fewer passes are needed
+    than with SGD. n_epochs is the maximum number of ALS iterations; training
+    stops early once the relative loss improvement drops below tol.
+    """
+
+    def __init__(self, n_factors=100, n_epochs=15, random_state=42, reg_all=0.02, solver="cg",
+                 cg_steps=3, tol=1e-4, init_std_dev=0.1, n_jobs=None, verbose=True, lr_all=None):
+        if solver not in ("cholesky", "cg"):
+            raise ValueError(f"Unknown ALS solver {solver!r}, expected 'cholesky' or 'cg'")
+        self.n_factors = n_factors
+        self.n_epochs = n_epochs
+        self.random_state = random_state
+        self.reg_all = reg_all
+        self.solver = solver
+        self.cg_steps = cg_steps
+        self.tol = tol
+        self.init_std_dev = init_std_dev
+        self.n_jobs = n_jobs or numba.config.NUMBA_NUM_THREADS
+        self.verbose = verbose
+        self.pu = self.qi = self.bu = self.bi = None
+        self.global_mean = None
+        self.history = []
+
+    def loss(self, encoded):
+        """Squared error plus the per-rating weighted regularization, and the RMSE."""
+        errors = encoded.rating - predict(self, encoded.user_idx, encoded.recipe_idx)
+        sq_error = float(np.sum(np.square(errors, dtype=np.float64)))
+        user_counts = np.bincount(encoded.user_idx, minlength=len(self.bu))
+        recipe_counts = np.bincount(encoded.recipe_idx, minlength=len(self.bi))
+        penalty = self.reg_all * (
+            float(user_counts @ (np.square(self.pu, dtype=np.float64).sum(axis=1) + np.square(self.bu, dtype=np.float64)))
+            + float(recipe_counts @ (np.square(self.qi, dtype=np.float64).sum(axis=1) + np.square(self.bi, dtype=np.float64)))
+        )
+        return sq_error + penalty, float(np.sqrt(sq_error / max(len(encoded), 1)))
+
+    def fit(self, encoded, warm_start=None):
+        rng = np.random.default_rng(self.random_state)
+        self.initialize(encoded, rng, warm_start)
+
+        by_user = build_csr(encoded.user_idx, encoded.recipe_idx, encoded.rating, encoded.n_users)
+        by_recipe = build_csr(encoded.recipe_idx, encoded.user_idx, encoded.rating, encoded.n_recipes)
+
+        n_threads = min(self.n_jobs, numba.config.NUMBA_NUM_THREADS)
+        numba.set_num_threads(n_threads)
+        use_cg = self.solver == "cg"
+        global_mean = float(self.global_mean)
+        previous_loss = None
+        self.history = []
+        for iteration in range(self.n_epochs):
+            start = time.perf_counter()
+            _als_half_step(*by_user, self.qi, self.bi, global_mean, self.pu, self.bu,
+                           self.reg_all, use_cg, self.cg_steps)
+            user_seconds = time.perf_counter() - start
+            _als_half_step(*by_recipe, self.pu, self.bu, global_mean, self.qi, self.bi,
+                           self.reg_all, use_cg, self.cg_steps)
+            elapsed = time.perf_counter() - start
+
+            loss, train_rmse = self.loss(encoded)
+            self.history.append({
+                "iteration": iteration + 1,
+                "seconds": elapsed,
+                "user_seconds": user_seconds,
+                "recipe_seconds": elapsed - user_seconds,
+                "loss": loss,
+                "train_rmse": train_rmse,
+            })
+            if self.verbose:
+                logger.info(f"ALS iteration {iteration + 1}/{self.n_epochs}: loss {loss:.1f}, train RMSE {train_rmse:.4f} "
+                            f"(users {user_seconds:.2f}s, recipes {elapsed - user_seconds:.2f}s, {n_threads} threads)")
+
+            if previous_loss is not None and previous_loss - loss < self.tol * previous_loss:
+                logger.info(f"ALS converged after {iteration + 1} iterations")
+                break
+            previous_loss = loss
+        return self
+
+
+def make_factorizer(backend="surprise", **params):
+    if backend == "surprise":
+        return SurpriseFactorizer(**params)
+    if backend == "sgd":
+        return SGDFactorizer(**params)
+    if backend == "als":
+        return ALSFactorizer(**params)
+    raise ValueError(f"Unknown training backend {backend!r}, expected one of {BACKENDS}")
@@ -0,0 +1,143 @@
+import logging
+import time
+
+from vector_formats import exact_query, index_target, search_query
+
+logger = logging.getLogger(__name__)
+
+
+class HnswSettings:
+    """pgvector HNSW build parameters; a None server setting is left alone."""
+
+    def __init__(self, m=16, ef_construction=64, maintenance_work_mem=None,
+                 max_parallel_maintenance_workers=None, concurrently=False):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.maintenance_work_mem = maintenance_work_mem
+        self.max_parallel_maintenance_workers = max_parallel_maintenance_workers
+        self.concurrently = concurrently
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _set(cursor, name, value, local):
+    if value is not None:
+        cursor.execute("SELECT set_config(%s, %s, %s)", (name, str(value), local))
+
+
+def build_hnsw_index(conn, table, index, settings, vector_format="vector", dimensions=None):
+    """(Re)build the HNSW index of a vector format on table and return the build seconds.
+
+    Without concurrently the old index is dropped and the new one built in one
+    transaction, with maintenance_work_mem and the parallel worker count set
+    for that transaction only. With concurrently the new index is built
+    alongside the old one (CREATE INDEX CONCURRENTLY outside a transaction),
+    then swapped in by drop and rename, so reads keep an index throughout.
+    """
+    expression, opclass = index_target(vector_format, dimensions)
+    build = (
+        f"USING hnsw ({expression} {opclass}) "
+        f"WITH (m = {int(settings.m)}, ef_construction = {int(settings.ef_construction)})"
+    )
+    cursor = None
+    start = time.perf_counter()
+    try:
+        if settings.concurrently:
+            conn.commit()
+            conn.autocommit = True
+            cursor = conn.cursor()
+            _set(cursor, "maintenance_work_mem", settings.maintenance_work_mem, False)
+            _set(cursor, "max_parallel_maintenance_workers", settings.max_parallel_maintenance_workers, False)
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}_new")
+            cursor.execute(f"CREATE INDEX CONCURRENTLY {index}_new ON {table} {build}")
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+            cursor.execute(f"ALTER INDEX {index}_new RENAME TO {index}")
+        else:
+            cursor = conn.cursor()
+            _set(cursor, "maintenance_work_mem", settings.maintenance_work_mem, True)
+            _set(cursor, "max_parallel_maintenance_workers", settings.max_parallel_maintenance_workers, True)
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+            cursor.execute(f"CREATE INDEX {index} ON {table} {build}")
+            conn.commit()
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        if cursor:
+            if settings.concurrently:
+                # Session-level settings outlive a failed build; never leave them raised
+                try:
+                    cursor.execute("RESET maintenance_work_mem")
+                    cursor.execute("RESET max_parallel_maintenance_workers")
+                except Exception as e:
+                    logger.warning(f"Could not reset HNSW build settings: {e}")
+            cursor.close()
+        conn.autocommit = False
+    return time.perf_counter() - start
+
+
+def hnsw_report(conn, table, index, query_table, settings, build_seconds, sample_size=100, k=20, ef_search=None,
+                vector_format="vector", dimensions=None, exact_table=None):
+    """Size, build time and recall@k of an HNSW index against exact search.
+
+    Up to sample_size vectors drawn from query_table (real user vectors) are
+    searched once through the index and once with index scans disabled on
+    exact_table (default: table itself; pass the float4 table to measure a
+    reduced-precision copy against full precision). recall@k is the mean
+    overlap of the two top-k lists.
+    """
+    report = {
+        "table": table,
+        "index": index,
+        "vector_format": vector_format,
+        **settings.as_dict(),
+        "build_seconds": round(build_seconds, 3),
+        "k": k,
+        "ef_search": ef_search,
+    }
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        report["rows"] = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_relation_size(%s::regclass), pg_relation_size(%s::regclass)", (index, table))
+        report["index_bytes"], report["table_bytes"] = cursor.fetchone()
+
+        if sample_size > 0:
+            cursor.execute(f"SELECT vector::text FROM {query_table} ORDER BY random() LIMIT %s", (sample_size,))
+            queries = [row[0] for row in cursor.fetchall()]
+            search = search_query(vector_format, table, dimensions)
+            exact = exact_query(exact_table or table)
+
+            _set(cursor, "hnsw.ef_search", ef_search, True)
+            approximate, index_seconds = [], 0.0
+            for query in queries:
+                start = time.perf_counter()
+                cursor.execute(search, {"query": query, "k": k})
+                approximate.append({row[0] for row in cursor.fetchall()})
+                index_seconds += time.perf_counter() - start
+
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            overlaps, exact_seconds = [], 0.0
+            for query, found in zip(queries, approximate):
+                start = time.perf_counter()
+                cursor.execute(exact, {"query": query, "k": k})
+                expected = {row[0] for row in cursor.fetchall()}
+                exact_seconds += time.perf_counter() - start
+                overlaps.append(len(found & expected) / max(len(expected), 1))
+
+            report["sample_size"] = len(queries)
+            report["recall_at_k"] = round(sum(overlaps) / max(len(overlaps), 1), 4)
+            report["index_query_ms"] = round(index_seconds / max(len(queries), 1) * 1000, 3)
+            report["exact_query_ms"] = round(exact_seconds / max(len(queries), 1) * 1000, 3)
+        conn.rollback()
+    except Exception as e:
+        logger.error(f"Failed to build HNSW report for {index}: {e}")
+        conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+    return report
@@ -0,0 +1,133 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# Layout: magic, little-endian uint32 header length, JSON header padded to
+# ALIGNMENT, then each array at an ALIGNMENT-aligned offset recorded in the
+# header. Rows are sorted by ID so lookups are a searchsorted away.
+MAGIC = b"RSMODEL1"
+# Bump on any change to the header or arrays; services/recompute/model_artifact.py
+# reads only the version it was written for
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ARRAY_DTYPES = {
+    "user_ids": "<i8",
+    "user_factors": "<f4",
+    "user_bias": "<f4",
+    "recipe_ids": "<i8",
+    "recipe_factors": "<f4",
+    "recipe_bias": "<f4",
+}
+
+
+def artifact_path(root, version):
+    """Where the artifact of a model version lives under a local directory or bucket prefix."""
+    return f"{root.rstrip('/')}/v{int(version)}/model.bin"
+
+
+def run_report_path(root, version):
+    """Where the training run report of a model version lives, next to its artifact."""
+    return f"{root.rstrip('/')}/v{int(version)}/run_report.json"
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_model_artifact(path, version, global_mean, user_ids, user_factors, user_bias,
+                         recipe_ids, recipe_factors, recipe_bias, metadata=None):
+    """Write a model as one memory-mappable file and return its size in bytes.
+
+    The file is written next to path and renamed into place, so readers
+    never see a partial artifact.
+    """
+    user_order = np.argsort(user_ids, kind="stable")
+    recipe_order = np.argsort(recipe_ids, kind="stable")
+    arrays = {
+        "user_ids": user_ids[user_order],
+        "user_factors": user_factors[user_order],
+        "user_bias": user_bias[user_order],
+        "recipe_ids": recipe_ids[recipe_order],
+        "recipe_factors": recipe_factors[recipe_order],
+        "recipe_bias": recipe_bias[recipe_order],
+    }
+    arrays = {name: np.ascontiguousarray(array, dtype=ARRAY_DTYPES[name]) for name, array in arrays.items()}
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "version": int(version),
+        "global_mean": float(global_mean),
+        "n_factors": int(arrays["recipe_factors"].shape[1]),
+        "n_users": len(arrays["user_ids"]),
+        "n_recipes": len(arrays["recipe_ids"]),
+        "metadata": metadata or {},
+        "arrays": {},
+    }
+    # Offsets depend on the header length, which depends on the offsets; reserve
+    # room by sizing the header with placeholder offsets of the final width
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": ARRAY_DTYPES[name], "shape": list(array.shape), "offset": 10 ** 15}
+    data_start = _aligned(len(MAGIC) + 4 + len(json.dumps(header).encode()))
+    offset = data_start
+    for name, array in arrays.items():
+        header["arrays"][name]["offset"] = offset
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return offset
+
+
+class ModelArtifact:
+    """A model artifact opened with every array memory-mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a model artifact")
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length))
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has artifact format version {header.get('format_version')}, expected {FORMAT_VERSION}"
+            )
+
+        self.path = path
+        self.version = header["version"]
+        self.global_mean = header["global_mean"]
+        self.n_factors = header["n_factors"]
+        self.metadata = header["metadata"]
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if 0 in shape:
+                # mmap cannot map zero bytes
+                array = np.empty(shape, dtype=spec["dtype"])
+            else:
+                array = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+            setattr(self, name, array)
+
+    def user_rows(self, ids):
+        """Row index of each user ID, or -1 where the artifact has no such user."""
+        return _lookup(self.user_ids, ids)
+
+    def recipe_rows(self, ids):
+        """Row index of each recipe ID, or -1 where the artifact has no such recipe."""
+        return _lookup(self.recipe_ids, ids)
+
+
+def _lookup(sorted_ids, ids):
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[rows] == ids, rows, -1)
@@ -0,0 +1,173 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MODEL_RETENTION = int(os.getenv("MODEL_RETENTION", "3"))
+SWAP_LOCK_TIMEOUT = os.getenv("SWAP_LOCK_TIMEOUT", "10s")
+
+
+def recipe_table(version):
+    return f"recipe_vectors_v{int(version)}"
+
+
+def user_table(version):
+    return f"user_vectors_v{int(version)}"
+
+
+class ModelVersionStore:
+    """Model generations recorded in svd_metadata with an atomically flipped active version.
+
+    Every training run gets a new svd_metadata row (its id is the version) and
+    publishes into its own recipe_vectors_v<N> and user_vectors_v<N> tables.
+    Activation renames recipe_vectors_v<N> to recipe_vectors, merges
+    user_vectors_v<N> into user_vectors and flips is_active in one
+    transaction, so readers never see vectors from one generation with the
+    global mean of another. The outgoing recipe table is kept as
+    recipe_vectors_v<M> so older generations can be re-activated until they
+    fall out of the retention window.
+    """
+
+    def __init__(self, postgres_client, retention=MODEL_RETENTION, lock_timeout=SWAP_LOCK_TIMEOUT):
+        self.postgres_client = postgres_client
+        self.retention = max(int(retention), 1)
+        self.lock_timeout = lock_timeout
+
+    def _run(self, description, work):
+        cursor = None
+        try:
+            cursor = self.postgres_client.cursor()
+            result = work(cursor)
+            self.postgres_client.commit()
+            return result
+        except Exception as e:
+            logger.error(f"Failed to {description}: {e}")
+            if self.postgres_client:
+                self.postgres_client.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    @staticmethod
+    def _active_version(cursor):
+        cursor.execute("SELECT id FROM svd_metadata WHERE is_active")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def active_version(self):
+        return self._run("read the active model version", self._active_version)
+
+    def begin_version(self, global_mean, stats):
+        """Register a new generation in the building state and return its version."""
+        def work(cursor):
+            cursor.execute(
+                """
+                INSERT INTO svd_metadata (
+                    completion_time, global_mean, status, is_active, backend, n_factors,
+                    n_ratings, n_users, n_recipes, training_seconds, rmse, vector_format
+                )
+                VALUES (NOW(), %s, 'building', false, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """,
+                (
+                    float(global_mean), stats.get("backend"), stats.get("n_factors"),
+                    stats.get("n_ratings"), stats.get("n_users"), stats.get("n_recipes"),
+                    stats.get("training_seconds"), stats.get("rmse"), stats.get("vector_format", "vector"),
+                ),
+            )
+            return cursor.fetchone()[0]
+
+        version = self._run("register a new model version", work)
+        logger.info(f"Registered model version {version}")
+        return version
+
+    def activate(self, version):
+        """Swap in the given generation and make it the active version in a single transaction."""
+        def work(cursor):
+            cursor.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+            cursor.execute("SELECT status FROM svd_metadata WHERE id = %s FOR UPDATE", (version,))
+            row = cursor.fetchone()
+            if row is None or row[0] not in ("building", "retired"):
+                raise ValueError(f"Model version {version} cannot be activated (status {row[0] if row else 'missing'})")
+
+            previous = self._active_version(cursor)
+            if previous == version:
+                return previous
+
+            staged = recipe_table(version)
+            if previous is not None:
+                archived = recipe_table(previous)
+                cursor.execute(f"ALTER TABLE recipe_vectors RENAME TO {archived}")
+                cursor.execute(f"ALTER INDEX IF EXISTS recipe_vectors_pkey RENAME TO {archived}_pkey")
+                cursor.execute(f"ALTER INDEX IF EXISTS recipe_hnsw_idx RENAME TO {archived}_hnsw_idx")
+            else:
+                cursor.execute("DROP TABLE recipe_vectors")
+            cursor.execute(f"ALTER TABLE {staged} RENAME TO recipe_vectors")
+            cursor.execute(f"ALTER INDEX {staged}_pkey RENAME TO recipe_vectors_pkey")
+            cursor.execute(f"ALTER INDEX {staged}_hnsw_idx RENAME TO recipe_hnsw_idx")
+
+            cursor.execute(f"""
+                INSERT INTO user_vectors (user_id, vector, bias, updated_at)
+                SELECT user_id, vector, bias, NOW() FROM {user_table(version)}
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    vector = EXCLUDED.vector,
+                    bias = EXCLUDED.bias,
+                    revision = user_vectors.revision + 1,
+                    updated_at = NOW()
+            """)
+            logger.info(f"Merged {cursor.rowcount} user vectors from {user_table(version)}")
+
+            cursor.execute(
+                "UPDATE svd_metadata SET is_active = false, status = 'retired' WHERE is_active"
+            )
+            cursor.execute(
+                """
+                UPDATE svd_metadata
+                SET is_active = true, status = 'active', activated_at = NOW()
+                WHERE id = %s
+                """,
+                (version,),
+            )
+            return previous
+
+        previous = self._run(f"activate model version {version}", work)
+        logger.info(f"Activated model version {version} (previous active version: {previous})")
+        return previous
+
+    def mark_failed(self, version):
+        def work(cursor):
+            cursor.execute("UPDATE svd_metadata SET status = 'failed' WHERE id = %s AND NOT is_active", (version,))
+            cursor.execute(f"DROP TABLE IF EXISTS {recipe_table(version)}")
+            cursor.execute(f"DROP TABLE IF EXISTS {user_table(version)}")
+            cursor.execute("DELETE FROM user_recommendations WHERE model_version = %s", (version,))
+
+        self._run(f"mark model version {version} as failed", work)
+        logger.info(f"Marked model version {version} as failed and dropped its tables")
+
+    def collect_garbage(self):
+        """Drop the tables of retired generations beyond the retention window (active included)."""
+        def work(cursor):
+            cursor.execute(
+                """
+                SELECT id FROM svd_metadata
+                WHERE status = 'retired'
+                ORDER BY id DESC
+                OFFSET %s
+                """,
+                (self.retention - 1,),
+            )
+            expired = [row[0] for row in cursor.fetchall()]
+            for version in expired:
+                cursor.execute(f"DROP TABLE IF EXISTS {recipe_table(version)}")
+                cursor.execute(f"DROP TABLE IF EXISTS {user_table(version)}")
+            if expired:
+                cursor.execute("DELETE FROM user_recommendations WHERE model_version = ANY(%s)", (expired,))
+                cursor.execute("UPDATE svd_metadata SET status = 'collected' WHERE id = ANY(%s)", (expired,))
+            return expired
+
+        expired = self._run("garbage-collect old model versions", work)
+        if expired:
+            logger.info(f"Garbage-collected model versions {expired} (retention {self.retention})")
+        return expired
@@ -0,0 +1,237 @@
+"""Stage-level profiling of the training job and diffs between run reports.
+
+Every stage records wall time, CPU time (all threads of the process), the
+process peak RSS and how much the stage raised it, and rows/sec when the
+stage reports a row count. Stages nest; a nested stage names its parent.
+With cprofile and/or tracemalloc enabled, the outermost profiled stages also
+get a .prof file and their top functions or allocation sites.
+
+Compare two run reports stage by stage:
+
+    python profiling.py runs/v41/run_report.json runs/v42/run_report.json --threshold 10
+"""
+import argparse
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "tracemalloc")
+# Stage fields compared by diff_reports, and whether an increase is a regression
+DIFF_FIELDS = {
+    "wall_seconds": True,
+    "cpu_seconds": True,
+    "peak_rss_increase_mb": True,
+    "rows_per_second": False,
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunProfiler:
+    """Collects per-stage measurements of one run into a JSON-serializable report."""
+
+    def __init__(self, modes=(), profile_dir=None, top=25):
+        for mode in modes:
+            if mode not in PROFILE_MODES:
+                raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.modes = set(modes)
+        self.profile_dir = profile_dir
+        self.top = top
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.start = time.perf_counter()
+        self.stages = []
+        self._open = []
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Measure the block as a stage; set record["rows"] inside it when the count is known then."""
+        record = {"name": name, "parent": self._open[-1]["name"] if self._open else None, "rows": rows}
+        self._open.append(record)
+        # Only one cProfile/tracemalloc capture at a time; nested stages are covered by their parent's
+        profile = bool(self.modes) and not self._profiling
+        profiler = None
+        if profile:
+            self._profiling = True
+            if "tracemalloc" in self.modes:
+                tracemalloc.start()
+                before = tracemalloc.take_snapshot()
+            if "cprofile" in self.modes:
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+        rss_before = peak_rss_mb()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+            record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+            record["peak_rss_increase_mb"] = round(max(record["peak_rss_mb"] - rss_before, 0.0), 1)
+            if record["rows"]:
+                record["rows_per_second"] = round(record["rows"] / max(record["wall_seconds"], 1e-9), 1)
+            if profile:
+                if profiler:
+                    profiler.disable()
+                    record["cprofile"] = self._cprofile_summary(name, profiler)
+                if "tracemalloc" in self.modes:
+                    record["tracemalloc"] = self._tracemalloc_summary(before)
+                    tracemalloc.stop()
+                self._profiling = False
+            self._open.pop()
+            self.stages.append(record)
+            logger.info(
+                f"Stage {name}: {record['wall_seconds']:.2f}s wall, {record['cpu_seconds']:.2f}s CPU, "
+                f"peak RSS {record['peak_rss_mb']:.0f} MB (+{record['peak_rss_increase_mb']:.0f} MB)"
+                + (f", {record['rows_per_second']:,.0f} rows/sec" if record["rows"] else "")
+            )
+
+    def _cprofile_summary(self, name, profiler):
+        summary = {}
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            summary["path"] = os.path.join(self.profile_dir, f"{name}.prof")
+            profiler.dump_stats(summary["path"])
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(self.top)
+        summary["top"] = [line for line in output.getvalue().splitlines() if line.strip()]
+        return summary
+
+    def _tracemalloc_summary(self, before):
+        _, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        return {
+            "traced_peak_mb": round(peak / 2**20, 1),
+            "top": [str(stat) for stat in stats[:self.top]],
+        }
+
+    def report(self, **fields):
+        """The run report: run fields, totals and every finished stage in completion order."""
+        return {
+            "started_at": self.started_at,
+            "wall_seconds": round(time.perf_counter() - self.start, 4),
+            "cpu_seconds": round(time.process_time(), 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "profile_modes": sorted(self.modes),
+            **fields,
+            "stages": self.stages,
+        }
+
+    def write(self, path, **fields):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(**fields), f, indent=2, default=str)
+        return path
+
+
+def diff_reports(old, new):
+    """Per-stage changes of the DIFF_FIELDS between two run reports.
+
+    Stages are matched by (parent, name); a stage run more than once in a
+    report (e.g. once per collection) is matched by occurrence.
+    """
+    def keyed(report):
+        stages, seen = {}, {}
+        for stage in report["stages"]:
+            key = (stage.get("parent"), stage["name"])
+            seen[key] = seen.get(key, 0) + 1
+            stages[key + (seen[key],)] = stage
+        return stages
+
+    old_stages, new_stages = keyed(old), keyed(new)
+    rows = []
+    for key in list(old_stages) + [key for key in new_stages if key not in old_stages]:
+        before, after = old_stages.get(key), new_stages.get(key)
+        row = {"stage": key[1] if key[2] == 1 else f"{key[1]}#{key[2]}", "parent": key[0]}
+        for field, increase_is_worse in DIFF_FIELDS.items():
+            a = before.get(field) if before else None
+            b = after.get(field) if after else None
+            change = None
+            if a is not None and b is not None and a != 0:
+                change = (b - a) / abs(a) * 100
+            row[field] = {"old": a, "new": b, "change_percent": change}
+            row[f"{field}_regressed"] = change is not None and (change > 0 if increase_is_worse else change < 0)
+        rows.append(row)
+    return rows
+
+
+def _cell(values, digits):
+    if values["old"] is None or values["new"] is None:
+        return f"{'-' if values['old'] is None else values['old']} -> {'-' if values['new'] is None else values['new']}"
+    change = "" if values["change_percent"] is None else f" ({values['change_percent']:+.0f}%)"
+    return f"{values['old']:.{digits}f} -> {values['new']:.{digits}f}{change}"
+
+
+def print_diff(rows, threshold=10.0, min_seconds=1.0):
+    """Print diff_reports rows as a table and return how many changes for the worse exceed threshold percent.
+
+    Stages shorter than min_seconds in both runs are never flagged.
+    """
+    regressions = 0
+    print(f"{'stage':<32}{'wall s':>26}{'cpu s':>26}{'peak RSS +MB':>26}{'rows/sec':>30}")
+    for row in rows:
+        flagged = []
+        if max(row["wall_seconds"]["old"] or 0, row["wall_seconds"]["new"] or 0) >= min_seconds:
+            flagged = [
+                field for field in DIFF_FIELDS
+                if row[f"{field}_regressed"] and abs(row[field]["change_percent"]) > threshold
+            ]
+        regressions += len(flagged)
+        name = ("  " if row["parent"] else "") + row["stage"]
+        print(f"{name:<32}{_cell(row['wall_seconds'], 2):>26}{_cell(row['cpu_seconds'], 2):>26}"
+              f"{_cell(row['peak_rss_increase_mb'], 0):>26}{_cell(row['rows_per_second'], 0):>30}"
+              + (f"  REGRESSED: {', '.join(flagged)}" if flagged else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Flag changes for the worse larger than this many percent")
+    parser.add_argument("--min-seconds", type=float, default=1.0,
+                        help="Do not flag stages shorter than this in both runs; their timings are mostly noise")
+    parser.add_argument("--output", help="Optional JSON file for the diff")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = diff_reports(old, new)
+
+    regressions = print_diff(rows, args.threshold, args.min_seconds)
+    print(f"Total wall time {old.get('wall_seconds', 0):.1f}s -> {new.get('wall_seconds', 0):.1f}s, "
+          f"{regressions} regression(s) beyond {args.threshold:.0f}%")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "stages": rows}, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
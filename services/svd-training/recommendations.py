@@ -0,0 +1,92 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from factorization import build_csr
+
+
+def rated_csr(encoded):
+    """CSR (indptr, recipe indices) of the recipes every user index has rated."""
+    indptr, indices, _ = build_csr(encoded.user_idx, encoded.recipe_idx, encoded.rating, encoded.n_users)
+    return indptr, indices
+
+
+def top_n_block(user_factors, user_bias, recipe_factors, recipe_bias, global_mean, indptr, indices, users, n):
+    """Top-n unrated recipe indices and predicted ratings for one block of user indices.
+
+    Scores the block against every recipe with one matrix multiply, masks the
+    recipes each user has rated, and selects with argpartition before sorting
+    only the n survivors. Rows with fewer than n unrated recipes are padded
+    with index -1.
+    """
+    scores = user_factors[users] @ recipe_factors.T
+    scores += recipe_bias
+
+    starts, ends = indptr[users], indptr[users + 1]
+    counts = ends - starts
+    if counts.sum():
+        rows = np.repeat(np.arange(len(users)), counts)
+        columns = np.concatenate([indices[start:end] for start, end in zip(starts, ends)])
+        scores[rows, columns] = -np.inf
+
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    unrated = np.isfinite(top_scores)
+    top[~unrated] = -1
+    top_scores = np.where(unrated, top_scores + (global_mean + user_bias[users])[:, None], 0.0)
+    return top, top_scores.astype(np.float32)
+
+
+def top_n_recommendations(user_factors, user_bias, recipe_factors, recipe_bias, global_mean,
+                          indptr, indices, users, n, block_size=1024, n_jobs=1):
+    """Top-n unrated recipes (as recipe indices) and predicted ratings for the given user indices.
+
+    Users are scored in blocks of block_size, so each in-flight block holds a
+    block_size x n_recipes float32 score matrix, its negated copy and
+    argpartition's int64 index matrix of the same shape; with n_jobs blocks
+    scored concurrently (NumPy releases the GIL in the multiply and the
+    partition) peak memory is about n_jobs * block_size * n_recipes * 16 bytes.
+    n_jobs defaults to one block at a time, since the multiply already runs on
+    every BLAS thread.
+    Returns (recipe indices, scores, seconds).
+    """
+    start = time.perf_counter()
+    n = min(n, recipe_factors.shape[0])
+    user_factors = np.ascontiguousarray(user_factors, dtype=np.float32)
+    recipe_factors = np.ascontiguousarray(recipe_factors, dtype=np.float32)
+    recipe_bias = np.asarray(recipe_bias, dtype=np.float32)
+    user_bias = np.asarray(user_bias, dtype=np.float32)
+    users = np.asarray(users, dtype=np.int64)
+
+    top = np.empty((len(users), n), dtype=np.int32)
+    top_scores = np.empty((len(users), n), dtype=np.float32)
+
+    def score_block(block_start):
+        block = slice(block_start, block_start + block_size)
+        top[block], top_scores[block] = top_n_block(
+            user_factors, user_bias, recipe_factors, recipe_bias, global_mean, indptr, indices, users[block], n,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(n_jobs or 1, 1)) as executor:
+        list(executor.map(score_block, range(0, len(users), block_size)))
+    return top, top_scores, time.perf_counter() - start
+
+
+def encode_recommendation_rows(version, user_ids, recipe_ids, scores):
+    """COPY text rows of (model_version, user_id, recipe_ids[], scores[]), skipping -1 padding."""
+    buffer = io.StringIO()
+    for user_id, row_ids, row_scores in zip(user_ids.tolist(), recipe_ids.tolist(), scores.tolist()):
+        kept = [(recipe_id, score) for recipe_id, score in zip(row_ids, row_scores) if recipe_id >= 0]
+        if not kept:
+            continue
+        ids_text = ",".join(str(recipe_id) for recipe_id, _ in kept)
+        scores_text = ",".join(f"{score:.4f}" for _, score in kept)
+        buffer.write(f"{version}\t{user_id}\t{{{ids_text}}}\t{{{scores_text}}}\n")
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,194 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+MANIFEST_FILE = "manifest.json"
+ID_DTYPE = "S12"
+
+# Re-read a small window behind the high-water marks so writes that committed
+# out of order are still picked up; duplicates are collapsed by _id on merge
+HIGH_WATER_MARK_OVERLAP = timedelta(minutes=5)
+
+
+def normalize_categorical(values):
+    """Return a categorical over string IDs, merging e.g. 12 and "12"."""
+    names = values.categories.astype(str)
+    if not names.has_duplicates:
+        return values.rename_categories(names)
+
+    uniques, inverse = np.unique(np.asarray(names), return_inverse=True)
+    codes = np.where(values.codes >= 0, inverse[values.codes], -1)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+
+class RatingsColumns:
+    """Rating rows of one collection keyed by their 12-byte ObjectId."""
+
+    def __init__(self, ids, user_id, recipe_id, rating):
+        self.ids = ids
+        self.user_id = normalize_categorical(user_id)
+        self.recipe_id = normalize_categorical(recipe_id)
+        self.rating = rating
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, mask):
+        return RatingsColumns(self.ids[mask], self.user_id[mask], self.recipe_id[mask], self.rating[mask])
+
+    def merge(self, delta, deleted_ids=None):
+        """Replace rows that reappear in delta, drop deleted rows and append the rest."""
+        keep = ~np.isin(self.ids, delta.ids)
+        if deleted_ids is not None and len(deleted_ids):
+            keep &= ~np.isin(self.ids, deleted_ids)
+        kept = self.take(keep)
+
+        return RatingsColumns(
+            np.concatenate([kept.ids, delta.ids]),
+            union_categoricals([kept.user_id, delta.user_id]),
+            union_categoricals([kept.recipe_id, delta.recipe_id]),
+            np.concatenate([kept.rating, delta.rating]),
+        )
+
+    def to_dataframe(self):
+        return pd.DataFrame({
+            'user_id': self.user_id,
+            'recipe_id': self.recipe_id,
+            'rating': self.rating,
+        })
+
+
+class CollectionSnapshot:
+    """Columnar on-disk copy of one ratings collection stored as .npy files.
+
+    Each write goes to a new generation of files and then atomically replaces
+    the manifest, so a crash mid-write leaves the previous snapshot readable.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self):
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _path(self, generation, name):
+        return os.path.join(self.directory, f"{generation}_{name}.npy")
+
+    def load(self, mmap=True):
+        manifest = self.read_manifest()
+        generation = manifest["generation"]
+        mmap_mode = "r" if mmap else None
+
+        def column(prefix):
+            codes = np.load(self._path(generation, f"{prefix}_codes"), mmap_mode=mmap_mode)
+            categories = np.load(self._path(generation, f"{prefix}_categories"))
+            return pd.Categorical.from_codes(codes, categories=categories)
+
+        return RatingsColumns(
+            np.load(self._path(generation, "ids"), mmap_mode=mmap_mode),
+            column("user_id"),
+            column("recipe_id"),
+            np.load(self._path(generation, "rating"), mmap_mode=mmap_mode),
+        )
+
+    def write(self, columns, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self.read_manifest()["generation"] if self.exists() else None
+        generation = f"{int(time.time() * 1000):x}"
+
+        arrays = {
+            "ids": np.asarray(columns.ids, dtype=ID_DTYPE),
+            "user_id_codes": np.asarray(columns.user_id.codes, dtype=np.int32),
+            "user_id_categories": np.asarray(columns.user_id.categories, dtype=str),
+            "recipe_id_codes": np.asarray(columns.recipe_id.codes, dtype=np.int32),
+            "recipe_id_categories": np.asarray(columns.recipe_id.categories, dtype=str),
+            "rating": np.asarray(columns.rating, dtype=np.float32),
+        }
+        for name, array in arrays.items():
+            np.save(self._path(generation, name), array)
+
+        manifest = {**manifest, "generation": generation, "rows": len(columns)}
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+        if previous and previous != generation:
+            for name in arrays:
+                try:
+                    os.remove(self._path(previous, name))
+                except FileNotFoundError:
+                    pass
+        return manifest
+
+    def high_water_marks(self):
+        """Return (max ObjectId bytes, max updated-at datetime) recorded by the last sync."""
+        manifest = self.read_manifest()
+        max_id = bytes.fromhex(manifest["max_id"]) if manifest.get("max_id") else None
+        max_updated_at = manifest.get("max_updated_at")
+        if max_updated_at:
+            max_updated_at = datetime.fromisoformat(max_updated_at)
+        return max_id, max_updated_at
+
+
+class RatingsSnapshot:
+    """Snapshot directory holding one CollectionSnapshot per MongoDB collection."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def collection(self, collection_name):
+        return CollectionSnapshot(os.path.join(self.directory, collection_name))
+
+    def load_dataframe(self, collection_names, mmap=True):
+        """Load the combined ratings of the given collections without touching MongoDB."""
+        parts = []
+        for name in collection_names:
+            snapshot = self.collection(name)
+            if not snapshot.exists():
+                raise FileNotFoundError(f"No snapshot found for collection {name} in {self.directory}")
+            parts.append(snapshot.load(mmap=mmap))
+
+        return pd.DataFrame({
+            'user_id': union_categoricals([part.user_id for part in parts]),
+            'recipe_id': union_categoricals([part.recipe_id for part in parts]),
+            'rating': np.concatenate([part.rating for part in parts]),
+        })
+
+
+def max_object_id(ids):
+    """Largest ObjectId in an S12 array, compared as big-endian (timestamp, rest)."""
+    if not len(ids):
+        return None
+    parts = np.ascontiguousarray(ids, dtype=ID_DTYPE).view([('time', '>u4'), ('rest', '>u8')])
+    latest = parts['time'].max()
+    rest = parts['rest'][parts['time'] == latest].max()
+    return int(latest).to_bytes(4, 'big') + int(rest).to_bytes(8, 'big')
+
+
+def build_manifest(columns, max_updated_at, previous=None, full_refresh=False, started_at=None):
+    """Manifest for a sync; started_at is the updated-at watermark until a document carries one."""
+    now = datetime.now(timezone.utc).isoformat()
+    previous = previous or {}
+    max_id = max_object_id(columns.ids)
+    if max_updated_at is None and previous.get("max_updated_at"):
+        max_updated_at = datetime.fromisoformat(previous["max_updated_at"])
+    if max_updated_at is None:
+        # Any edit stamped after the extraction started is newer than this snapshot
+        max_updated_at = started_at
+    return {
+        "max_id": max_id.hex() if max_id is not None else None,
+        "max_updated_at": max_updated_at.isoformat() if max_updated_at else None,
+        "synced_at": now,
+        "full_refresh_at": now if full_refresh else previous.get("full_refresh_at"),
+    }
@@ -1,13 +1,29 @@
 import os
+import json
 import logging
+import time
 from dotenv import load_dotenv
 import psycopg2 as pg
 from google.cloud import storage
 from datetime import datetime
-from surprise import SVD, Dataset, Reader
+from encoding import encode_ratings
+from evaluation import evaluate, holdout_split
 from extract import Extract
+from factorization import WarmStart, make_factorizer, rmse
+from model_artifact import artifact_path, run_report_path, write_model_artifact
+from model_versions import ModelVersionStore, recipe_table, user_table
+from profiling import RunProfiler
+from hnsw_index import HnswSettings, build_hnsw_index, hnsw_report
+from recommendations import encode_recommendation_rows, rated_csr, top_n_recommendations
+from snapshot import RatingsSnapshot
+from vector_formats import VECTOR_DIMENSIONS, check_format, column_type
+from vector_io import copy_vectors_in, copy_vectors_out, log_copy_stats, parse_vector_rows
 from google.auth.transport.requests import Request
-import psycopg2.extras
+from google.oauth2 import id_token
+from urllib.parse import urlsplit
+import requests
+import numpy as np
+import pandas as pd
 
 # Configure logging
 logging.basicConfig(
@@ -22,31 +38,107 @@ DB_NAME = os.getenv("MONGODB_DATABASE")
 INTERNAL_RATINGS_COLLECTION = os.getenv("MONGODB_REVIEWS_COLLECTION")
 EXTERNAL_RATINGS_COLLECTION = os.getenv("MONGODB_EXTERNAL_REVIEWS_COLLECTION")
 RELOAD_URL = os.getenv("RELOAD_URL")
+RELOAD_TIMEOUT = float(os.getenv("RELOAD_TIMEOUT", "120"))
+RATINGS_SNAPSHOT_DIR = os.getenv("RATINGS_SNAPSHOT_DIR")
+SNAPSHOT_FULL_REFRESH = os.getenv("SNAPSHOT_FULL_REFRESH", "false").lower() == "true"
+SNAPSHOT_DETECT_DELETIONS = os.getenv("SNAPSHOT_DETECT_DELETIONS", "false").lower() == "true"
+SNAPSHOT_OFFLINE = os.getenv("SNAPSHOT_OFFLINE", "false").lower() == "true"
+TRAINING_BACKEND = os.getenv("TRAINING_BACKEND", "surprise")
+TRAINING_JOBS = int(os.getenv("TRAINING_JOBS", "0")) or None
+ALS_SOLVER = os.getenv("ALS_SOLVER", "cg")
+WARM_START = os.getenv("WARM_START", "false").lower() == "true"
+WARM_START_EPOCHS = int(os.getenv("WARM_START_EPOCHS", "5"))
+WARM_START_TOL = float(os.getenv("WARM_START_TOL", "0.001"))
+PUBLISH_CHUNK_SIZE = int(os.getenv("PUBLISH_CHUNK_SIZE", "10000"))
+ACTIVATE_MODEL_VERSION = os.getenv("ACTIVATE_MODEL_VERSION")
+# Every model version is also written as one memory-mappable artifact under
+# MODEL_ARTIFACT_DIR and, unless MODEL_ARTIFACT_GCS_PREFIX is empty, uploaded
+# to the same path under that prefix in GCS_BUCKET_NAME
+MODEL_ARTIFACT_ENABLED = os.getenv("MODEL_ARTIFACT_ENABLED", "true").lower() == "true"
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "model_artifacts")
+MODEL_ARTIFACT_GCS_PREFIX = os.getenv("MODEL_ARTIFACT_GCS_PREFIX", "models")
+# Storage of published recipe vectors: vector, halfvec, halfvec_index or bit_index (see vector_formats.py)
+VECTOR_FORMAT = os.getenv("VECTOR_FORMAT", "vector")
+# HNSW build settings (unset server settings are left alone) and the build report:
+# recall@HNSW_REPORT_K against exact search for HNSW_REPORT_SAMPLE user vectors (0 skips it)
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_MAINTENANCE_WORK_MEM = os.getenv("HNSW_MAINTENANCE_WORK_MEM") or None
+HNSW_PARALLEL_WORKERS = int(os.getenv("HNSW_PARALLEL_WORKERS")) if os.getenv("HNSW_PARALLEL_WORKERS") else None
+HNSW_CONCURRENTLY = os.getenv("HNSW_CONCURRENTLY", "false").lower() == "true"
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH")) if os.getenv("HNSW_EF_SEARCH") else None
+HNSW_REPORT_SAMPLE = int(os.getenv("HNSW_REPORT_SAMPLE", "100"))
+HNSW_REPORT_K = int(os.getenv("HNSW_REPORT_K", "20"))
+# Hyperparameters (n_factors, n_epochs, lr_all, reg_all, backend) from a JSON file,
+# either written by hand or the report of tune.py, whose best trial is used
+TRAINING_CONFIG = os.getenv("TRAINING_CONFIG")
+# With VALIDATION_FRACTION > 0 a separate model is first fitted on the ratings minus a
+# deterministic holdout of that size to record validation metrics for the version
+VALIDATION_FRACTION = float(os.getenv("VALIDATION_FRACTION", "0"))
+VALIDATION_SEED = int(os.getenv("VALIDATION_SEED", "0"))
+VALIDATION_K = int(os.getenv("VALIDATION_K", "10"))
+# Every run writes a JSON report of per-stage wall/CPU time, peak RSS and rows/sec
+# next to the model artifact (and to RUN_REPORT_PATH when set); TRAINING_PROFILE
+# (comma-separated: cprofile, tracemalloc) adds captures of the PROFILE_TOP
+# hottest functions or allocation sites per stage, with .prof files in PROFILE_DIR
+TRAINING_PROFILE = [mode.strip() for mode in os.getenv("TRAINING_PROFILE", "").split(",") if mode.strip()]
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH")
+# Precompute each internal user's top RECOMMENDATIONS_TOP_N unrated recipes (0 disables);
+# users are scored RECOMMENDATIONS_BLOCK_SIZE at a time by RECOMMENDATIONS_JOBS threads, which
+# bounds peak scoring memory to about RECOMMENDATIONS_JOBS * RECOMMENDATIONS_BLOCK_SIZE * n_recipes * 16 bytes
+RECOMMENDATIONS_TOP_N = int(os.getenv("RECOMMENDATIONS_TOP_N", "0"))
+RECOMMENDATIONS_BLOCK_SIZE = int(os.getenv("RECOMMENDATIONS_BLOCK_SIZE", "1024"))
+RECOMMENDATIONS_JOBS = int(os.getenv("RECOMMENDATIONS_JOBS", "1"))
 
 
 class Train:
-    def __init__(self, n_factors=100, n_epochs=30, random_state=42):
-        self.algo = SVD(
+    def __init__(self, n_factors=VECTOR_DIMENSIONS, n_epochs=30, random_state=42, backend=TRAINING_BACKEND,
+                 n_jobs=TRAINING_JOBS, vector_format=VECTOR_FORMAT, lr_all=None, reg_all=None, profiler=None):
+        check_format(vector_format)
+        if n_factors != VECTOR_DIMENSIONS:
+            raise ValueError(f"n_factors must be {VECTOR_DIMENSIONS} to match the user_vectors schema, got {n_factors}")
+        self.profiler = profiler or RunProfiler(TRAINING_PROFILE, PROFILE_DIR, PROFILE_TOP)
+        self.n_jobs = n_jobs
+        self.vector_format = vector_format
+        factorizer_params = dict(
             n_factors=n_factors,
             n_epochs=n_epochs,
             random_state=random_state,
+            n_jobs=n_jobs,
             verbose=True,
         )
-
-        logger.info("Connecting to Google Cloud Storage...")
-        try:
-            self.storage_client = storage.Client()
-            self.bucket_name = os.getenv("GCS_BUCKET_NAME")
-            if not self.bucket_name:
-                raise ValueError(
-                    "GCS_BUCKET_NAME not found in environment variables."
-                )
-            logger.info(f"Successfully connected to GCS bucket: {self.bucket_name}")
-        except Exception as e:
-            logger.error(f"Could not connect to GCS: {e}")
-            raise
+        if lr_all is not None:
+            factorizer_params["lr_all"] = lr_all
+        if reg_all is not None:
+            factorizer_params["reg_all"] = reg_all
+        if backend == "als":
+            factorizer_params["solver"] = ALS_SOLVER
+        self.backend = backend
+        self.factorizer_params = factorizer_params
+        self.algo = make_factorizer(backend, **factorizer_params)
+        self.stats = {}
+
+        # The bucket only receives model artifacts and run reports
+        self.storage_client = None
+        self.bucket_name = None
+        if MODEL_ARTIFACT_GCS_PREFIX:
+            logger.info("Connecting to Google Cloud Storage...")
+            try:
+                self.storage_client = storage.Client()
+                self.bucket_name = os.getenv("GCS_BUCKET_NAME")
+                if not self.bucket_name:
+                    raise ValueError(
+                        "GCS_BUCKET_NAME not found in environment variables."
+                    )
+                logger.info(f"Successfully connected to GCS bucket: {self.bucket_name}")
+            except Exception as e:
+                logger.error(f"Could not connect to GCS: {e}")
+                raise
 
         self.postgres_client = self.connect_to_postgres()
+        self.model_versions = ModelVersionStore(self.postgres_client)
     
     def connect_to_postgres(self):
         logger.info("Connecting to PostgreSQL...")
@@ -62,145 +154,283 @@ class Train:
             logger.error("DATABASE_URL not found in environment variables")
             raise ValueError("DATABASE_URL not found")
 
-    def train_model(self, ratings_df):
-        logger.info("Starting SVD model training")
+    def load_previous_factors(self, encoded):
+        """Bulk-load the published factors and align them to the encoded indices by ID.
+
+        Only internal users are published, so external users and any new
+        users or recipes keep their random initialization.
+        """
+        cursor = None
+        try:
+            cursor = self.postgres_client.cursor()
+            user_ids, user_bias, user_vectors = parse_vector_rows(
+                copy_vectors_out(cursor, "SELECT user_id, bias, vector FROM user_vectors")
+            )
+            recipe_ids, recipe_bias, recipe_vectors = parse_vector_rows(
+                copy_vectors_out(cursor, "SELECT recipe_id, bias, vector FROM recipe_vectors")
+            )
+        finally:
+            if cursor:
+                cursor.close()
+
+        n_factors = self.algo.n_factors
+        if (len(user_ids) and user_vectors.shape[1] != n_factors) or (len(recipe_ids) and recipe_vectors.shape[1] != n_factors):
+            logger.warning(f"Published factors do not have {n_factors} dimensions, training from scratch")
+            return None
+
+        user_rows = pd.Index(user_ids).get_indexer(encoded.user_ids)
+        user_rows[encoded.user_is_external] = -1
+        recipe_rows = pd.Index(recipe_ids).get_indexer(encoded.recipe_ids)
+        known_users = np.flatnonzero(user_rows >= 0)
+        known_recipes = np.flatnonzero(recipe_rows >= 0)
+
+        return WarmStart(
+            user_idx=known_users,
+            pu=user_vectors[user_rows[known_users]],
+            bu=user_bias[user_rows[known_users]],
+            recipe_idx=known_recipes,
+            qi=recipe_vectors[recipe_rows[known_recipes]],
+            bi=recipe_bias[recipe_rows[known_recipes]],
+        )
+
+    def train_model(self, ratings_df, warm_start=False):
+        logger.info(f"Starting SVD model training with the {self.backend} backend")
 
         # Data validation and cleaning
         logger.info(f"Original data shape: {ratings_df.shape}")
 
-        # Remove rows with invalid user_id or recipe_id
-        valid_data = ratings_df.dropna(subset=["user_id", "recipe_id", "rating"])
-        logger.info(f"After removing nulls: {valid_data.shape}")
-
-        # Convert user_id and recipe_id to strings to avoid issues with numeric IDs
-        valid_data["user_id"] = valid_data["user_id"].astype(str)
-        valid_data["recipe_id"] = valid_data["recipe_id"].astype(str)
-
-        # Remove any empty strings or problematic IDs
-        valid_data = valid_data[
-            (valid_data["user_id"] != "")
-            & (valid_data["user_id"] != "0")
-            & (valid_data["user_id"] != "None")
-            & (valid_data["recipe_id"] != "")
-            & (valid_data["recipe_id"] != "0")
-            & (valid_data["recipe_id"] != "None")
-        ]
-        logger.info(f"After filtering invalid IDs: {valid_data.shape}")
-
-        reader = Reader(rating_scale=(1, 5))
-        data = Dataset.load_from_df(
-            valid_data[["user_id", "recipe_id", "rating"]], reader
+        # Validate IDs as integers once and dense-encode users and recipes
+        with self.profiler.stage("encode", rows=len(ratings_df)):
+            encoded = encode_ratings(ratings_df)
+        logger.info(
+            f"After filtering invalid rows: {len(encoded)} ratings, "
+            f"{encoded.n_users} users ({int(encoded.user_is_external.sum())} external), "
+            f"{encoded.n_recipes} recipes"
         )
-        trainset = data.build_full_trainset()
+
+        initial_factors = None
+        if warm_start and not self.algo.supports_warm_start:
+            logger.warning(f"The {self.backend} backend does not support warm starts, training from scratch")
+        elif warm_start:
+            logger.info("Loading previously published factors for warm start")
+            with self.profiler.stage("load_previous_factors"):
+                initial_factors = self.load_previous_factors(encoded)
+            if initial_factors is not None:
+                self.algo.n_epochs = WARM_START_EPOCHS
+                self.algo.tol = WARM_START_TOL
 
         logger.info("Training SVD algorithm...")
-        self.algo.fit(trainset)
+        start = time.perf_counter()
+        with self.profiler.stage("fit", rows=len(encoded)):
+            self.algo.fit(encoded, initial_factors)
+        training_seconds = time.perf_counter() - start
         logger.info("Model training completed successfully")
 
-        global_mean = float(trainset.global_mean)
-        user_bias = {trainset.to_raw_uid(i): float(self.algo.bu[i]) for i in range(trainset.n_users)}
-        item_bias = {trainset.to_raw_iid(i): float(self.algo.bi[i]) for i in range(trainset.n_items)}
-
-        logger.info(f"Training results - Global mean: {global_mean:.3f}, Users: {len(user_bias)}, Items: {len(item_bias)}")
-
-        return self.algo, trainset, global_mean, user_bias, item_bias
-
-    def extract_embeddings(self, algo, trainset):
+        global_mean = self.algo.global_mean
+        with self.profiler.stage("train_rmse", rows=len(encoded)):
+            train_rmse = rmse(self.algo, encoded)
+        logger.info(
+            f"Training results - Global mean: {global_mean:.3f}, Users: {encoded.n_users}, "
+            f"Items: {encoded.n_recipes}, Train RMSE: {train_rmse:.4f}"
+        )
+        self.stats = {
+            "backend": self.backend,
+            "n_factors": self.algo.n_factors,
+            "n_ratings": len(encoded),
+            "n_users": encoded.n_users,
+            "n_recipes": encoded.n_recipes,
+            "training_seconds": training_seconds,
+            "rmse": train_rmse,
+            "vector_format": self.vector_format,
+        }
+        if VALIDATION_FRACTION > 0:
+            with self.profiler.stage("validate", rows=len(encoded)):
+                self.stats["validation"] = self.validate(encoded)
+
+        return self.algo, encoded, global_mean
+
+    def validate(self, encoded):
+        """Fit the configured model on all but a deterministic holdout and return its validation metrics."""
+        train, validation = holdout_split(encoded, VALIDATION_FRACTION, VALIDATION_SEED)
+        logger.info(f"Fitting a validation model on {len(train)} ratings, holding out {len(validation)}")
+        model = make_factorizer(self.backend, **{**self.factorizer_params, "verbose": False})
+        start = time.perf_counter()
+        model.fit(train)
+        metrics = evaluate(model, train, validation, k=VALIDATION_K, seed=VALIDATION_SEED, n_jobs=self.n_jobs)
+        metrics["fit_seconds"] = time.perf_counter() - start - metrics["eval_seconds"]
+        logger.info("Validation metrics: " + ", ".join(
+            f"{name} {value:.4f}" for name, value in metrics.items() if isinstance(value, float)
+        ))
+        return metrics
+
+    def extract_embeddings(self, algo, encoded):
         logger.info("Extracting embeddings from trained model")
-        user_embeddings_raw = algo.pu
-        recipe_embeddings_raw = algo.qi
 
-        logger.debug(f"Raw embeddings - Users: {user_embeddings_raw.shape}, Recipes: {recipe_embeddings_raw.shape}")
-        logger.debug(f"Trainset size - Users: {trainset.n_users}, Items: {trainset.n_items}")
+        # Row i of pu/bu belongs to encoded.user_ids[i], row j of qi/bi to encoded.recipe_ids[j]
+        user_embeddings = np.asarray(algo.pu, dtype=np.float32)
+        recipe_embeddings = np.asarray(algo.qi, dtype=np.float32)
+        user_bias = np.asarray(algo.bu, dtype=np.float32)
+        recipe_bias = np.asarray(algo.bi, dtype=np.float32)
 
-        # Map internal surprise IDs back to application original IDs
-        user_id_map = {}
-        for inner_uid in range(trainset.n_users):
-            try:
-                original_uid = trainset.to_raw_uid(inner_uid)
-                user_id_map[inner_uid] = original_uid
-            except Exception as e:
-                logger.warning(f"Could not map inner user ID {inner_uid}: {e}")
-                continue
-
-        recipe_id_map = {}
-        for inner_iid in range(trainset.n_items):
-            try:
-                original_iid = trainset.to_raw_iid(inner_iid)
-                recipe_id_map[inner_iid] = original_iid
-            except Exception as e:
-                logger.warning(f"Could not map inner item ID {inner_iid}: {e}")
-                continue
-
-        logger.info(f"Successfully mapped {len(user_id_map)} users and {len(recipe_id_map)} recipes")
-
-        user_embeddings = {
-            user_id_map[inner_id]: user_embeddings_raw[inner_id]
-            for inner_id in user_id_map
-        }
-        recipe_embeddings = {
-            recipe_id_map[inner_id]: recipe_embeddings_raw[inner_id]
-            for inner_id in recipe_id_map
-        }
+        if len(user_embeddings) != encoded.n_users or len(recipe_embeddings) != encoded.n_recipes:
+            raise ValueError(
+                f"Model shape {user_embeddings.shape}/{recipe_embeddings.shape} does not match "
+                f"{encoded.n_users} encoded users and {encoded.n_recipes} encoded recipes"
+            )
 
-        logger.info(f"Extracted embeddings - Users: {len(user_embeddings)}, Recipes: {len(recipe_embeddings)}")
-        return user_embeddings, recipe_embeddings
+        logger.info(f"Extracted embeddings - Users: {user_embeddings.shape}, Recipes: {recipe_embeddings.shape}")
+        return user_embeddings, user_bias, recipe_embeddings, recipe_bias
 
-    def run_pipeline(self, ratings_df):
+    def run_pipeline(self, ratings_df, warm_start=WARM_START):
         logger.info("Starting training pipeline")
-        
-        algo, trainset, global_mean, user_bias, recipe_bias = self.train_model(ratings_df)
-        user_embeds, recipe_embeds = self.extract_embeddings(algo, trainset)
-
-        internal_user_embeddings = {
-            uid: embed.tolist()
-            for uid, embed in user_embeds.items()
-            if not str(uid).startswith("ext_")
-        }
-        logger.info(f"Filtered to {len(internal_user_embeddings)} internal user embeddings (excluded external users)")
+        version = None
+        try:
+            algo, encoded, global_mean = self.train_model(ratings_df, warm_start=warm_start)
+            with self.profiler.stage("extract_embeddings", rows=encoded.n_users + encoded.n_recipes):
+                user_embeds, user_bias, recipe_embeds, recipe_bias = self.extract_embeddings(algo, encoded)
 
-        logger.info("Saving artifacts to storage systems")
-        self.save_user_embeddings_to_postgres_batch(internal_user_embeddings)
+            internal = encoded.internal_users
+            user_ids = encoded.user_ids[internal]
+            logger.info(f"Filtered to {len(user_ids)} internal user embeddings (excluded external users)")
 
-        recipe_embeddings_dict = {
-            recipe_id: embed.tolist() 
-            for recipe_id, embed in recipe_embeds.items()
-        }
-        self.save_recipe_embeddings_to_postgres_batch(recipe_embeddings_dict)
+            version = self.model_versions.begin_version(global_mean, self.stats)
+            try:
+                logger.info(f"Saving artifacts of model version {version} to storage systems")
+                with self.profiler.stage("publish_users", rows=len(user_ids)):
+                    self.save_user_embeddings_to_postgres_batch(
+                        version, user_ids, user_embeds[internal], user_bias[internal],
+                    )
+
+                logger.info("Publishing recipe vectors and biases with HNSW index")
+                with self.profiler.stage("publish_recipes", rows=encoded.n_recipes):
+                    self.save_recipe_embeddings_to_postgres_batch(version, encoded.recipe_ids, recipe_embeds, recipe_bias)
+
+                if MODEL_ARTIFACT_ENABLED:
+                    with self.profiler.stage("model_artifact", rows=len(user_ids) + encoded.n_recipes):
+                        self.save_model_artifact(
+                            version, global_mean, user_ids, user_embeds[internal], user_bias[internal],
+                            encoded.recipe_ids, recipe_embeds, recipe_bias,
+                        )
+
+                if RECOMMENDATIONS_TOP_N > 0:
+                    with self.profiler.stage("recommendations", rows=len(user_ids)):
+                        top, scores = self.compute_user_recommendations(
+                            encoded, np.flatnonzero(internal), user_embeds, user_bias, recipe_embeds, recipe_bias,
+                            global_mean,
+                        )
+                    with self.profiler.stage("publish_recommendations", rows=len(user_ids)):
+                        self.save_user_recommendations_to_postgres(version, user_ids, top, scores)
+
+                with self.profiler.stage("activate"):
+                    self.model_versions.activate(version)
+            except Exception:
+                self.model_versions.mark_failed(version)
+                raise
 
-        logger.info("Saving model biases to PostgreSQL")
-        self.save_bias_terms_to_postgres(user_bias, recipe_bias, global_mean)
+            self.notify_recommender(version)
+            with self.profiler.stage("garbage_collect"):
+                expired = self.model_versions.collect_garbage()
+                if expired:
+                    self.delete_model_artifacts(expired)
+        except Exception:
+            self.save_run_report(version, "failed")
+            raise
 
-        logger.info("Creating HNSW index for recipe vectors")
-        self.create_hnsw_index()
+        self.save_run_report(version, "ok")
+        logger.info(f"Training pipeline completed successfully, model version {version} is active")
+        return version
 
-        logger.info("Training pipeline completed successfully")
+    def save_run_report(self, version, status):
+        """Write the profiler's run report next to the version's artifact (and RUN_REPORT_PATH), then upload it.
 
-    def create_hnsw_index(self):
+        Failures are only logged so a report never fails the run it describes.
+        """
+        fields = {"version": version, "status": status, "backend": self.backend, "stats": self.stats}
+        try:
+            if RUN_REPORT_PATH:
+                self.profiler.write(RUN_REPORT_PATH, **fields)
+            if version is None:
+                return
+            path = self.profiler.write(run_report_path(MODEL_ARTIFACT_DIR, version), **fields)
+            logger.info(f"Wrote run report {path}")
+            if MODEL_ARTIFACT_GCS_PREFIX:
+                blob_name = run_report_path(MODEL_ARTIFACT_GCS_PREFIX, version)
+                self.storage_client.bucket(self.bucket_name).blob(blob_name).upload_from_filename(path)
+                logger.info(f"Uploaded run report to gs://{self.bucket_name}/{blob_name}")
+        except Exception as e:
+            logger.warning(f"Could not save the run report of model version {version}: {e}")
+
+    def save_model_artifact(self, version, global_mean, user_ids, user_embeds, user_bias,
+                            recipe_ids, recipe_embeds, recipe_bias):
+        """Write the model version's artifact to local disk and upload it to the bucket."""
+        path = artifact_path(MODEL_ARTIFACT_DIR, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = time.perf_counter()
+        size = write_model_artifact(
+            path, version, global_mean, user_ids, user_embeds, user_bias, recipe_ids, recipe_embeds, recipe_bias,
+            metadata={key: value for key, value in self.stats.items() if isinstance(value, (int, float, str))},
+        )
+        logger.info(f"Wrote model artifact {path} ({size / 2**20:.1f} MB) in {time.perf_counter() - start:.2f}s")
+        self.stats["artifact_bytes"] = size
+
+        if MODEL_ARTIFACT_GCS_PREFIX:
+            blob_name = artifact_path(MODEL_ARTIFACT_GCS_PREFIX, version)
+            start = time.perf_counter()
+            self.storage_client.bucket(self.bucket_name).blob(blob_name).upload_from_filename(path)
+            logger.info(f"Uploaded model artifact to gs://{self.bucket_name}/{blob_name} "
+                        f"in {time.perf_counter() - start:.2f}s")
+        return path
+
+    def delete_model_artifacts(self, versions):
+        """Remove the artifacts and run reports of garbage-collected versions locally and from the bucket."""
+        for version in versions:
+            for file_path in (artifact_path, run_report_path):
+                try:
+                    path = file_path(MODEL_ARTIFACT_DIR, version)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    if MODEL_ARTIFACT_GCS_PREFIX:
+                        blob = self.storage_client.bucket(self.bucket_name).blob(file_path(MODEL_ARTIFACT_GCS_PREFIX, version))
+                        if blob.exists():
+                            blob.delete()
+                except Exception as e:
+                    logger.warning(f"Could not delete {os.path.basename(path)} of model version {version}: {e}")
+
+    def compute_user_recommendations(self, encoded, users, user_embeds, user_bias, recipe_embeds, recipe_bias, global_mean):
+        """Top RECOMMENDATIONS_TOP_N unrated recipe IDs and predicted ratings for the given user indices."""
+        indptr, indices = rated_csr(encoded)
+        top, scores, seconds = top_n_recommendations(
+            user_embeds, user_bias, recipe_embeds, recipe_bias, global_mean, indptr, indices, users,
+            RECOMMENDATIONS_TOP_N, block_size=RECOMMENDATIONS_BLOCK_SIZE, n_jobs=RECOMMENDATIONS_JOBS,
+        )
+        recipe_ids = np.where(top >= 0, encoded.recipe_ids[top], -1)
+
+        users_per_second = len(users) / max(seconds, 1e-9)
+        self.stats["recommendations_seconds"] = seconds
+        self.stats["recommendations_users_per_second"] = users_per_second
+        logger.info(f"Computed top {top.shape[1]} recommendations for {len(users)} users in {seconds:.2f}s "
+                    f"({users_per_second:,.0f} users/sec, blocks of {RECOMMENDATIONS_BLOCK_SIZE})")
+        return recipe_ids, scores
+
+    def save_user_recommendations_to_postgres(self, version, user_ids, recipe_ids, scores):
+        """Replace the precomputed recommendations of a model version with one streamed COPY per chunk."""
+        logger.info(f"Saving recommendations of {len(user_ids)} users for model version {version}")
         cursor = None
         try:
             cursor = self.postgres_client.cursor()
-            
-            cursor.execute("SHOW maintenance_work_mem")
-            memory_setting = cursor.fetchone()[0]
-            logger.info(f"Current maintenance_work_mem: {memory_setting}")
-
-            cursor.execute("SELECT COUNT(*) FROM recipe_vectors")
-            vector_count = cursor.fetchone()[0]
-            logger.info(f"Building HNSW index for {vector_count} recipe vectors")
-
-            cursor.execute("DROP INDEX IF EXISTS recipe_hnsw_idx")
-
-            cursor.execute("""
-                CREATE INDEX recipe_hnsw_idx ON recipe_vectors
-                USING hnsw (vector vector_cosine_ops)
-                WITH (m = 16, ef_construction = 64)
-            """)
-
+            cursor.execute("DELETE FROM user_recommendations WHERE model_version = %s", (version,))
+            start = time.perf_counter()
+            for chunk in range(0, len(user_ids), PUBLISH_CHUNK_SIZE):
+                rows = slice(chunk, chunk + PUBLISH_CHUNK_SIZE)
+                cursor.copy_expert(
+                    "COPY user_recommendations (model_version, user_id, recipe_ids, scores) FROM STDIN",
+                    encode_recommendation_rows(version, user_ids[rows], recipe_ids[rows], scores[rows]),
+                    size=1 << 20,
+                )
             self.postgres_client.commit()
-            logger.info("Successfully created HNSW index")
+            logger.info(f"Saved recommendations of {len(user_ids)} users in {time.perf_counter() - start:.2f}s")
         except Exception as e:
-            logger.error(f"Failed to create HNSW index: {e}")
+            logger.error(f"Failed to save user recommendations to PostgreSQL: {e}")
             if self.postgres_client:
                 self.postgres_client.rollback()
             raise
@@ -208,8 +438,98 @@ class Train:
             if cursor:
                 cursor.close()
 
-    def save_user_embeddings_to_postgres_batch(self, user_embeddings):
-        logger.info(f"Saving {len(user_embeddings)} user embeddings to PostgreSQL")
+    def notify_recommender(self, version):
+        """Ask the recommendation service to rebuild its index for the newly active version.
+
+        Failures are only logged: the service also picks up new versions on
+        its own, within RECOMMEND_RELOAD_CHECK_SECONDS.
+        """
+        if not RELOAD_URL:
+            return
+        headers = {}
+        try:
+            # Cloud Run expects an ID token whose audience is the service URL
+            parts = urlsplit(RELOAD_URL)
+            token = id_token.fetch_id_token(Request(), f"{parts.scheme}://{parts.netloc}")
+            headers["Authorization"] = f"Bearer {token}"
+        except Exception as e:
+            logger.warning(f"Calling {RELOAD_URL} without an ID token: {e}")
+        try:
+            response = requests.post(RELOAD_URL, headers=headers, timeout=RELOAD_TIMEOUT)
+            response.raise_for_status()
+            logger.info(f"Recommendation index reloaded for model version {version}: {response.json()}")
+        except Exception as e:
+            logger.error(f"Failed to reload the recommendation index for model version {version}: {e}")
+
+    def create_hnsw_index(self, table_name="recipe_vectors", index_name="recipe_hnsw_idx", query_table="user_vectors",
+                          settings=None, dimensions=None):
+        """Build the HNSW index of the vector format with the configured settings.
+
+        A build report is recorded in stats["hnsw"]; if only the report fails,
+        it holds the build result and the error instead.
+        """
+        settings = settings or HnswSettings(
+            m=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            maintenance_work_mem=HNSW_MAINTENANCE_WORK_MEM,
+            max_parallel_maintenance_workers=HNSW_PARALLEL_WORKERS,
+            concurrently=HNSW_CONCURRENTLY,
+        )
+        cursor = None
+        try:
+            cursor = self.postgres_client.cursor()
+            cursor.execute("SHOW maintenance_work_mem")
+            memory_setting = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            vector_count = cursor.fetchone()[0]
+            if dimensions is None:
+                cursor.execute(f"SELECT vector_dims(vector::vector) FROM {table_name} LIMIT 1")
+                row = cursor.fetchone()
+                dimensions = row[0] if row else None
+            self.postgres_client.rollback()
+        finally:
+            if cursor:
+                cursor.close()
+        logger.info(f"Building {self.vector_format} HNSW index for {vector_count} recipe vectors in {table_name} "
+                    f"(m={settings.m}, ef_construction={settings.ef_construction}, "
+                    f"maintenance_work_mem={settings.maintenance_work_mem or memory_setting}, "
+                    f"parallel workers={settings.max_parallel_maintenance_workers}, concurrently={settings.concurrently})")
+
+        try:
+            with self.profiler.stage("hnsw_build", rows=vector_count):
+                build_seconds = build_hnsw_index(
+                    self.postgres_client, table_name, index_name, settings,
+                    vector_format=self.vector_format, dimensions=dimensions,
+                )
+        except Exception as e:
+            logger.error(f"Failed to create HNSW index: {e}")
+            raise
+        logger.info(f"Successfully created HNSW index {index_name} in {build_seconds:.2f}s")
+
+        try:
+            with self.profiler.stage("hnsw_report"):
+                report = hnsw_report(
+                    self.postgres_client, table_name, index_name, query_table, settings, build_seconds,
+                    sample_size=HNSW_REPORT_SAMPLE, k=HNSW_REPORT_K, ef_search=HNSW_EF_SEARCH,
+                    vector_format=self.vector_format, dimensions=dimensions,
+                )
+        except Exception as e:
+            # The index is built; a missing report should not fail the model version
+            logger.warning(f"Built HNSW index {index_name} but could not report on it: {e}")
+            report = {"index": index_name, **settings.as_dict(), "build_seconds": round(build_seconds, 3),
+                      "report_error": str(e)}
+        self.stats["hnsw"] = report
+        logger.info(f"HNSW build report: {json.dumps(report)}")
+        return report
+
+    def save_user_embeddings_to_postgres_batch(self, version, user_ids, user_embeddings, user_bias):
+        """Load the user vectors and biases of a model version into its own table.
+
+        Rows are streamed from the factor arrays in fixed-size binary COPY
+        chunks; they are merged into user_vectors when the version is activated.
+        """
+        table = user_table(version)
+        logger.info(f"Saving {len(user_ids)} user embeddings to {table}")
         if not self.postgres_client:
             logger.error("No PostgreSQL client found")
             return
@@ -218,26 +538,16 @@ class Train:
         try:
             cursor = self.postgres_client.cursor()
 
-            insert_data = []
-            for user_id, embedding in user_embeddings.items():
-                insert_data.append((int(user_id), list(embedding)))
-
-            psycopg2.extras.execute_values(
-                cursor,
-                """
-                INSERT INTO user_vectors (user_id, vector, updated_at) 
-                VALUES %s
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    vector = EXCLUDED.vector,
-                    updated_at = NOW()
-                """,
-                insert_data,
-                template="(%s, %s, NOW())"
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (LIKE user_vectors INCLUDING DEFAULTS)")
+            chunk_stats = copy_vectors_in(
+                cursor, table, ("user_id", "bias", "vector"),
+                user_ids, user_bias, user_embeddings, chunk_size=PUBLISH_CHUNK_SIZE,
             )
+            log_copy_stats(logger, table, chunk_stats)
 
             self.postgres_client.commit()
-            logger.info(f"Successfully saved {len(user_embeddings)} user embeddings to PostgreSQL")
+            logger.info(f"Successfully saved {len(user_ids)} user embeddings to {table}")
         except Exception as e:
             logger.error(f"Failed to save user embeddings to PostgreSQL: {e}")
             if self.postgres_client:
@@ -247,8 +557,15 @@ class Train:
             if cursor:
                 cursor.close()
 
-    def save_recipe_embeddings_to_postgres_batch(self, recipe_embeddings):
-        logger.info(f"Saving {len(recipe_embeddings)} recipe embeddings to PostgreSQL")
+    def save_recipe_embeddings_to_postgres_batch(self, version, recipe_ids, recipe_embeddings, recipe_bias):
+        """Load the recipe vectors and biases of a model version into its own table.
+
+        Rows are streamed with a binary COPY into recipe_vectors_v<version>,
+        which gets its primary key and HNSW index before activation swaps it
+        in by rename.
+        """
+        table = recipe_table(version)
+        logger.info(f"Saving {len(recipe_ids)} recipe embeddings to {table}")
         if not self.postgres_client:
             logger.error("No PostgreSQL client found")
             return
@@ -257,26 +574,21 @@ class Train:
         try:
             cursor = self.postgres_client.cursor()
 
-            cursor.execute("DELETE FROM recipe_vectors")
-            logger.info("Cleared existing recipe vectors")
-
-            insert_data = []
-            for recipe_id, recipe_embedding in recipe_embeddings.items():
-                insert_data.append((int(recipe_id), list(recipe_embedding)))
-
-            psycopg2.extras.execute_values(
-                cursor,
-                """
-                INSERT INTO recipe_vectors (recipe_id, vector, updated_at)
-                VALUES %s
-                """,
-                insert_data,
-                template="(%s, %s, NOW())",
-                page_size=1000
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (LIKE recipe_vectors INCLUDING DEFAULTS)")
+            vector_type = column_type(self.vector_format)
+            n_factors = recipe_embeddings.shape[1]
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN vector TYPE {vector_type}({n_factors})")
+
+            chunk_stats = copy_vectors_in(
+                cursor, table, ("recipe_id", "bias", "vector"),
+                recipe_ids, recipe_bias, recipe_embeddings, chunk_size=PUBLISH_CHUNK_SIZE, vector_type=vector_type,
             )
+            log_copy_stats(logger, table, chunk_stats)
 
+            # Adding the key after the load is cheaper than maintaining it row by row
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (recipe_id)")
             self.postgres_client.commit()
-            logger.info(f"Successfully saved {len(recipe_embeddings)} recipe embeddings to PostgreSQL")
         except Exception as e:
             logger.error(f"Failed to save recipe embeddings to PostgreSQL: {e}")
             if self.postgres_client:
@@ -286,87 +598,89 @@ class Train:
             if cursor:
                 cursor.close()
 
-    def save_bias_terms_to_postgres(self, user_bias, recipe_bias, global_mean):
-        cursor = None
-        try:
-            cursor = self.postgres_client.cursor()
-
-            # Filter out external users
-            internal_user_bias = {
-                user_id: bias 
-                for user_id, bias in user_bias.items() 
-                if not str(user_id).startswith("ext_")
-            }
-            
-            logger.info(f"Filtered to {len(internal_user_bias)} internal user biases (excluded external users)")
-
-            # Batch update user biases
-            if internal_user_bias:
-                user_bias_data = [(float(bias), int(user_id)) for user_id, bias in internal_user_bias.items()]
-                psycopg2.extras.execute_values(
-                    cursor,
-                    "UPDATE user_vectors SET bias = data.bias FROM (VALUES %s) AS data(bias, user_id) WHERE user_vectors.user_id = data.user_id",
-                    user_bias_data,
-                    template="(%s, %s)",
-                    page_size=1000
-                )
-                logger.info(f"Updated {len(internal_user_bias)} user biases")
-
-            # Batch update recipe biases
-            recipe_bias_data = [(float(bias), int(recipe_id)) for recipe_id, bias in recipe_bias.items()]
-            psycopg2.extras.execute_values(
-                cursor,
-                "UPDATE recipe_vectors SET bias = data.bias FROM (VALUES %s) AS data(bias, recipe_id) WHERE recipe_vectors.recipe_id = data.recipe_id",
-                recipe_bias_data,
-                template="(%s, %s)",
-                page_size=1000
+        self.create_hnsw_index(
+            table, f"{table}_hnsw_idx", query_table=user_table(version), dimensions=recipe_embeddings.shape[1],
+        )
+        logger.info(f"Successfully saved {len(recipe_ids)} recipe embeddings to {table}")
+
+def load_training_config(path):
+    """Train keyword arguments from a hyperparameter file or the best trial of a tune.py report."""
+    with open(path) as f:
+        config = json.load(f)
+    params = config["best"]["params"] if "best" in config else config
+    if params.get("n_factors", VECTOR_DIMENSIONS) != VECTOR_DIMENSIONS:
+        raise ValueError(
+            f"{path} sets n_factors to {params['n_factors']}, but published models need {VECTOR_DIMENSIONS} "
+            f"factors to match the user_vectors schema"
+        )
+    allowed = ("n_factors", "n_epochs", "lr_all", "reg_all", "backend", "random_state")
+    return {name: params[name] for name in allowed if params.get(name) is not None}
+
+
+def load_ratings(profiler=None):
+    """Ratings from the snapshot, the snapshot synced from MongoDB, or MongoDB directly; None on failure."""
+    profiler = profiler or RunProfiler()
+    with profiler.stage("load_ratings") as stage:
+        ratings_df = _load_ratings(profiler)
+        stage["rows"] = len(ratings_df) if ratings_df is not None else None
+    return ratings_df
+
+
+def _load_ratings(profiler):
+    collection_names = [INTERNAL_RATINGS_COLLECTION, EXTERNAL_RATINGS_COLLECTION]
+
+    if RATINGS_SNAPSHOT_DIR and SNAPSHOT_OFFLINE:
+        logger.info(f"Loading ratings snapshot from {RATINGS_SNAPSHOT_DIR} without MongoDB")
+        ratings_df = RatingsSnapshot(RATINGS_SNAPSHOT_DIR).load_dataframe(collection_names)
+    else:
+        extractor = Extract(profiler)
+        if not extractor.client:
+            logger.error("Could not connect to MongoDB")
+            return None
+
+        if RATINGS_SNAPSHOT_DIR:
+            logger.info(f"Syncing ratings snapshot in {RATINGS_SNAPSHOT_DIR} from MongoDB")
+            ratings_df = extractor.get_snapshot_ratings_data(
+                database_name=DB_NAME,
+                collection_names=collection_names,
+                snapshot_dir=RATINGS_SNAPSHOT_DIR,
+                full_refresh=SNAPSHOT_FULL_REFRESH,
+                detect_deletions=SNAPSHOT_DETECT_DELETIONS,
             )
-            logger.info(f"Updated {len(recipe_bias)} recipe biases")
-            
-            # Insert global mean
-            cursor.execute(
-                """
-                INSERT INTO svd_metadata (id, completion_time, global_mean) 
-                VALUES (1, NOW(), %s)
-                ON CONFLICT (id) 
-                DO UPDATE SET 
-                    completion_time = EXCLUDED.completion_time,
-                    global_mean = EXCLUDED.global_mean
-                """,
-                (float(global_mean),)
+        else:
+            logger.info("Extracting ratings data from MongoDB")
+            ratings_df = extractor.get_combined_ratings_data(
+                database_name=DB_NAME,
+                internal_collection_name=INTERNAL_RATINGS_COLLECTION,
+                external_collection_name=EXTERNAL_RATINGS_COLLECTION,
             )
-            
-            self.postgres_client.commit()
-            logger.info(f"Successfully saved bias terms and global mean to PostgreSQL")
-            
-        except Exception as e:
-            logger.error(f"Failed to save bias terms: {e}")
-            if self.postgres_client:
-                self.postgres_client.rollback()
-            raise
-        finally:
-            if cursor:
-                cursor.close()
+
+    return ratings_df
+
 
 if __name__ == "__main__":
     logger.info("Starting SVD training script")
-    
-    extractor = Extract()
-    if not extractor.client:
-        logger.error("Could not connect to MongoDB. Exiting.")
-        exit(1)
 
-    logger.info("Extracting ratings data from MongoDB")
-    ratings_df = extractor.get_combined_ratings_data(
-        database_name=DB_NAME,
-        internal_collection_name=INTERNAL_RATINGS_COLLECTION,
-        external_collection_name=EXTERNAL_RATINGS_COLLECTION,
-    )
+    if ACTIVATE_MODEL_VERSION:
+        # Roll back (or forward) to a retained model version without retraining
+        trainer = Train()
+        trainer.model_versions.activate(int(ACTIVATE_MODEL_VERSION))
+        trainer.notify_recommender(int(ACTIVATE_MODEL_VERSION))
+        logger.info(f"Model version {ACTIVATE_MODEL_VERSION} is active")
+        exit(0)
 
+    profiler = RunProfiler(TRAINING_PROFILE, PROFILE_DIR, PROFILE_TOP)
+    ratings_df = load_ratings(profiler)
     if ratings_df is None:
         logger.error("Could not retrieve ratings data. Exiting.")
+        if RUN_REPORT_PATH:
+            profiler.write(RUN_REPORT_PATH, version=None, status="failed")
         exit(1)
 
-    trainer = Train()
+    training_config = {}
+    if TRAINING_CONFIG:
+        training_config = load_training_config(TRAINING_CONFIG)
+        logger.info(f"Training with hyperparameters from {TRAINING_CONFIG}: {training_config}")
+    trainer = Train(profiler=profiler, **training_config)
     trainer.run_pipeline(ratings_df)
     logger.info("SVD training script completed")
@@ -0,0 +1,180 @@
+"""Sweep training hyperparameters with deterministic cross-validation.
+
+Every combination of --epochs, --lr and --reg is one trial. The number of
+factors is not tuned: the user_vectors schema fixes it at VECTOR_DIMENSIONS
+for every published model. Trials run across a process pool whose workers
+memory-map the same encoded rating arrays, so the ratings are held in memory
+once rather than once per worker.
+Each trial is fitted on every fold (or on a single holdout with
+--validation-fraction) and scored on the held-out ratings:
+
+    python tune.py --backend sgd --epochs 20 30 --lr 0.005 0.01 \\
+        --reg 0.02 0.05 --folds 3 --workers 4 --report tuning.json
+
+Ratings are loaded the way train.py loads them (snapshot or MongoDB), or
+generated with --synthetic. The report lists every trial with its metrics and
+timings plus the best one; point TRAINING_CONFIG at it to train with the best
+hyperparameters.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from encoding import EncodedRatings, encode_ratings
+from evaluation import evaluate, fold_assignments, holdout_mask
+from factorization import BACKENDS, make_factorizer
+from vector_formats import VECTOR_DIMENSIONS
+
+ARRAYS = ("user_idx", "recipe_idx", "rating", "user_ids", "user_is_external", "recipe_ids")
+# Metrics where a lower value is better; the ranking metrics are higher-is-better
+LOWER_IS_BETTER = ("rmse", "mae")
+
+# Set in every worker by load_shared
+shared = {}
+
+
+def save_shared(encoded, folds, directory):
+    for name in ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(encoded, name))
+    np.save(os.path.join(directory, "fold.npy"), folds)
+
+
+def load_shared(directory):
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+    shared["encoded"] = EncodedRatings(**arrays)
+    shared["fold"] = np.load(os.path.join(directory, "fold.npy"), mmap_mode="r")
+
+
+def run_trial(params, backend, n_folds, seed, k, threads):
+    encoded, fold = shared["encoded"], shared["fold"]
+    factorizer_params = dict(params, random_state=seed, n_jobs=threads, verbose=False)
+    if backend == "als":
+        factorizer_params.pop("lr_all")
+
+    start = time.perf_counter()
+    folds = []
+    for held_out in range(n_folds):
+        validation = fold == held_out
+        train, test = encoded.take(~validation), encoded.take(validation)
+        model = make_factorizer(backend, **factorizer_params)
+        fit_start = time.perf_counter()
+        model.fit(train)
+        fit_seconds = time.perf_counter() - fit_start
+        metrics = evaluate(model, train, test, k=k, seed=seed, n_jobs=threads)
+        metrics["fit_seconds"] = fit_seconds
+        folds.append(metrics)
+
+    mean = {}
+    for name in folds[0]:
+        values = [metrics[name] for metrics in folds if metrics[name] is not None]
+        mean[name] = float(np.mean(values)) if values else None
+    return {
+        "params": dict(params, backend=backend),
+        "metrics": mean,
+        "folds": folds,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def load_ratings_df(args):
+    if args.synthetic:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+        from synthetic import generate_ratings
+        return generate_ratings(args.synthetic, seed=args.seed)
+
+    from train import load_ratings
+    ratings_df = load_ratings()
+    if ratings_df is None:
+        raise SystemExit("Could not retrieve ratings data")
+    return ratings_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("TRAINING_BACKEND", "surprise"))
+    parser.add_argument("--epochs", type=int, nargs="+", default=[30])
+    parser.add_argument("--lr", type=float, nargs="+", default=[0.005], help="Ignored by the als backend")
+    parser.add_argument("--reg", type=float, nargs="+", default=[0.02])
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--validation-fraction", type=float,
+                        help="Score on one deterministic holdout of this size instead of --folds folds")
+    parser.add_argument("--metric", default="rmse", help="rmse, mae, precision@k, recall@k or ndcg@k")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 1) // 2, 1))
+    parser.add_argument("--threads-per-trial", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--synthetic", type=int, help="Tune on this many synthetic ratings instead")
+    parser.add_argument("--report", default="tuning_report.json")
+    args = parser.parse_args()
+
+    metric = args.metric.replace("@k", f"@{args.k}")
+    grid = [
+        {"n_factors": VECTOR_DIMENSIONS, "n_epochs": n_epochs, "lr_all": lr, "reg_all": reg}
+        for n_epochs, lr, reg in itertools.product(args.epochs, args.lr, args.reg)
+    ]
+    if args.backend == "als":
+        # ALS has no learning rate, so trials differing only in it are the same
+        grid = list({(p["n_epochs"], p["reg_all"]): dict(p, lr_all=None) for p in grid}.values())
+
+    start = time.perf_counter()
+    encoded = encode_ratings(load_ratings_df(args))
+    if args.validation_fraction:
+        # A single "fold" 0 holding the holdout; everything else is fold 1
+        n_folds = 1
+        folds = (~holdout_mask(encoded, args.validation_fraction, args.seed)).astype(np.uint8)
+    else:
+        n_folds = args.folds
+        folds = fold_assignments(encoded, n_folds, args.seed)
+    load_seconds = time.perf_counter() - start
+    print(f"{len(encoded)} ratings, {encoded.n_users} users, {encoded.n_recipes} recipes; "
+          f"{len(grid)} trials x {n_folds} fold(s) on {args.workers} workers")
+
+    trials = []
+    with tempfile.TemporaryDirectory(prefix="tune-") as directory:
+        save_shared(encoded, folds, directory)
+        del encoded
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=load_shared,
+            initargs=(directory,),
+        ) as pool:
+            futures = [
+                pool.submit(run_trial, params, args.backend, n_folds, args.seed, args.k, args.threads_per_trial)
+                for params in grid
+            ]
+            for future in futures:
+                trial = future.result()
+                trials.append(trial)
+                print(f"{json.dumps(trial['params'])}: {metric} {trial['metrics'].get(metric)} "
+                      f"({trial['seconds']:.1f}s)")
+
+    scored = [trial for trial in trials if trial["metrics"].get(metric) is not None]
+    if not scored:
+        raise SystemExit(f"No trial produced {metric}")
+    lower = metric in LOWER_IS_BETTER
+    best = min(scored, key=lambda trial: trial["metrics"][metric] * (1 if lower else -1))
+    print(f"Best {metric} {best['metrics'][metric]:.4f}: {json.dumps(best['params'])}")
+
+    with open(args.report, "w") as f:
+        json.dump({
+            "args": vars(args),
+            "metric": metric,
+            "folds": n_folds,
+            "load_seconds": load_seconds,
+            "total_seconds": time.perf_counter() - start,
+            "trials": trials,
+            "best": best,
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""How recipe vectors are stored and indexed, per svd_metadata.vector_format.
+
+- vector: float4 column, HNSW on the column (the original layout).
+- halfvec: float2 column, HNSW on the column; half the storage and index size.
+- halfvec_index: float4 column, HNSW on vector::halfvec; candidates found
+  through the half-precision index are re-ranked at full precision.
+- bit_index: float4 column, HNSW on the binary quantization of the vector
+  (hamming distance); candidates are re-ranked at full precision.
+
+Readers cast the column to vector, which works for every format, and writers
+send vector values, which halfvec columns take through pgvector's assignment
+cast.
+"""
+
+VECTOR_FORMATS = ("vector", "halfvec", "halfvec_index", "bit_index")
+# Dimension of user_vectors.vector (VECTOR_DIMENSIONS in the web schema). User
+# tables of a version are created LIKE user_vectors and merged back into it, so
+# every published model must have exactly this many factors.
+VECTOR_DIMENSIONS = 100
+
+
+def check_format(vector_format):
+    if vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector format {vector_format!r}, expected one of {VECTOR_FORMATS}")
+
+
+def column_type(vector_format):
+    """pgvector type of the stored vector column."""
+    return "halfvec" if vector_format == "halfvec" else "vector"
+
+
+def index_target(vector_format, dimensions, metric="cosine"):
+    """(indexed expression, operator class) of the HNSW index for a format."""
+    check_format(vector_format)
+    if vector_format == "halfvec_index":
+        return f"(vector::halfvec({int(dimensions)}))", f"halfvec_{metric}_ops"
+    if vector_format == "bit_index":
+        return f"(binary_quantize(vector)::bit({int(dimensions)}))", "bit_hamming_ops"
+    return "vector", f"{column_type(vector_format)}_{metric}_ops"
+
+
+def search_query(vector_format, table, dimensions, id_column="recipe_id", rerank_factor=4):
+    """Top-k query through the format's index, with %(query)s and %(k)s parameters.
+
+    dimensions is only needed by the quantized formats. Quantized indexes fetch rerank_factor * k candidates and order those by
+    the full-precision cosine distance.
+    """
+    if vector_format == "halfvec_index":
+        candidates = f"vector::halfvec({int(dimensions)}) <=> %(query)s::halfvec({int(dimensions)})"
+    elif vector_format == "bit_index":
+        candidates = f"binary_quantize(vector)::bit({int(dimensions)}) <~> binary_quantize(%(query)s::vector)"
+    else:
+        return f"SELECT {id_column} FROM {table} ORDER BY vector <=> %(query)s::{column_type(vector_format)} LIMIT %(k)s"
+    return f"""
+        SELECT {id_column} FROM (
+            SELECT {id_column}, vector FROM {table} ORDER BY {candidates} LIMIT %(k)s * {int(rerank_factor)}
+        ) candidates
+        ORDER BY vector::vector <=> %(query)s::vector
+        LIMIT %(k)s
+    """
+
+
+def exact_query(table, id_column="recipe_id"):
+    """Top-k by full cosine distance; run with index scans disabled for ground truth."""
+    return f"SELECT {id_column} FROM {table} ORDER BY vector::vector <=> %(query)s::vector LIMIT %(k)s"
@@ -0,0 +1,93 @@
+import io
+import struct
+import time
+
+import numpy as np
+
+# COPY text rows look like "<id>\t<bias>\t[v1,v2,...]"; turning every
+# separator into a comma lets NumPy parse a whole table in one call
+_COPY_TEXT_TO_CSV = str.maketrans({"[": None, "]": None, "\t": ",", "\n": ","})
+
+
+def copy_vectors_out(cursor, query):
+    """Run COPY (query) TO STDOUT for (id, bias, vector) rows and return the text."""
+    buffer = io.StringIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT", buffer)
+    return buffer.getvalue()
+
+
+def parse_vector_rows(text):
+    """Parse COPY text of (id, bias, vector) rows into (ids, biases, vectors) arrays."""
+    if not text:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty((0, 0), dtype=np.float32)
+
+    first_row = text[:text.index("\n")] if "\n" in text else text
+    n_columns = first_row.count(",") + 3
+    values = np.fromstring(text.translate(_COPY_TEXT_TO_CSV).rstrip(","), dtype=np.float64, sep=",")
+    rows = values.reshape(-1, n_columns)
+    return rows[:, 0].astype(np.int64), rows[:, 1].astype(np.float32), rows[:, 2:].astype(np.float32)
+
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+
+# Element type of each pgvector column type in its binary format
+VECTOR_ELEMENT_TYPES = {"vector": ">f4", "halfvec": ">f2"}
+
+
+def vector_row_dtype(n_factors, vector_type="vector"):
+    """Big-endian layout of one binary COPY tuple of (integer id, real bias, vector or halfvec)."""
+    return np.dtype([
+        ("n_fields", ">i2"),
+        ("id_length", ">i4"), ("id", ">i4"),
+        ("bias_length", ">i4"), ("bias", ">f4"),
+        # pgvector's binary format: int16 dimensions, int16 unused, float4 (halfvec: float2) values
+        ("vector_length", ">i4"), ("dimensions", ">i2"), ("unused", ">i2"),
+        ("vector", VECTOR_ELEMENT_TYPES[vector_type], (n_factors,)),
+    ])
+
+
+def encode_vector_rows(ids, biases, vectors, vector_type="vector"):
+    """Encode (id, bias, vector) rows as binary COPY tuples without per-row Python work."""
+    n_factors = vectors.shape[1]
+    rows = np.empty(len(ids), dtype=vector_row_dtype(n_factors, vector_type))
+    rows["n_fields"] = 3
+    rows["id_length"] = 4
+    rows["id"] = ids
+    rows["bias_length"] = 4
+    rows["bias"] = biases
+    rows["vector_length"] = 4 + rows.dtype["vector"].base.itemsize * n_factors
+    rows["dimensions"] = n_factors
+    rows["unused"] = 0
+    rows["vector"] = vectors
+    return rows.tobytes()
+
+
+def copy_vectors_in(cursor, table, columns, ids, biases, vectors, chunk_size=10000, vector_type="vector"):
+    """Stream (id, bias, vector) rows into table with one binary COPY per fixed-size chunk.
+
+    Returns a list of (rows, seconds) per chunk so callers can report throughput.
+    """
+    chunk_stats = []
+    for start in range(0, len(ids), chunk_size):
+        end = start + chunk_size
+        chunk_start = time.perf_counter()
+        payload = PGCOPY_HEADER + encode_vector_rows(ids[start:end], biases[start:end], vectors[start:end], vector_type) + PGCOPY_TRAILER
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+            io.BytesIO(payload),
+            size=1 << 20,
+        )
+        chunk_stats.append((min(end, len(ids)) - start, time.perf_counter() - chunk_start))
+    return chunk_stats
+
+
+def log_copy_stats(logger, label, chunk_stats):
+    rows = sum(count for count, _ in chunk_stats)
+    seconds = sum(elapsed for _, elapsed in chunk_stats)
+    for index, (count, elapsed) in enumerate(chunk_stats):
+        logger.debug(f"{label} chunk {index + 1}/{len(chunk_stats)}: {count} rows in {elapsed:.3f}s")
+    slowest = max((elapsed for _, elapsed in chunk_stats), default=0.0)
+    logger.info(f"{label}: copied {rows} rows in {len(chunk_stats)} chunks, {seconds:.2f}s "
+                f"({rows / max(seconds, 1e-9):,.0f} rows/sec, slowest chunk {slowest:.3f}s)")
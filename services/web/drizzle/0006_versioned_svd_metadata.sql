@@ -0,0 +1,16 @@
+ALTER TABLE "svd_metadata" ADD COLUMN "status" text DEFAULT 'building' NOT NULL;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "is_active" boolean DEFAULT false NOT NULL;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "backend" text;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "n_factors" integer;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "n_ratings" integer;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "n_users" integer;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "n_recipes" integer;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "training_seconds" real;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "rmse" real;--> statement-breakpoint
+ALTER TABLE "svd_metadata" ADD COLUMN "activated_at" timestamp with time zone;--> statement-breakpoint
+-- The model currently in recipe_vectors/user_vectors becomes the first active version
+UPDATE "svd_metadata" SET "status" = 'active', "is_active" = true, "activated_at" = "completion_time"
+WHERE "id" = (SELECT "id" FROM "svd_metadata" ORDER BY "completion_time" DESC LIMIT 1);--> statement-breakpoint
+-- Rows used to be written with an explicit id of 1, so move the serial sequence past them
+SELECT setval(pg_get_serial_sequence('svd_metadata', 'id'), COALESCE((SELECT MAX("id") FROM "svd_metadata"), 0) + 1, false);--> statement-breakpoint
+CREATE UNIQUE INDEX "svd_metadata_active_idx" ON "svd_metadata" USING btree ("is_active") WHERE "svd_metadata"."is_active";
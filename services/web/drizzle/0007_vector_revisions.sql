@@ -0,0 +1,2 @@
+ALTER TABLE "recipe_vectors" ADD COLUMN "revision" bigint DEFAULT 0 NOT NULL;--> statement-breakpoint
+ALTER TABLE "user_vectors" ADD COLUMN "revision" bigint DEFAULT 0 NOT NULL;
@@ -0,0 +1,9 @@
+CREATE TABLE "user_recommendations" (
+	"model_version" integer NOT NULL,
+	"user_id" integer NOT NULL,
+	"recipe_ids" integer[] NOT NULL,
+	"scores" real[] NOT NULL,
+	CONSTRAINT "user_recommendations_model_version_user_id_pk" PRIMARY KEY("model_version","user_id")
+);
+--> statement-breakpoint
+ALTER TABLE "user_recommendations" ADD CONSTRAINT "user_recommendations_model_version_svd_metadata_id_fk" FOREIGN KEY ("model_version") REFERENCES "public"."svd_metadata"("id") ON DELETE cascade ON UPDATE no action;
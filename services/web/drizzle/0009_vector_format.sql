@@ -0,0 +1 @@
+ALTER TABLE "svd_metadata" ADD COLUMN "vector_format" text DEFAULT 'vector' NOT NULL;
@@ -1,6 +1,19 @@
-import { pgTable, serial, text, timestamp, integer, real, vector } from 'drizzle-orm/pg-core';
+import { sql } from 'drizzle-orm';
+import {
+	pgTable,
+	serial,
+	text,
+	timestamp,
+	integer,
+	real,
+	vector,
+	boolean,
+	uniqueIndex,
+	bigint,
+	primaryKey
+} from 'drizzle-orm/pg-core';
 
-const VECTOR_DIMENSIONS = 100;
+export const VECTOR_DIMENSIONS = 100;
 
 export const users = pgTable('users', {
 	id: serial('id').primaryKey(),
@@ -14,20 +27,59 @@ export const user_vectors = pgTable('user_vectors', {
 	vector: vector('vector', { dimensions: VECTOR_DIMENSIONS }).notNull(),
 	bias: real('bias').default(0.0).notNull(),
 	updated_at: timestamp('updated_at', { withTimezone: true }).notNull().defaultNow(),
+	// Bumped on every online update; recompute writes compare-and-swap on it
+	revision: bigint('revision', { mode: 'number' }).default(0).notNull()
 });
 
-export const svd_metadata = pgTable('svd_metadata', {
-	id: serial('id').primaryKey(),
-	completion_time: timestamp('completion_time', { withTimezone: true }).notNull(),
-	global_mean: real('global_mean').notNull(),
-	created_at: timestamp('created_at', { withTimezone: true }).notNull().defaultNow()
-});
+// One row per trained model version; exactly one row is active at a time
+export const svd_metadata = pgTable(
+	'svd_metadata',
+	{
+		id: serial('id').primaryKey(),
+		completion_time: timestamp('completion_time', { withTimezone: true }).notNull(),
+		global_mean: real('global_mean').notNull(),
+		created_at: timestamp('created_at', { withTimezone: true }).notNull().defaultNow(),
+		status: text('status').default('building').notNull(),
+		is_active: boolean('is_active').default(false).notNull(),
+		backend: text('backend'),
+		n_factors: integer('n_factors'),
+		n_ratings: integer('n_ratings'),
+		n_users: integer('n_users'),
+		n_recipes: integer('n_recipes'),
+		training_seconds: real('training_seconds'),
+		rmse: real('rmse'),
+		activated_at: timestamp('activated_at', { withTimezone: true }),
+		// How recipe_vectors stores and indexes vectors: vector, halfvec, halfvec_index or bit_index
+		vector_format: text('vector_format').default('vector').notNull()
+	},
+	(table) => [
+		uniqueIndex('svd_metadata_active_idx')
+			.on(table.is_active)
+			.where(sql`${table.is_active}`)
+	]
+);
 
 export const recipe_vectors = pgTable('recipe_vectors', {
 	recipe_id: integer('recipe_id').primaryKey(),
 	vector: vector('vector', { dimensions: VECTOR_DIMENSIONS }).notNull(),
 	bias: real('bias').default(0.0).notNull(),
 	updated_at: timestamp('updated_at', { withTimezone: true }).notNull().defaultNow(),
+	// Bumped on every online update; recompute writes compare-and-swap on it
+	revision: bigint('revision', { mode: 'number' }).default(0).notNull()
 });
 
-export const schema = { users, user_vectors, svd_metadata, recipe_vectors };
\ No newline at end of file
+// Top recipes per internal user, precomputed by training for each model version
+export const user_recommendations = pgTable(
+	'user_recommendations',
+	{
+		model_version: integer('model_version')
+			.notNull()
+			.references(() => svd_metadata.id, { onDelete: 'cascade' }),
+		user_id: integer('user_id').notNull(),
+		recipe_ids: integer('recipe_ids').array().notNull(),
+		scores: real('scores').array().notNull()
+	},
+	(table) => [primaryKey({ columns: [table.model_version, table.user_id] })]
+);
+
+export const schema = { users, user_vectors, svd_metadata, recipe_vectors, user_recommendations };
\ No newline at end of file
@@ -66,7 +66,8 @@ export class RatingRepository {
 		try {
 			const result = await collection.updateOne(
 				{ recipe_id: String(recipeId), user_id: String(userId) },
-				{ $set: { rating: Number(rating) } },
+				// updated_at lets the training snapshot pick up changed ratings incrementally
+				{ $set: { rating: Number(rating), updated_at: new Date() } },
 				{ upsert: true }
 			);
 
@@ -7,9 +7,19 @@ import type {
 } from '../models/Recipe.js';
 import { ApiError } from '$utils/errors/AppError.js';
 import { postgres } from '../connections/index.js';
-import { sql } from 'drizzle-orm';
+import { VECTOR_DIMENSIONS } from '../database/schema.ts';
+import { sql, type SQL } from 'drizzle-orm';
 import { PubSubService } from './PubSubService.ts';
 
+interface RecommendResponse {
+	model_version: number;
+	recommendations: { recipe_id: number; predicted_rating: number }[];
+}
+
+// Quantized indexes return this many times more candidates for full-precision re-ranking
+const RERANK_FACTOR = 4;
+const RECOMMEND_TIMEOUT_MS = Number(process.env.RECOMMEND_TIMEOUT_MS ?? 2000);
+
 export class RecipeService {
 	constructor(
 		private recipeRepo = new RecipeRepository(),
@@ -100,7 +110,88 @@ export class RecipeService {
 		return recipes;
 	}
 
+	/**
+	 * Get recommended recipes: the list precomputed by training for the active
+	 * model if there is one, else from the recommendation service when
+	 * RECOMMEND_URL is set, else (or when the service fails) from the pgvector index
+	 */
 	async getRecommendationsForUser(userId: number, limit: number = 20): Promise<TransformedRecipe[]> {
+		const recipeIds =
+			(await this.getPrecomputedRecipeIds(userId, limit)) ??
+			(await this.fetchRecommendedRecipeIds(userId, limit)) ??
+			(await this.queryRecommendedRecipeIds(userId, limit));
+
+		return this.getRecipesByIdsWithUserRatings(recipeIds, userId);
+	}
+
+	private async getPrecomputedRecipeIds(userId: number, limit: number): Promise<number[] | null> {
+		const result = await postgres.execute(sql`
+			SELECT ur.recipe_ids[1:${limit}::int] AS recipe_ids
+			FROM user_recommendations ur
+			JOIN svd_metadata sm ON sm.id = ur.model_version AND sm.is_active
+			WHERE ur.user_id = ${userId}
+		`);
+		// Lists are only precomputed for users with ratings and when enabled in training
+		if (result.rows.length === 0) return null;
+		return result.rows[0].recipe_ids as number[];
+	}
+
+	private async fetchRecommendedRecipeIds(userId: number, limit: number): Promise<number[] | null> {
+		const recommendUrl = process.env.RECOMMEND_URL;
+		if (!recommendUrl) return null;
+
+		try {
+			const url = new URL(recommendUrl);
+			url.searchParams.set('user_id', String(userId));
+			url.searchParams.set('k', String(limit));
+			const response = await fetch(url, { signal: AbortSignal.timeout(RECOMMEND_TIMEOUT_MS) });
+			if (response.status === 404) return [];
+			if (!response.ok) {
+				throw new Error(`${response.status} ${response.statusText}`);
+			}
+			const body = (await response.json()) as RecommendResponse;
+			return body.recommendations.map((recommendation) => recommendation.recipe_id);
+		} catch (error) {
+			console.error('Recommendation service failed, falling back to pgvector:', error);
+			return null;
+		}
+	}
+
+	/**
+	 * Candidate ordering that uses the HNSW index of the active vector format
+	 * (see svd-training/vector_formats.py), and how many candidates to re-rank
+	 */
+	private async candidateOrdering(limit: number): Promise<{ ordering: SQL; candidates: number }> {
+		const result = await postgres.execute(
+			sql`SELECT vector_format, n_factors FROM svd_metadata WHERE is_active`
+		);
+		const format = (result.rows[0]?.vector_format as string | undefined) ?? 'vector';
+		const dimensions = Number(result.rows[0]?.n_factors ?? VECTOR_DIMENSIONS);
+
+		switch (format) {
+			case 'halfvec':
+				return { ordering: sql`rv.vector <=> ud.vector::halfvec`, candidates: limit };
+			case 'halfvec_index':
+				return {
+					ordering: sql.raw(
+						`rv.vector::halfvec(${dimensions}) <=> ud.vector::halfvec(${dimensions})`
+					),
+					candidates: limit * RERANK_FACTOR
+				};
+			case 'bit_index':
+				return {
+					ordering: sql.raw(
+						`binary_quantize(rv.vector)::bit(${dimensions}) <~> binary_quantize(ud.vector)`
+					),
+					candidates: limit * RERANK_FACTOR
+				};
+			default:
+				return { ordering: sql`rv.vector <=> ud.vector`, candidates: limit };
+		}
+	}
+
+	private async queryRecommendedRecipeIds(userId: number, limit: number): Promise<number[]> {
+		const { ordering, candidates } = await this.candidateOrdering(limit);
 		const query = sql`
 			WITH user_data AS (
 				SELECT vector, bias FROM user_vectors WHERE user_id = ${userId}
@@ -108,30 +199,28 @@ export class RecipeService {
 			recipe_similarities AS (
 				SELECT
 					rv.recipe_id,
-					rv.vector <=> ud.vector AS distance,
+					rv.vector::vector <=> ud.vector AS distance,
 					rv.bias,
 					ud.bias as user_bias,
 					sm.global_mean
 				FROM recipe_vectors rv
 				CROSS JOIN user_data ud
 				CROSS JOIN (
-					SELECT global_mean FROM svd_metadata 
-					ORDER BY completion_time DESC LIMIT 1
+					SELECT global_mean FROM svd_metadata WHERE is_active
 				) sm
-				ORDER BY rv.vector <=> ud.vector
-				LIMIT ${limit}
+				ORDER BY ${ordering}
+				LIMIT ${candidates}
 			)
 			SELECT 
 				rs.recipe_id,
 				rs.global_mean + rs.user_bias + rs.bias + (1 - rs.distance) as predicted_rating
 			FROM recipe_similarities rs
 			ORDER BY predicted_rating DESC
+			LIMIT ${limit}
 		`;
 	
 		const result = await postgres.execute(query);
-		const recipeIds = result.rows.map((row) => row.recipe_id as number);
-	
-		return this.getRecipesByIdsWithUserRatings(recipeIds, userId);
+		return result.rows.map((row) => row.recipe_id as number);
 	}
 
 	/**